@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import pandas as pd
+
+import metrics
+
+# Concurrent downloader for the Binance funding, spot-kline and mark-kline
+# series that get_data.py fetches one page at a time.
+# The [start, end] range is split into windows that each fit in one page;
+# all windows of all three endpoints are requested concurrently through one
+# pooled aiohttp session. Every host has a token bucket sized to its request
+# weight limit and re-synced from the X-MBX-USED-WEIGHT-1M response header,
+# and failed requests are retried with exponential backoff.
+#
+# The base URLs can be overridden (base_urls=...) to point the fetcher at a
+# local stub server.
+
+START_STR = "2023-01-01 00:00:00"
+END_STR   = "2023-11-28 23:59:59"
+LIMIT = 1000
+
+FUND_URL     = "https://dapi.binance.com/dapi/v1/fundingRate"
+MARKKL_URL   = "https://dapi.binance.com/dapi/v1/markPriceKlines"
+SPOT_URL     = "https://api.binance.com/api/v3/klines"
+SYMBOL_PERP  = "BTCUSD_PERP"
+SYMBOL_SPOT  = "BTCUSDT"
+KLINE_INTERVAL = "1h"
+
+# Request weight per call (limit=1000) and weight limit per minute per host
+ENDPOINT_WEIGHT = {"funding": 1, "spot": 2, "mark": 5}
+HOST_WEIGHT_LIMIT = {"dapi": 2400, "api": 6000}
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+FUNDING_INTERVAL_MS = 8 * 60 * 60 * 1000
+INTERVAL_MS = {
+    "1s": 1000, "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000,
+    "30m": 1_800_000, "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000,
+    "6h": 21_600_000, "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000,
+}
+
+MAX_RETRIES = 8
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """Token bucket over one host's request-weight budget (weight per minute)."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, weight):
+        # Waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+    def sync_used_weight(self, used):
+        """The server's count of used weight wins over our local estimate."""
+        self._refill()
+        self.tokens = min(self.tokens, self.capacity - float(used))
+
+    def drain(self, seconds):
+        """Empties the bucket for at least `seconds` (used on 429/418 responses)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def split_windows(start_ms, end_ms, step_ms, limit=LIMIT):
+    """Splits [start_ms, end_ms] into inclusive windows of at most `limit` records."""
+    span = step_ms * limit
+    windows = []
+    s = start_ms
+    while s <= end_ms:
+        e = min(s + span - 1, end_ms)
+        windows.append((s, e))
+        s = e + 1
+    return windows
+
+
+class AsyncBinanceFetcher:
+    def __init__(self, base_urls=None, concurrency=16, max_retries=MAX_RETRIES, weight_limits=None):
+        urls = {"funding": FUND_URL, "spot": SPOT_URL, "mark": MARKKL_URL}
+        urls.update(base_urls or {})
+        self.urls = urls
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        limits = {**HOST_WEIGHT_LIMIT, **(weight_limits or {})}
+        self.buckets = {
+            "funding": TokenBucket(limits["dapi"]),
+            "spot": TokenBucket(limits["api"]),
+        }
+        # funding and mark share the dapi weight budget
+        self.buckets["mark"] = self.buckets["funding"]
+        self.stats = {"requests": 0, "retries": 0, "rows": 0}
+        self._session = None
+        self._sem = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        self._sem = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _get(self, endpoint, params):
+        """GET with rate limiting and exponential backoff; returns the decoded JSON."""
+        import aiohttp
+
+        bucket = self.buckets[endpoint]
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire(ENDPOINT_WEIGHT[endpoint])
+            try:
+                async with self._sem:
+                    self.stats["requests"] += 1
+                    metrics.count("http.requests")
+                    async with metrics.stage(f"http.{endpoint}"), \
+                            self._session.get(self.urls[endpoint], params=params) as resp:
+                        used = resp.headers.get(USED_WEIGHT_HEADER)
+                        if used is not None:
+                            bucket.sync_used_weight(used)
+                        if resp.status in (418, 429):
+                            retry_after = float(resp.headers.get("Retry-After", BACKOFF_BASE * 2 ** attempt))
+                            bucket.drain(retry_after)
+                            raise aiohttp.ClientResponseError(
+                                resp.request_info, resp.history, status=resp.status, message="rate limited")
+                        resp.raise_for_status()
+                        body = await resp.read()
+                        metrics.count("http.bytes", len(body))
+                        return json.loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", None)
+                if status is not None and 400 <= status < 500 and status not in (418, 429):
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                metrics.count("http.retries")
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+                print(f"HTTP Request failed ({e}); retrying {endpoint} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _fetch_window(self, endpoint, params, start_ms, end_ms, step_ms, time_key):
+        """All records of one window; pages further only if the window overflows one page."""
+        rows = []
+        cur = start_ms
+        while cur <= end_ms:
+            page = await self._get(endpoint, {**params, "startTime": cur, "endTime": end_ms, "limit": LIMIT})
+            if not page:
+                break
+            rows.extend(page)
+            if len(page) < LIMIT or page[-1][time_key] + step_ms > end_ms:
+                break
+            cur = page[-1][time_key] + 1
+        return [r for r in rows if start_ms <= r[time_key] <= end_ms]
+
+    async def _fetch_series(self, endpoint, params, start_ms, end_ms, step_ms, time_key):
+        windows = split_windows(start_ms, end_ms, step_ms)
+        parts = await asyncio.gather(
+            *(self._fetch_window(endpoint, params, s, e, step_ms, time_key) for s, e in windows))
+        rows = [r for part in parts for r in part]
+        self.stats["rows"] += len(rows)
+        return rows
+
+    async def fetch_all(self, start_ms, end_ms, symbol_perp=SYMBOL_PERP, symbol_spot=SYMBOL_SPOT,
+                        interval=KLINE_INTERVAL):
+        """Fetches funding, spot and mark series concurrently; returns three DataFrames."""
+        step = INTERVAL_MS[interval]
+        fund, spot, mark = await asyncio.gather(
+            self._fetch_series("funding", {"symbol": symbol_perp}, start_ms, end_ms,
+                               FUNDING_INTERVAL_MS, "fundingTime"),
+            self._fetch_series("spot", {"symbol": symbol_spot, "interval": interval}, start_ms, end_ms,
+                               step, 0),
+            self._fetch_series("mark", {"symbol": symbol_perp, "interval": interval}, start_ms, end_ms,
+                               step, 0),
+        )
+        return funding_frame(fund), kline_frame(spot, "spotPrice"), kline_frame(mark, "markPrice")
+
+
+def funding_frame(rows):
+    """Funding rows as get_data.py shapes them: fundingTime, symbol, fundingRate."""
+    if not rows:
+        return pd.DataFrame(columns=["fundingTime", "symbol", "fundingRate"])
+    df = pd.DataFrame(rows).drop_duplicates("fundingTime").sort_values("fundingTime")
+    df["fundingTime"] = pd.to_datetime(df["fundingTime"], unit="ms")
+    return df[["fundingTime", "symbol", "fundingRate"]].reset_index(drop=True)
+
+
+def kline_frame(rows, column):
+    """Open time [0] and Close Price [4] of each kline, indexed by open time."""
+    if not rows:
+        return pd.DataFrame(columns=[column])
+    df = pd.DataFrame([(r[0], r[4]) for r in rows], columns=["Open time", column])
+    df = df.drop_duplicates("Open time")
+    df["Time"] = pd.to_datetime(df["Open time"], unit="ms")
+    return df.set_index("Time")[[column]].astype(float).sort_index()
+
+
+def merge_frames(df_fund, df_spot, mark_df):
+    """Backward as-of join of spot and mark onto the funding timestamps (same as get_data.py)."""
+    if df_fund.empty:
+        return pd.DataFrame(columns=["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"])
+    with metrics.stage("merge_asof", rows=len(df_fund)):
+        merged = df_fund.set_index("fundingTime").sort_index()
+        merged = pd.merge_asof(merged, df_spot.sort_index(), left_index=True, right_index=True, direction="backward")
+        merged = pd.merge_asof(merged, mark_df.sort_index(), left_index=True, right_index=True, direction="backward")
+    merged = merged.reset_index()
+    return merged[["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"]]
+
+
+async def fetch_merged(start_ms, end_ms, interval=KLINE_INTERVAL, base_urls=None, concurrency=16, **symbols):
+    """Downloads all three series concurrently and returns the merged frame and request stats."""
+    async with AsyncBinanceFetcher(base_urls=base_urls, concurrency=concurrency) as fetcher:
+        df_fund, df_spot, mark_df = await fetcher.fetch_all(start_ms, end_ms, interval=interval, **symbols)
+    return merge_frames(df_fund, df_spot, mark_df), fetcher.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent Binance funding/spot/mark downloader.")
+    parser.add_argument("--start", default=START_STR)
+    parser.add_argument("--end", default=END_STR)
+    parser.add_argument("--interval", default=KLINE_INTERVAL, choices=sorted(INTERVAL_MS))
+    parser.add_argument("--symbol-perp", default=SYMBOL_PERP)
+    parser.add_argument("--symbol-spot", default=SYMBOL_SPOT)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", default="coinm_full_data_corrected.csv")
+    args = parser.parse_args(argv)
+
+    start_ms = int(pd.Timestamp(args.start).timestamp() * 1000)
+    end_ms = int(pd.Timestamp(args.end).timestamp() * 1000)
+    t0 = time.monotonic()
+    merged, stats = asyncio.run(fetch_merged(
+        start_ms, end_ms, interval=args.interval, concurrency=args.concurrency,
+        symbol_perp=args.symbol_perp, symbol_spot=args.symbol_spot))
+    print(f"Fetched {stats['rows']} records in {stats['requests']} requests "
+          f"({stats['retries']} retries) in {time.monotonic() - t0:.1f}s")
+    print(merged.isnull().sum())
+    merged.to_csv(args.output, index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    print(f"\n✅ Saved {len(merged)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
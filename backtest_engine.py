@@ -0,0 +1,516 @@
+import numpy as np
+
+import metrics
+
+# Shared backtest engine for the simulation scripts.
+# Every strategy takes the fundingRate / spotPrice / markPrice columns as
+# float64 NumPy arrays (already sorted by fundingTime). Entry/exit signals are
+# computed in whole-array passes and the path-dependent part (position state,
+# cash compounding) runs in a single pass over plain Python floats, which is
+# what the old iterrows() loops did but without boxing every row in a Series.
+#
+# simulate_gemini and simulate_basis_hold hand that pass to the Numba kernels
+# in kernels.py when Numba is installed (bit-identical results). jit=None does
+# so only from JIT_MIN_ROWS rows, where it beats importing Numba; sweeps and
+# Monte Carlo pass jit=True; jit=False always runs the Python loop.
+
+# Position codes returned in the "position" arrays
+FLAT = 0
+LONG_SPOT_SHORT_PERP = 1
+SHORT_SPOT_LONG_PERP = -1
+
+# Action codes for the basis / gemini strategies
+ACTION_NONE = 0
+ACTION_OPEN = 1
+ACTION_CLOSE = 2
+ACTION_TRADE_SPOT_GT_MARK = 1
+ACTION_TRADE_MARK_GT_SPOT = 2
+
+JIT_MIN_ROWS = 100_000
+
+# One row per open / close in simulate_gemini's "trades" table. funding_btc is
+# the BTC funding accrued over the position, cost the fees of that event
+# (entry fees on open, entry + exit fees on close).
+TRADE_DTYPE = np.dtype([
+    ("index", np.int64),
+    ("action", np.int8),
+    ("size", np.float64),
+    ("spot", np.float64),
+    ("mark", np.float64),
+    ("entry_spot", np.float64),
+    ("entry_mark", np.float64),
+    ("funding_btc", np.float64),
+    ("basis_move", np.float64),
+    ("cost", np.float64),
+])
+
+
+def load_arrays(df, fill_spot=True):
+    """Returns the columns the engine needs as contiguous float64 arrays."""
+    rate = df["fundingRate"].to_numpy(dtype=np.float64)
+    mark = df["markPrice"].to_numpy(dtype=np.float64)
+    spot = df["spotPrice"].to_numpy(dtype=np.float64)
+    if fill_spot:
+        # Same fallback the scripts use: spotPrice.fillna(markPrice)
+        spot = np.where(np.isnan(spot), mark, spot)
+    return {
+        "fundingTime": df["fundingTime"].to_numpy(),
+        "fundingRate": np.ascontiguousarray(rate),
+        "spotPrice": np.ascontiguousarray(spot),
+        "markPrice": np.ascontiguousarray(mark),
+    }
+
+
+def _kernels(jit, n):
+    """kernels module if the compiled loop should run, else None."""
+    if jit is False or (jit is None and n < JIT_MIN_ROWS):
+        return None
+    import kernels
+
+    return kernels if kernels.ENABLED else None
+
+
+def _masked(signal, entry_mask):
+    return signal if entry_mask is None else signal & np.asarray(entry_mask, dtype=bool)
+
+
+def max_drawdown(equity):
+    """Largest peak-to-trough drop of an equity curve, as a positive fraction."""
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = 1 - equity / peak
+    return float(np.nanmax(dd)) if np.any(~np.isnan(dd)) else 0.0
+
+
+def annualized_return(end_value, start_value, days):
+    """APY the same way simulation_v0.py prints it."""
+    if days <= 0 or start_value <= 0 or end_value <= 0:
+        return float("nan")
+    return (end_value / start_value) ** (365 / days) - 1
+
+
+@metrics.timed("simulate.v0")
+def simulate_v0(rate, spot, mark, initial_cash=1000.0, entry_mask=None):
+    """simulation_v0.py: long spot / short perp while funding > 0.
+
+    entry_mask, if given, is ANDed into the entry signal (see simulate_gemini).
+    """
+    n = len(rate)
+    opens = _masked(rate > 0, entry_mask).tolist()
+    closes = (rate <= 0).tolist()
+    rate_l = rate.tolist()
+    basis_l = (spot - mark).tolist()
+    mark_l = mark.tolist()
+
+    cash_out = np.empty(n)
+    pnl_out = np.empty(n)
+    pos_out = np.zeros(n, dtype=np.int8)
+
+    cash = initial_cash
+    in_pos = False
+    entry_basis = size = 0.0
+    for i in range(n):
+        pnl = 0.0
+        if opens[i] and not in_pos:
+            in_pos = True
+            entry_basis = basis_l[i]
+            size = cash / mark_l[i]
+        if in_pos:
+            pnl += cash * rate_l[i]
+        if closes[i] and in_pos:
+            pnl += size * (basis_l[i] - entry_basis)
+            in_pos = False
+        cash += pnl
+        cash_out[i] = cash
+        pnl_out[i] = pnl
+        if in_pos:
+            pos_out[i] = LONG_SPOT_SHORT_PERP
+    return {"cash": cash_out, "pnl": pnl_out, "position": pos_out}
+
+
+@metrics.timed("simulate.v0_costs")
+def simulate_v0_costs(rate, spot, mark, initial_cash=1000.0, cost_rate=0.0015, entry_mask=None):
+    """simulation_v0_con_costos.py: funding accrued on the previous rate, flat costs per leg.
+
+    entry_mask, if given, is ANDed into the entry signal (see simulate_gemini).
+    """
+    n = len(rate)
+    opens = _masked(rate > 0, entry_mask).tolist()
+    closes = (rate <= 0).tolist()
+    rate_l = rate.tolist()
+    basis_l = (spot - mark).tolist()
+    mark_l = mark.tolist()
+
+    cash_out = np.empty(n)
+    pnl_out = np.empty(n)
+    pos_out = np.zeros(n, dtype=np.int8)
+
+    cash = initial_cash
+    in_pos = False
+    entry_basis = size = 0.0
+    prev_rate = None
+    for i in range(n):
+        pnl = 0.0
+        if in_pos:
+            if prev_rate is not None:
+                funding_gain = cash * prev_rate
+                pnl += funding_gain - funding_gain * cost_rate
+            if closes[i]:
+                basis_gain = size * (basis_l[i] - entry_basis)
+                closing_cost = size * mark_l[i] * cost_rate
+                pnl += basis_gain - closing_cost
+                in_pos = False
+        if opens[i] and not in_pos:
+            cash -= cash * cost_rate
+            in_pos = True
+            entry_basis = basis_l[i]
+            size = cash / mark_l[i]
+        cash += pnl
+        cash_out[i] = cash
+        pnl_out[i] = pnl
+        if in_pos:
+            pos_out[i] = LONG_SPOT_SHORT_PERP
+        prev_rate = rate_l[i]
+    return {"cash": cash_out, "pnl": pnl_out, "position": pos_out}
+
+
+@metrics.timed("simulate.with_rev")
+def simulate_with_rev(rate, spot, mark, initial_cash=1000.0, entry_mask=None, short_entry_mask=None):
+    """simulation_with_rev.py: carry in both directions depending on the funding sign.
+
+    entry_mask, if given, is ANDed into the long spot / short perp entry signal
+    and short_entry_mask into the reverse one (forecast.entry_mask(short=True)).
+    """
+    n = len(rate)
+    basis = spot - mark
+    open_long = _masked(rate > 0, entry_mask).tolist()
+    open_short = _masked((rate < 0) & (basis > 0), short_entry_mask).tolist()
+    close_long = (rate <= 0).tolist()
+    close_short = (rate >= 0).tolist()
+    rate_l = rate.tolist()
+    basis_l = basis.tolist()
+    mark_l = mark.tolist()
+
+    cash_out = np.empty(n)
+    pnl_out = np.empty(n)
+    pos_out = np.zeros(n, dtype=np.int8)
+
+    cash = initial_cash
+    pos = FLAT
+    entry_basis = size = 0.0
+    for i in range(n):
+        pnl = 0.0
+        if pos == FLAT:
+            if open_long[i]:
+                pos = LONG_SPOT_SHORT_PERP
+            elif open_short[i]:
+                pos = SHORT_SPOT_LONG_PERP
+            if pos != FLAT:
+                entry_basis = basis_l[i]
+                size = cash / mark_l[i]
+        if pos != FLAT:
+            pnl += cash * rate_l[i]
+        if pos == LONG_SPOT_SHORT_PERP and close_long[i]:
+            pnl += size * (basis_l[i] - entry_basis)
+            pos = FLAT
+        if pos == SHORT_SPOT_LONG_PERP and close_short[i]:
+            pnl += size * (entry_basis - basis_l[i])
+            pos = FLAT
+        cash += pnl
+        cash_out[i] = cash
+        pnl_out[i] = pnl
+        pos_out[i] = pos
+    return {"cash": cash_out, "pnl": pnl_out, "position": pos_out, "basis": basis}
+
+
+@metrics.timed("simulate.basis_hold")
+def simulate_basis_hold(rate, spot, mark, initial_cash=1000.0, threshold=0.005,
+                        hold_steps=3, spot_fee=0.001, perp_fee=0.0005, jit=None):
+    """simulation.py: trade |basis_pct| >= threshold and hold for a fixed number of steps.
+
+    Only the rows the original loop records are returned; "index" holds their
+    positions in the input arrays.
+    """
+    n = len(rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        basis_pct = (spot - mark) / spot
+        valid = (spot > 0) & (mark > 0)
+        signal = np.abs(basis_pct) >= threshold
+
+    k = _kernels(jit, n)
+    if k is not None:
+        idx, action, pnl, cash = k.basis_hold(rate, spot, mark, basis_pct, valid, signal, initial_cash,
+                                              hold_steps, spot_fee, perp_fee)
+        return {"index": idx, "basis_pct": basis_pct, "action": action, "pnl": pnl, "cash": cash}
+
+    valid = valid.tolist()
+    signal = signal.tolist()
+    rate_l = rate.tolist()
+    spot_l = spot.tolist()
+    mark_l = mark.tolist()
+    basis_l = basis_pct.tolist()
+
+    idx_out = []
+    action_out = []
+    pnl_out = []
+    cash_out = []
+
+    cash = initial_cash
+    i = 0
+    while i < n - hold_steps:
+        pnl = 0.0
+        action = ACTION_NONE
+        # spot/mark > 0 is False for NaN as well
+        if not valid[i]:
+            i += 1
+            continue
+
+        if signal[i]:
+            j = i + hold_steps
+            if not valid[j]:
+                i += 1
+                continue
+            spot_entry = spot_l[i]
+            mark_entry = mark_l[i]
+            spot_exit = spot_l[j]
+            mark_exit = mark_l[j]
+            spot_gt_mark = basis_l[i] > 0
+
+            notional = cash
+            cash -= notional * spot_fee + notional * perp_fee
+
+            size = notional / spot_entry if spot_gt_mark else notional / mark_entry
+            if not size > 0:
+                i += 1
+                continue
+
+            if spot_gt_mark:
+                spot_pnl = (spot_exit - spot_entry) * size
+                perp_pnl = (mark_entry - mark_exit) * size
+                funding_px = mark_entry
+            else:
+                spot_pnl = (spot_entry - spot_exit) * size
+                perp_pnl = (mark_exit - mark_entry) * size
+                funding_px = spot_entry
+
+            funding_pnl = 0
+            for r in rate_l[i + 1:j + 1]:
+                if r == r:
+                    funding_pnl += r * size * funding_px
+
+            close_notional = size * (spot_exit + mark_exit) / 2
+            pnl = (spot_pnl + perp_pnl + funding_pnl
+                   - close_notional * spot_fee - close_notional * perp_fee)
+            cash += pnl
+            action = ACTION_TRADE_SPOT_GT_MARK if spot_gt_mark else ACTION_TRADE_MARK_GT_SPOT
+            idx_out.append(i)
+            i += hold_steps
+        else:
+            idx_out.append(i)
+            i += 1
+
+        action_out.append(action)
+        pnl_out.append(pnl)
+        cash_out.append(cash)
+
+    return {
+        "index": np.array(idx_out, dtype=np.int64),
+        "basis_pct": basis_pct,
+        "action": np.array(action_out, dtype=np.int8),
+        "pnl": np.array(pnl_out, dtype=np.float64),
+        "cash": np.array(cash_out, dtype=np.float64),
+    }
+
+
+@metrics.timed("simulate.gemini")
+def simulate_gemini(rate, spot, mark, initial_cash=1000.0, capital_allocation_pct=0.95,
+                    spot_fee_rate=0.001, futures_fee_rate=0.0005, min_trade_size_btc=0.0001,
+                    min_fr_entry=0.0001, basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005,
+                    entry_mask=None, slippage=None, jit=None):
+    """simulation_gemini.py: long spot / short perp gated on funding and basis thresholds.
+
+    entry_mask, if given, is a boolean array ANDed into the entry signal, e.g. a
+    rolling z-score or percentile gate built with features.rolling_features, or
+    forecast.entry_mask on the expected carry after fees.
+    slippage, if given, is a slippage.SlippageModel whose per-trade impact
+    rates are added to spot_fee_rate / futures_fee_rate on that trade.
+
+    Per-row outputs are preallocated typed arrays; opens and closes are also
+    recorded in "trades", a TRADE_DTYPE record array with one row per event.
+    The audit formula strings are rendered separately by gemini_audit_formulas.
+    """
+    n = len(rate)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        basis_pct = np.where(spot != 0, mark / spot - 1, 0.0)
+    enter = _masked((rate > min_fr_entry) & (basis_pct > basis_entry), entry_mask)
+    exit_ = (rate <= fr_exit) | (basis_pct < basis_exit)
+
+    k = _kernels(jit, n) if slippage is None else None
+    if k is not None:
+        res = k.gemini(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct, spot_fee_rate,
+                       futures_fee_rate, min_trade_size_btc)
+        res["equity_mtm"] = hedged_equity(res, spot, mark)
+        return res
+
+    enter = enter.tolist()
+    exit_ = exit_.tolist()
+    rate_l = rate.tolist()
+    spot_l = spot.tolist()
+    mark_l = mark.tolist()
+
+    action_out = np.zeros(n, dtype=np.int8)
+    equity_out = np.empty(n)
+    cash_out = np.empty(n)
+    btc_out = np.empty(n)
+    funding_pnl_out = np.zeros(n)
+    basis_pnl_out = np.zeros(n)
+    costs_out = np.zeros(n)
+    trades = []
+
+    cash = initial_cash
+    btc_spot = btc_funding = 0.0
+    in_position = False
+    entry_spot = entry_mark = 0.0
+    position_size = 0.0
+    entry_cost = 0.0
+
+    for i in range(n):
+        spot_i = spot_l[i]
+        mark_i = mark_l[i]
+        equity_out[i] = cash + (btc_spot + btc_funding) * spot_i
+
+        if in_position:
+            funding_btc = position_size * rate_l[i]
+            btc_funding += funding_btc
+            funding_pnl_out[i] = funding_btc * spot_i
+
+            if exit_[i]:
+                action_out[i] = ACTION_CLOSE
+                total_btc_to_sell = btc_spot + btc_funding
+                spot_fee, perp_fee = spot_fee_rate, futures_fee_rate
+                if slippage is not None:
+                    spot_slip, perp_slip = slippage.cost_rates(
+                        i, total_btc_to_sell, position_size, opening=False)
+                    spot_fee, perp_fee = spot_fee + spot_slip, perp_fee + perp_slip
+                proceeds = total_btc_to_sell * spot_i * (1 - spot_fee)
+                futures_fee = position_size * mark_i * perp_fee
+                cash += proceeds - futures_fee
+                costs_out[i] = entry_cost + (total_btc_to_sell * spot_i * spot_fee) + futures_fee
+
+                basis_move = (spot_i - mark_i) - (entry_spot - entry_mark)
+                basis_pnl_out[i] = position_size * basis_move
+                trades.append((i, ACTION_CLOSE, position_size, spot_i, mark_i, entry_spot, entry_mark,
+                               btc_funding, basis_move, costs_out[i]))
+
+                btc_spot = btc_funding = 0.0
+                in_position = False
+                position_size = 0.0
+                entry_cost = 0.0
+
+        elif enter[i]:
+            potential_btc = cash * capital_allocation_pct / spot_i
+            if potential_btc >= min_trade_size_btc:
+                entry_spot = spot_i
+                entry_mark = mark_i
+                position_size = potential_btc
+                spot_fee, perp_fee = spot_fee_rate, futures_fee_rate
+                if slippage is not None:
+                    spot_slip, perp_slip = slippage.cost_rates(i, position_size, position_size, opening=True)
+                    spot_fee, perp_fee = spot_fee + spot_slip, perp_fee + perp_slip
+                spot_cost = position_size * spot_i
+                futures_fee = position_size * mark_i * perp_fee
+                entry_cost = spot_cost * spot_fee + futures_fee
+                total_needed = spot_cost + entry_cost
+
+                if cash >= total_needed:
+                    action_out[i] = ACTION_OPEN
+                    cash -= total_needed
+                    btc_spot = position_size
+                    btc_funding = 0.0
+                    in_position = True
+                    trades.append((i, ACTION_OPEN, position_size, spot_i, mark_i, entry_spot, entry_mark,
+                                   0.0, 0.0, entry_cost))
+
+        cash_out[i] = cash
+        btc_out[i] = btc_spot + btc_funding
+
+    res = {
+        "action": action_out,
+        "equity": equity_out,
+        "cash": cash_out,
+        "btc": btc_out,
+        "funding_pnl": funding_pnl_out,
+        "basis_pnl": basis_pnl_out,
+        "costs": costs_out,
+        "trades": np.array(trades, dtype=TRADE_DTYPE),
+    }
+    res["equity_mtm"] = hedged_equity(res, spot, mark)
+    return res
+
+
+def hedged_equity(res, spot, mark):
+    """Equity after each row's action with the short perp marked: cash + btc * spot + size * (entry_mark - mark).
+
+    "equity" is marked before the row's action and on the spot leg only. On
+    close rows the perp term drops out, as the backtest's cash books the spot
+    leg only, so the last value is the backtest's own end cash when flat.
+    """
+    n = len(spot)
+    equity = res["cash"] + res["btc"] * spot
+    trades = res["trades"]
+    opens = trades[trades["action"] == ACTION_OPEN]
+    if not len(opens):
+        return equity
+    # Held after the action: from each open row up to (not including) its close
+    ends = np.full(len(opens), n)
+    closes = trades["index"][trades["action"] == ACTION_CLOSE]
+    ends[:len(closes)] = closes
+    held = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(held, opens["index"], 1)
+    np.add.at(held, ends, -1)
+    held = np.cumsum(held[:n]) > 0
+    last = np.maximum(np.searchsorted(opens["index"], np.arange(n), side="right") - 1, 0)
+    with np.errstate(invalid="ignore"):
+        perp = opens["size"][last] * (opens["entry_mark"][last] - mark)
+    return equity + np.where(held, perp, 0.0)
+
+
+def held_mask(trades, n):
+    """Rows on which an open position accrues funding: (open, close] of every trade."""
+    held = np.zeros(n + 1, dtype=np.int8)
+    opens = trades["index"][trades["action"] == ACTION_OPEN]
+    closes = trades["index"][trades["action"] == ACTION_CLOSE]
+    np.add.at(held, opens + 1, 1)
+    np.add.at(held, closes + 1, -1)
+    return np.cumsum(held[:n]) > 0
+
+
+def gemini_audit_formulas(res, rate, spot, mark):
+    """funding_pnl_formula / basis_pnl_formula strings for simulation_gemini.py's CSV.
+
+    Only rows with an open position or a close get a formula; the rest are "".
+    """
+    n = len(rate)
+    trades = res["trades"]
+    size = np.zeros(n)
+    opens = trades[trades["action"] == ACTION_OPEN]
+    held = held_mask(trades, n)
+    # Position size of the most recent open, carried over the rows it is held
+    last_open = np.searchsorted(opens["index"], np.arange(n), side="left") - 1
+    size[held] = opens["size"][last_open[held]]
+
+    funding_formula = np.full(n, "", dtype=object)
+    basis_formula = np.full(n, "", dtype=object)
+    funding_pnl = res["funding_pnl"]
+    for i in np.flatnonzero(held).tolist():
+        funding_formula[i] = f"{size[i] * rate[i]:.6f} * {spot[i]:.2f} = {funding_pnl[i]:.2f}"
+    for t in trades[trades["action"] == ACTION_CLOSE]:
+        i, bm = int(t["index"]), t["basis_move"]
+        basis_formula[i] = (
+            f"({spot[i]:.2f} - {mark[i]:.2f}) - ({t['entry_spot']:.2f} - {t['entry_mark']:.2f}) = {bm:.2f}; "
+            f"{bm:.2f} * {t['size']:.6f}"
+        )
+    return funding_formula, basis_formula
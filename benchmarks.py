@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (
+    load_arrays,
+    simulate_basis_hold,
+    simulate_gemini,
+    simulate_v0,
+    simulate_v0_costs,
+    simulate_with_rev,
+)
+from dataset_io import FEATURE_COLUMNS, read_dataset, write_dataset
+from event_engine import event_arrays, run_strategy
+import kernels
+from live_engine import CarryStrategy
+from portfolio import simulate_portfolio
+
+# Benchmark harness for the loaders and every simulation variant.
+# Generates synthetic funding/spot/mark series of 10^3..10^7 rows, times each
+# strategy's inner loop (the backtest_engine functions the simulation scripts
+# call) and each loader, records peak traced memory, and writes a JSON report.
+# Strategies with a Numba kernel are timed twice, as "<name>_python" (jit=False)
+# and "<name>_numba" (jit=True), instead of letting jit=None pick one by size;
+# the kernels are compiled (or loaded from the cache) before any timing.
+# Two reports can be compared to flag regressions between commits:
+#
+#   python benchmarks.py --sizes 1e3,1e4,1e5 --output bench_new.json
+#   python benchmarks.py --compare bench_old.json bench_new.json
+
+DEFAULT_SIZES = "1e3,1e4,1e5,1e6"
+REGRESSION_THRESHOLD = 0.20  # 20% slower than the baseline
+
+
+def synthetic_frame(n, seed=0):
+    """Funding/spot/mark rows with persistent funding, random-walk spot and a noisy basis.
+
+    Rows are one minute apart so that 10^7 rows stay inside the datetime64[ns]
+    range; the strategies only see the row order.
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2020-01-01", periods=n, freq="min")
+    # Persistent funding regimes: white noise smoothed with an exponential kernel
+    kernel = 0.9 ** np.arange(64)
+    rate = 1e-4 + np.convolve(rng.normal(0, 1e-4, n), kernel)[:n]
+    spot = 30000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    basis = 0.001 + 0.002 * rng.standard_normal(n)
+    mark = spot * (1 + basis)
+    return pd.DataFrame({
+        "fundingTime": times,
+        "symbol": "BTCUSD_PERP",
+        "fundingRate": rate,
+        "markPrice": mark,
+        "spotPrice": spot,
+    })
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _replay_live(rate, spot, mark):
+    strategy = CarryStrategy()
+    step = strategy.step
+    for i, (r, s, m) in enumerate(zip(rate.tolist(), spot.tolist(), mark.tolist())):
+        step(i, r, s, m)
+
+
+def strategy_cases(arr):
+    rate, spot, mark = arr["fundingRate"], arr["spotPrice"], arr["markPrice"]
+    n = len(rate)
+    n_sym = 4
+    t = n // n_sym
+    panel = [x[:t * n_sym].reshape(t, n_sym) for x in (rate, spot, mark)]
+    ms = arr["fundingTime"].astype("datetime64[ms]").astype(np.int64)
+    events = event_arrays(ms, rate, ms, spot, ms, mark)
+    cases = {
+        "simulation_v0": lambda: simulate_v0(rate, spot, mark),
+        "simulation_v0_con_costos": lambda: simulate_v0_costs(rate, spot, mark),
+        "simulation_with_rev": lambda: simulate_with_rev(rate, spot, mark),
+    }
+    for suffix, jit in jit_variants():
+        cases[f"simulation_{suffix}"] = lambda jit=jit: simulate_basis_hold(rate, spot, mark, jit=jit)
+        cases[f"simulation_gemini_{suffix}"] = lambda jit=jit: simulate_gemini(rate, spot, mark, jit=jit)
+    cases.update({
+        "portfolio_4_symbols": lambda: simulate_portfolio(*panel),
+        "live_engine_step": lambda: _replay_live(rate, spot, mark),
+        "event_engine_gemini": lambda: run_strategy(events, "gemini"),
+    })
+    return cases
+
+
+def jit_variants():
+    """(name suffix, jit argument) pairs; the Numba one only when kernels.ENABLED."""
+    return [("python", False)] + ([("numba", True)] if kernels.ENABLED else [])
+
+
+def warm_up():
+    """Runs every Numba case once on a small frame so compilation is never timed."""
+    arr = load_arrays(synthetic_frame(256))
+    for name, fn in strategy_cases(arr).items():
+        if name.endswith("_numba"):
+            fn()
+
+
+def loader_cases(df, tmpdir):
+    cases = {}
+    csv_path = os.path.join(tmpdir, "data.csv")
+    write_dataset(df, csv_path)
+    cases["read_csv"] = lambda: read_dataset(csv_path, columns=FEATURE_COLUMNS)
+    try:
+        for ext in ("parquet", "arrow"):
+            path = os.path.join(tmpdir, f"data.{ext}")
+            write_dataset(df, path)
+            cases[f"read_{ext}"] = lambda path=path: read_dataset(path, columns=FEATURE_COLUMNS)
+    except ImportError:
+        print("pyarrow not installed; skipping Parquet/Arrow loaders")
+    cases["load_arrays"] = lambda: load_arrays(df)
+    return cases
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat=3, memory=True, only=None):
+    warm_up()
+    results = []
+    for n in sizes:
+        df = synthetic_frame(n)
+        arr = load_arrays(df)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cases = {**{f"strategy:{k}": v for k, v in strategy_cases(arr).items()},
+                     **{f"loader:{k}": v for k, v in loader_cases(df, tmpdir).items()}}
+            for name, fn in cases.items():
+                if only and not any(o in name for o in only):
+                    continue
+                seconds = _time(fn, repeat if n <= 1_000_000 else 1)
+                row = {
+                    "name": name,
+                    "rows": n,
+                    "seconds": seconds,
+                    "rows_per_second": n / seconds if seconds > 0 else None,
+                    "peak_bytes": _peak_memory(fn) if memory else None,
+                }
+                results.append(row)
+                mem = f"{row['peak_bytes'] / 2**20:9.1f} MiB" if memory else ""
+                print(f"{name:<36} {n:>10,d} rows {seconds * 1e3:10.2f} ms {mem}")
+    return {
+        "revision": git_revision(),
+        "timestamp": pd.Timestamp.now("UTC").isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "numba": kernels.numba.__version__ if kernels.ENABLED else None,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """Rows of (name, rows, old s, new s, ratio, regression?) for cases present in both reports."""
+    base = {(r["name"], r["rows"]): r for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        b = base.get((r["name"], r["rows"]))
+        if b is None or not b["seconds"]:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        rows.append({
+            "name": r["name"],
+            "rows": r["rows"],
+            "old_seconds": b["seconds"],
+            "new_seconds": r["seconds"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for loaders and simulation variants.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 1e3,1e5,1e7")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--only", default=None, help="comma-separated substrings of case names to run")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two reports and exit")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        table = compare(old, new, args.threshold)
+        print(table.to_string(index=False))
+        regressions = int(table["regression"].sum()) if len(table) else 0
+        print(f"\n{regressions} regression(s) over {args.threshold:.0%}")
+        raise SystemExit(1 if regressions else 0)
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    only = args.only.split(",") if args.only else None
+    report = run(sizes, repeat=args.repeat, memory=not args.no_memory, only=only)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n✅ Reporte guardado en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import importlib
+import sys
+
+# Single entry point for the fetchers, backtests and studies:
+#
+#   python cli.py fetch --start 2024-01-01 --end 2024-12-31
+#   python cli.py fill --input coinm_full_data_2024.csv
+#   python cli.py backtest gemini --input coinm_full_data_2024_filled.csv
+#   python cli.py sweep gemini --basis-entry 0.0005:0.003:0.0005
+#   python cli.py report simulacion_completa.csv strategy_results.csv
+#
+# Every subcommand forwards its arguments to the main() of one module, which
+# is only imported when that subcommand runs. This file imports nothing but
+# the standard library, so `--help` and dispatch don't load numpy, pandas,
+# requests or aiohttp.
+#
+# Global options go before the command:
+#   python cli.py --metrics run.prom --profile run.stacks backtest gemini
+# --metrics writes the stage timers / counters of metrics.py (JSON, or
+# Prometheus text for *.prom / *.txt); --profile writes sampled stacks.
+
+COMMANDS = {
+    # name: (module, help)
+    "fetch": ("get_data", "download funding/spot/mark through the local cache and merge them"),
+    "fetch-async": ("async_fetch", "concurrent Binance download without the cache"),
+    "fetch-venues": ("venues", "download and normalize several exchanges"),
+    "fill": ("get_missing_values", "fill missing spotPrice from 1s klines"),
+    "validate": ("validate", "validate and repair a merged dataset"),
+    "backtest": (None, "run one strategy: " + ", ".join(["v0", "v0-costs", "with-rev", "basis", "gemini", "roll"])),
+    "events": ("event_engine", "event-driven backtest with separate spot / perp legs"),
+    "sweep": ("sweep", "parameter sweep on a process pool"),
+    "walk-forward": ("walk_forward", "walk-forward optimization with cached windows"),
+    "monte-carlo": ("monte_carlo", "bootstrap risk distribution of the gemini strategy"),
+    "forecast": ("forecast", "walk-forward funding / carry forecast for entry gating"),
+    "portfolio": ("portfolio", "multi-symbol portfolio backtest"),
+    "intraday": ("intraday", "gemini with minute-level exits"),
+    "live": ("live_engine", "live / replay runner"),
+    "bench": ("benchmarks", "loader and simulation benchmarks"),
+    "report": ("report", "summarize backtest result CSVs"),
+}
+
+STRATEGIES = {
+    "v0": "simulation_v0",
+    "v0-costs": "simulation_v0_con_costos",
+    "with-rev": "simulation_with_rev",
+    "basis": "simulation",
+    "gemini": "simulation_gemini",
+    "roll": "term_structure",
+}
+
+
+def dispatch(command, argv):
+    """Imports the module behind `command` and runs its main(argv)."""
+    module = COMMANDS[command][0]
+    if module is None:
+        if not argv or argv[0] not in STRATEGIES:
+            raise SystemExit(f"backtest needs a strategy: {', '.join(STRATEGIES)}")
+        module, argv = STRATEGIES[argv[0]], argv[1:]
+    return importlib.import_module(module).main(argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="cash-carry: data, backtests and studies for the funding-rate carry trade.",
+        epilog="Run '<command> --help' for the options of each command.")
+    parser.add_argument("--metrics", default=None, help="write stage timers/counters here (.json, .prom)")
+    parser.add_argument("--profile", default=None, help="write sampled collapsed stacks here")
+    parser.add_argument("--profile-interval", type=float, default=0.005, help="seconds between samples")
+    sub = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        # add_help=False so that "<command> --help" reaches the module's own parser
+        sub.add_parser(name, help=help_text, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+    if not (args.metrics or args.profile):
+        dispatch(args.command, rest)
+        return
+
+    import metrics
+
+    metrics.enable()
+    profiler = metrics.SamplingProfiler(args.profile_interval).start() if args.profile else None
+    try:
+        with metrics.stage(f"command.{args.command}"):
+            dispatch(args.command, rest)
+    finally:
+        if profiler is not None:
+            profiler.stop().write(args.profile)
+        if args.metrics:
+            metrics.write(args.metrics)
+        print("\n" + metrics.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
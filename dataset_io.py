@@ -0,0 +1,148 @@
+import numpy as np
+
+import metrics
+
+# Columnar storage for the merged fundingTime/symbol/fundingRate/markPrice/spotPrice
+# frame. get_data.py writes typed, compressed Parquet (or uncompressed Arrow
+# IPC, which can be memory-mapped zero-copy); the simulations read only the
+# columns and time range they need instead of parsing timestamp strings.
+# CSV paths are still accepted everywhere so the old files keep working.
+#
+# pyarrow is only needed for .parquet / .arrow files; get_data.py and venues.py
+# check fallback_path() before downloading and write CSV without it. pandas is
+# imported on first use so that pool workers importing this module for its
+# constants don't load it.
+
+COLUMNS = ["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"]
+FEATURE_COLUMNS = ["fundingRate", "markPrice", "spotPrice"]  # what the simulations read
+ROW_GROUP_SIZE = 64 * 1024  # small enough that time filters skip whole row groups
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow files need pyarrow: pip install pyarrow") from e
+    return pa
+
+
+def fallback_path(path):
+    """path, or its .csv sibling if path is Parquet/Arrow and pyarrow can't be imported."""
+    if _file_format(path) == "csv":
+        return path
+    try:
+        _pyarrow()
+    except ImportError:
+        return str(path).rsplit(".", 1)[0] + ".csv"
+    return path
+
+
+def _schema(pa):
+    return pa.schema([
+        ("fundingTime", pa.timestamp("ms")),
+        ("symbol", pa.dictionary(pa.int32(), pa.string())),
+        ("fundingRate", pa.float64()),
+        ("markPrice", pa.float64()),
+        ("spotPrice", pa.float64()),
+    ])
+
+
+def _file_format(path):
+    path = str(path).lower()
+    if path.endswith(".parquet") or path.endswith(".pq"):
+        return "parquet"
+    if path.endswith(".arrow") or path.endswith(".feather") or path.endswith(".ipc"):
+        return "arrow"
+    return "csv"
+
+
+def write_dataset(df, path, compression=None):
+    """Writes the merged frame with a fixed schema, sorted by fundingTime.
+
+    Parquet defaults to zstd. Arrow IPC defaults to uncompressed so that
+    read_dataset() can memory-map it without copying; pass "lz4" or "zstd"
+    to trade that for size.
+    """
+    import pandas as pd
+
+    fmt = _file_format(path)
+    df = df[COLUMNS].sort_values("fundingTime", kind="stable").reset_index(drop=True)
+    if fmt == "csv":
+        df.to_csv(path, index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+        return
+
+    pa = _pyarrow()
+    frame = df.astype({"fundingRate": np.float64, "markPrice": np.float64, "spotPrice": np.float64})
+    frame["fundingTime"] = pd.to_datetime(frame["fundingTime"]).astype("datetime64[ms]")
+    table = pa.Table.from_pandas(frame, schema=_schema(pa), preserve_index=False)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path, compression=compression or "zstd", row_group_size=ROW_GROUP_SIZE)
+    else:
+        import pyarrow.ipc as ipc
+
+        options = ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(str(path), "wb") as sink, ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=ROW_GROUP_SIZE)
+
+
+def read_table(path, columns=None, start=None, end=None):
+    """Memory-mapped pyarrow Table with only `columns` and fundingTime in [start, end]."""
+    import pandas as pd
+
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    cols = None if columns is None else list(dict.fromkeys(["fundingTime", *columns]))
+    start = None if start is None else pa.scalar(pd.Timestamp(start).to_datetime64().astype("datetime64[ms]"))
+    end = None if end is None else pa.scalar(pd.Timestamp(end).to_datetime64().astype("datetime64[ms]"))
+
+    if _file_format(path) == "parquet":
+        import pyarrow.parquet as pq
+
+        filters = []
+        if start is not None:
+            filters.append(("fundingTime", ">=", start))
+        if end is not None:
+            filters.append(("fundingTime", "<=", end))
+        return pq.read_table(path, columns=cols, filters=filters or None, memory_map=True)
+
+    import pyarrow.ipc as ipc
+
+    table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    if cols is not None:
+        table = table.select(cols)
+    if start is not None or end is not None:
+        # fundingTime is sorted on write, so the range is one contiguous slice
+        times = table.column("fundingTime")
+        lo = 0 if start is None else pc.sum(pc.less(times, start)).as_py() or 0
+        hi = len(table) if end is None else pc.sum(pc.less_equal(times, end)).as_py() or 0
+        table = table.slice(lo, max(hi - lo, 0))
+    return table
+
+
+def read_dataset(path, columns=None, start=None, end=None):
+    """Loads the merged dataset as a DataFrame from CSV, Parquet or Arrow IPC.
+
+    `columns` lists the value columns to load (fundingTime is always included);
+    `start`/`end` bound fundingTime inclusively.
+    """
+    import pandas as pd
+
+    fmt = _file_format(path)
+    with metrics.stage(f"load.{fmt}") as st:
+        if fmt == "csv":
+            df = pd.read_csv(path, parse_dates=["fundingTime"], usecols=None if columns is None
+                             else list(dict.fromkeys(["fundingTime", *columns])))
+            if start is not None:
+                df = df[df["fundingTime"] >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df["fundingTime"] <= pd.Timestamp(end)]
+            df = df.reset_index(drop=True)
+        else:
+            df = read_table(path, columns, start, end).to_pandas()
+            if "symbol" in df:
+                df["symbol"] = df["symbol"].astype(str)
+        st.rows = len(df)
+    return df
@@ -0,0 +1,481 @@
+import argparse
+import heapq
+import time
+
+import numpy as np
+
+from backtest_engine import FLAT, LONG_SPOT_SHORT_PERP, SHORT_SPOT_LONG_PERP, annualized_return, max_drawdown
+
+# Event-driven backtester with per-leg accounting.
+#
+# The array kernels in backtest_engine.py reproduce each script's own
+# bookkeeping, and those disagree: simulation_v0.py accrues cash * rate on the
+# bar it opens, simulation_v0_con_costos.py accrues the previous rate, and
+# simulation_gemini.py accrues position_size * rate BTC. All of them fold spot
+# and perp into one cash number. Here every strategy runs on the same rules:
+#
+# - Events are spot prices, mark prices, funding payments and orders. At one
+#   timestamp they are handled in that order, so a position pays or receives
+#   funding only if it was filled before the funding timestamp.
+# - The spot leg and the perp leg keep their own quantity, cost, realized
+#   PnL, fees and (perp only) funding. The perp is either linear (USD-margined,
+#   qty in BTC) or inverse like BTCUSD_PERP (coin-margined, qty in contracts of
+#   contract_size USD, PnL, fees and funding settled in BTC).
+# - Strategies are callbacks (on_funding, optionally on_price / on_fill) that
+#   submit orders; orders fill latency_ms later at the then current price.
+#
+# The price and funding events are known up front, so they are merged once
+# into three sorted arrays (np.lexsort) and walked by index; only orders,
+# which strategies create on the fly, go through a heapq priority queue that is
+# drained before the first event of a later timestamp, so an order due at t
+# fills after every market event at t. The loop touches plain floats and
+# allocates one tuple per order and per fill.
+#
+#   python event_engine.py --strategy gemini --contract inverse
+
+SPOT_PRICE = 0
+MARK_PRICE = 1
+FUNDING = 2
+
+SPOT = 0
+PERP = 1
+
+CONTRACT_SIZE_USD = 100.0  # BTCUSD_PERP face value
+
+INPUT_FILE = "coinm_full_data_2024_filled.csv"
+OUTPUT_FILE = "event_backtest.csv"
+INITIAL_CASH = 1000.0
+
+# Per-funding-event outputs of EventEngine.run, in CSV order
+RECORD_COLUMNS = ["timestamp", "fundingRate", "spotPrice", "markPrice", "position", "cash", "spot_btc",
+                  "perp_qty", "perp_balance", "perp_upnl", "equity"]
+
+FILL_DTYPE = np.dtype([
+    ("ts", np.int64),
+    ("leg", np.int8),
+    ("qty", np.float64),
+    ("price", np.float64),
+    ("fee", np.float64),
+    ("realized", np.float64),
+])
+
+
+def event_arrays(funding_ms, rate, spot_ms, spot, mark_ms, mark):
+    """Merges the three series into (times, kinds, values) sorted by time, then kind.
+
+    NaN prices and rates are dropped; the last valid price stays in effect.
+    """
+    parts = [(funding_ms, rate, FUNDING), (spot_ms, spot, SPOT_PRICE), (mark_ms, mark, MARK_PRICE)]
+    times, kinds, values = [], [], []
+    for t, v, kind in parts:
+        t = np.asarray(t, dtype=np.int64)
+        v = np.asarray(v, dtype=np.float64)
+        ok = ~np.isnan(v)
+        times.append(t[ok])
+        values.append(v[ok])
+        kinds.append(np.full(int(ok.sum()), kind, dtype=np.int8))
+    times, kinds, values = np.concatenate(times), np.concatenate(kinds), np.concatenate(values)
+    order = np.lexsort((kinds, times))
+    return times[order], kinds[order], values[order]
+
+
+def frame_events(df):
+    """event_arrays of a merged dataset: spot, mark and funding at every fundingTime."""
+    ms = df["fundingTime"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    return event_arrays(ms, df["fundingRate"].to_numpy(), ms, df["spotPrice"].to_numpy(),
+                        ms, df["markPrice"].to_numpy())
+
+
+class Leg:
+    """Position of one instrument.
+
+    Linear: qty in BTC, values and PnL in USD. Inverse: qty in contracts of
+    contract_size USD, values and PnL in BTC (value = qty * contract_size / price).
+    cost is the signed entry value of the open qty, so both kinds share one
+    average-cost update; a long's PnL is value - cost (linear) or cost - value
+    (inverse).
+    """
+
+    __slots__ = ("inverse", "contract_size", "qty", "cost", "realized", "funding", "fees", "transferred")
+
+    def __init__(self, inverse=False, contract_size=1.0):
+        self.inverse = inverse
+        self.contract_size = contract_size
+        self.qty = self.cost = 0.0
+        self.realized = self.funding = self.fees = self.transferred = 0.0
+
+    def value(self, qty, price):
+        if self.inverse:
+            return qty * self.contract_size / price
+        return qty * price
+
+    def _pnl(self, cost, value):
+        # PnL of closing `cost` with a trade of opposite sign worth `value`
+        return cost + value if self.inverse else -(cost + value)
+
+    def fill(self, qty, price, fee_rate):
+        """Applies a trade; returns (fee, realized PnL) in the leg's currency."""
+        value = self.value(qty, price)
+        fee = abs(value) * fee_rate
+        realized = 0.0
+        if self.qty and (qty > 0) != (self.qty > 0):
+            closed = min(abs(qty), abs(self.qty))
+            cost_closed = self.cost * closed / abs(self.qty)
+            realized = self._pnl(cost_closed, value * closed / abs(qty))
+            self.cost -= cost_closed
+            self.qty += closed if qty > 0 else -closed
+            rest = abs(qty) - closed
+            if rest > 0:
+                self.cost += value * rest / abs(qty)
+                self.qty += rest if qty > 0 else -rest
+            elif self.qty == 0:
+                self.cost = 0.0
+        else:
+            self.qty += qty
+            self.cost += value
+        self.realized += realized
+        self.fees += fee
+        return fee, realized
+
+    def accrue(self, rate, mark):
+        """One funding payment: longs pay shorts when rate > 0."""
+        payment = -self.value(self.qty, mark) * rate
+        self.funding += payment
+        return payment
+
+    def unrealized(self, price):
+        return self._pnl(self.cost, self.value(-self.qty, price)) if self.qty else 0.0
+
+    @property
+    def balance(self):
+        """Realized PnL + funding - fees not yet transferred out."""
+        return self.realized + self.funding - self.fees - self.transferred
+
+
+class Strategy:
+    """Callbacks of the event engine. on_price / on_fill are only called if overridden."""
+
+    def on_funding(self, eng, ts, rate):
+        pass
+
+    def on_price(self, eng, kind, ts, price):
+        pass
+
+    def on_fill(self, eng, fill):
+        pass
+
+
+class EventEngine:
+    def __init__(self, times, kinds, values, strategy, initial_cash=INITIAL_CASH, contract="inverse",
+                 contract_size=CONTRACT_SIZE_USD, spot_fee_rate=0.001, perp_fee_rate=0.0005, latency_ms=0):
+        self.times, self.kinds, self.values = times, kinds, values
+        self.strategy = strategy
+        self.inverse = contract == "inverse"
+        self.spot = Leg()
+        self.perp = Leg(self.inverse, contract_size if self.inverse else 1.0)
+        self.spot_fee_rate = spot_fee_rate
+        self.perp_fee_rate = perp_fee_rate
+        self.latency_ms = latency_ms
+
+        self.cash = initial_cash
+        self.initial_cash = initial_cash
+        self.spot_px = self.mark_px = float("nan")
+        self.rate = 0.0
+        self.now = 0
+        self.position = FLAT
+        self.fills = []
+        self._orders = []
+        self._seq = 0
+
+    # --- state ---
+    def perp_equity(self):
+        """Perp wallet balance + unrealized PnL, in USD."""
+        perp = self.perp
+        total = perp.balance + perp.unrealized(self.mark_px)
+        return total * self.spot_px if self.inverse else total
+
+    def equity(self):
+        return self.cash + self.spot.qty * self.spot_px + self.perp_equity()
+
+    def hedge_qty(self, btc):
+        """Perp qty hedging `btc` of spot: BTC (linear) or whole contracts (inverse)."""
+        if self.inverse:
+            return float(round(btc * self.mark_px / self.perp.contract_size))
+        return btc
+
+    def affordable_btc(self, fraction=1.0):
+        """Spot BTC that `fraction` of the cash buys including the spot fee."""
+        return self.cash * fraction / (self.spot_px * (1 + self.spot_fee_rate))
+
+    # --- orders ---
+    def order(self, leg, qty, delay_ms=None):
+        """Queues a market order; qty None on SPOT sells the spot leg plus the swept perp wallet."""
+        ts = self.now + (self.latency_ms if delay_ms is None else delay_ms)
+        self._seq += 1
+        heapq.heappush(self._orders, (ts, self._seq, leg, qty))
+
+    def open_carry(self, direction, btc):
+        """direction 1: long spot / short perp; -1: short spot / long perp."""
+        contracts = self.hedge_qty(btc)
+        if not contracts:
+            return False
+        self.order(SPOT, direction * btc)
+        self.order(PERP, -direction * contracts)
+        self.position = LONG_SPOT_SHORT_PERP if direction > 0 else SHORT_SPOT_LONG_PERP
+        return True
+
+    def close_all(self):
+        """Closes the perp, then sells the spot leg together with the perp wallet balance."""
+        if self.perp.qty:
+            self.order(PERP, -self.perp.qty)
+        self.order(SPOT, None)
+        self.position = FLAT
+
+    def sweep(self):
+        """Moves the perp wallet balance to the spot leg (inverse, BTC) or to cash (linear)."""
+        bal = self.perp.balance
+        self.perp.transferred += bal
+        if self.inverse:
+            self.spot.qty += bal
+            self.spot.cost += bal * self.spot_px
+        else:
+            self.cash += bal
+
+    def _fill(self, ts, leg, qty):
+        if leg == SPOT:
+            if qty is None:
+                self.sweep()
+                qty = -self.spot.qty
+                if not qty:
+                    return
+            price = self.spot_px
+            fee, realized = self.spot.fill(qty, price, self.spot_fee_rate)
+            self.cash -= qty * price + fee
+        else:
+            price = self.mark_px
+            fee, realized = self.perp.fill(qty, price, self.perp_fee_rate)
+        fill = (ts, leg, qty, price, fee, realized)
+        self.fills.append(fill)
+        if self._wants_fills:
+            self.strategy.on_fill(self, fill)
+
+    def _fill_before(self, t):
+        orders = self._orders
+        while orders and (t is None or orders[0][0] < t):
+            ts, _, leg, qty = heapq.heappop(orders)
+            self._fill(ts, leg, qty)
+
+    # --- loop ---
+    def run(self):
+        """Processes every event; returns per-funding-event arrays plus the fills table."""
+        strategy = self.strategy
+        cls = type(strategy)
+        self._wants_fills = cls.on_fill is not Strategy.on_fill
+        on_price = strategy.on_price if cls.on_price is not Strategy.on_price else None
+        on_funding = strategy.on_funding
+        perp = self.perp
+        orders = self._orders
+
+        kinds = self.kinds
+        m = int(np.count_nonzero(kinds == FUNDING))
+        out = {name: np.empty(m, dtype=np.int64 if name == "timestamp" else np.int8 if name == "position" else None)
+               for name in RECORD_COLUMNS}
+        cols = list(out.values())
+
+        row = -1
+        pending = False
+        last_t = None
+        for t, kind, v in zip(self.times.tolist(), kinds.tolist(), self.values.tolist()):
+            if t != last_t:
+                if orders and orders[0][0] < t:
+                    self._fill_before(t)
+                if pending:
+                    self._record(cols, row)
+                    pending = False
+                last_t = t
+            self.now = t
+            if kind == FUNDING:
+                if perp.qty:
+                    perp.accrue(v, self.mark_px)
+                self.rate = v
+                on_funding(self, t, v)
+                row += 1
+                pending = True
+            else:
+                if kind == SPOT_PRICE:
+                    self.spot_px = v
+                else:
+                    self.mark_px = v
+                if on_price is not None:
+                    on_price(self, kind, t, v)
+        # Orders due by the last timestamp still fill at the last prices
+        if last_t is not None:
+            self._fill_before(last_t + 1)
+        if pending:
+            self._record(cols, row)
+        out["fills"] = np.array(self.fills, dtype=FILL_DTYPE)
+        out["open_orders"] = len(orders)
+        return out
+
+    def _record(self, cols, i):
+        perp = self.perp
+        ts, rate, spot, mark, pos, cash, spot_btc, perp_qty, perp_bal, perp_upnl, equity = cols
+        ts[i] = self.now
+        rate[i] = self.rate
+        spot[i] = self.spot_px
+        mark[i] = self.mark_px
+        pos[i] = self.position
+        cash[i] = self.cash
+        spot_btc[i] = self.spot.qty
+        perp_qty[i] = perp.qty
+        perp_bal[i] = perp.balance
+        perp_upnl[i] = perp.unrealized(self.mark_px)
+        equity[i] = self.equity()
+
+
+# --- the simulation scripts as callbacks ---
+
+class FundingSignCarry(Strategy):
+    """simulation_v0.py / simulation_v0_con_costos.py: long spot / short perp while funding > 0.
+
+    reverse=True is simulation_with_rev.py: short spot / long perp while
+    funding < 0 and spot > mark.
+
+    It acts at most once per funding step and its orders fill after that
+    step's funding, so a sign flip closes on one step and reopens on the next,
+    and the entry step earns no funding; simulation_with_rev accrues the entry
+    step's rate, so trade timing and PnL differ from it.
+    """
+
+    def __init__(self, reverse=False):
+        self.reverse = reverse
+
+    def on_funding(self, eng, ts, rate):
+        pos = eng.position
+        if pos == LONG_SPOT_SHORT_PERP and rate <= 0 or pos == SHORT_SPOT_LONG_PERP and rate >= 0:
+            eng.close_all()
+        elif pos == FLAT:
+            if rate > 0:
+                eng.open_carry(1, eng.affordable_btc())
+            elif self.reverse and rate < 0 and eng.spot_px > eng.mark_px:
+                eng.open_carry(-1, eng.affordable_btc())
+
+
+class BasisHold(Strategy):
+    """simulation.py: trade |basis_pct| >= threshold and close hold_steps funding events later."""
+
+    def __init__(self, threshold=0.005, hold_steps=3):
+        self.threshold = threshold
+        self.hold_steps = hold_steps
+        self.left = 0
+
+    def on_funding(self, eng, ts, rate):
+        if eng.position != FLAT:
+            self.left -= 1
+            if self.left <= 0:
+                eng.close_all()
+            return
+        spot, mark = eng.spot_px, eng.mark_px
+        if not (spot > 0 and mark > 0):
+            return
+        basis_pct = (spot - mark) / spot
+        if abs(basis_pct) >= self.threshold:
+            if eng.open_carry(1 if basis_pct > 0 else -1, eng.affordable_btc()):
+                self.left = self.hold_steps
+
+
+class GeminiCarry(Strategy):
+    """simulation_gemini.py: long spot / short perp gated on funding and basis thresholds."""
+
+    def __init__(self, capital_allocation_pct=0.95, min_trade_size_btc=0.0001, min_fr_entry=0.0001,
+                 basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005):
+        self.capital_allocation_pct = capital_allocation_pct
+        self.min_trade_size_btc = min_trade_size_btc
+        self.min_fr_entry = min_fr_entry
+        self.basis_entry = basis_entry
+        self.fr_exit = fr_exit
+        self.basis_exit = basis_exit
+
+    def on_funding(self, eng, ts, rate):
+        spot, mark = eng.spot_px, eng.mark_px
+        basis_pct = mark / spot - 1 if spot else 0.0
+        if eng.position != FLAT:
+            if rate <= self.fr_exit or basis_pct < self.basis_exit:
+                eng.close_all()
+        elif rate > self.min_fr_entry and basis_pct > self.basis_entry:
+            btc = eng.cash * self.capital_allocation_pct / spot
+            if btc >= self.min_trade_size_btc and eng.cash >= btc * spot * (1 + eng.spot_fee_rate):
+                eng.open_carry(1, btc)
+
+
+STRATEGIES = {
+    # name: (callback factory, engine fee rates) -- same names as cli.py backtest
+    "v0": (FundingSignCarry, {"spot_fee_rate": 0.0, "perp_fee_rate": 0.0}),
+    "v0-costs": (FundingSignCarry, {"spot_fee_rate": 0.0015, "perp_fee_rate": 0.0015}),
+    "with-rev": (lambda: FundingSignCarry(reverse=True), {"spot_fee_rate": 0.0, "perp_fee_rate": 0.0}),
+    "basis": (BasisHold, {"spot_fee_rate": 0.001, "perp_fee_rate": 0.0005}),
+    "gemini": (GeminiCarry, {"spot_fee_rate": 0.001, "perp_fee_rate": 0.0005}),
+}
+
+
+def run_strategy(events, name, **engine_kwargs):
+    factory, fees = STRATEGIES[name]
+    eng = EventEngine(*events, factory(), **{**fees, **engine_kwargs})
+    return eng.run()
+
+
+def run(input_file=INPUT_FILE, output_file=OUTPUT_FILE, strategy="gemini", initial_cash=INITIAL_CASH,
+        contract="inverse", latency_ms=0, fills_file=None):
+    import pandas as pd
+
+    from dataset_io import FEATURE_COLUMNS, read_dataset
+
+    df = read_dataset(input_file, columns=FEATURE_COLUMNS).sort_values("fundingTime")
+    df["spotPrice"] = df["spotPrice"].fillna(df["markPrice"])
+    events = frame_events(df)
+    t0 = time.perf_counter()
+    res = run_strategy(events, strategy, initial_cash=initial_cash, contract=contract, latency_ms=latency_ms)
+    elapsed = time.perf_counter() - t0
+
+    fills = res.pop("fills")
+    open_orders = res.pop("open_orders")
+    out = pd.DataFrame(res)
+    out["timestamp"] = pd.to_datetime(out["timestamp"], unit="ms")
+    out["position"] = np.array(["CASH", "LONG_SPOT_SHORT_PERP", "SHORT_SPOT_LONG_PERP"])[out["position"]]
+    out.to_csv(output_file, index=False)
+    if fills_file:
+        f = pd.DataFrame(fills)
+        f["ts"] = pd.to_datetime(f["ts"], unit="ms")
+        f["leg"] = np.array(["spot", "perp"])[f["leg"]]
+        f.to_csv(fills_file, index=False)
+
+    equity = res["equity"]
+    end = float(equity[-1]) if len(equity) else initial_cash
+    days = (res["timestamp"][-1] - res["timestamp"][0]) / 86_400_000 if len(equity) else 0
+    print(f"Strategy: {strategy} ({contract} perp)")
+    print(f"Start cash: ${initial_cash:,.2f}")
+    print(f"End equity: ${end:,.2f}")
+    print(f"APY: {annualized_return(end, initial_cash, days) * 100:.2f}%")
+    print(f"Max drawdown: {max_drawdown(np.concatenate(([initial_cash], equity))) * 100:.2f}%")
+    print(f"Fills: {len(fills)} | Open orders: {open_orders}")
+    print(f"Events: {len(events[0]):,} in {elapsed * 1e3:.1f} ms")
+    print(f"✅ Resultados guardados en: {output_file}")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event-driven backtest with separate spot and perp legs.")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--strategy", choices=list(STRATEGIES), default="gemini")
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CASH)
+    parser.add_argument("--contract", choices=["inverse", "linear"], default="inverse",
+                        help="inverse: BTCUSD_PERP coin-margined; linear: USD-margined")
+    parser.add_argument("--latency-ms", type=int, default=0, help="delay between order and fill")
+    parser.add_argument("--fills", default=None, help="also write the fills table here")
+    args = parser.parse_args(argv)
+    run(args.input, args.output, args.strategy, args.initial_cash, args.contract, args.latency_ms, args.fills)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+from bisect import bisect_right, insort
+from collections import deque, namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Rolling features of fundingRate / basis_pct for gating entries.
+# Two paths produce the same values:
+#   rolling_features(x, window, alpha)  whole-array pass for batch backtests
+#   RollingFeatures(window, alpha)      streaming accumulator, one update() per
+#                                       funding event, usable from live_engine
+#
+# Every rolling feature covers the last `window` values including the current
+# one and is NaN until the window is full (pandas min_periods=window). std is
+# the sample std (ddof=1). pct_rank is the fraction of the window <= the
+# current value. The EWMA is the adjust=False recursion seeded with x[0].
+# Inputs must be finite (drop or fill NaN rows first).
+#
+# The batch pass keeps memory linear in len(x) for minute data over years:
+# the EWMA is a scaled cumsum per block (the recursion unrolled), mean and std
+# are cumsum differences over blocks of 2 * window - 1 values and pct_rank
+# compares at most CHUNK_ELEMENTS window values at a time. min, max and
+# pct_rank match the streaming path exactly; mean, std, ewma and zscore match
+# to floating-point rounding of the local spread (both paths lose the same
+# digits on a window far flatter than its neighbours; the streaming sums are
+# resynced every `window` updates, so neither error grows with len(x)).
+
+Features = namedtuple("Features", ["mean", "std", "zscore", "ewma", "min", "max", "pct_rank"])
+
+# |std| below this fraction of |mean| counts as a flat window (zscore 0)
+FLAT_STD_TOL = 1e-8
+# Window values pct_rank compares per chunk (bounds the boolean temporary to 4 MiB)
+CHUNK_ELEMENTS = 1 << 22
+# ewma blocks are sized so (1 - alpha) ** -k stays below exp(EWMA_LOG_RANGE)
+EWMA_LOG_RANGE = 600.0
+
+
+def _zscore(x, mean, std):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (x - mean) / std
+    flat = std <= FLAT_STD_TOL * np.abs(mean)
+    return np.where(flat & ~np.isnan(std), 0.0, z)
+
+
+def _rolling_moments(x, window):
+    """Rolling mean and sample std for each full window of x (len(x) - window + 1 rows)."""
+    # Windows are grouped in blocks of `window` consecutive ends; each block
+    # takes cumsum differences over its own 2 * window - 1 values centered on
+    # their mean, so the sums stay as small as the local spread
+    rows = len(x) - window + 1
+    blocks = -(-rows // window)
+    span = 2 * window - 1
+    padded = np.full(blocks * window + window - 1, x[-1])
+    padded[:len(x)] = x
+    seg = sliding_window_view(padded, span)[::window]
+    ref = seg.mean(axis=1, keepdims=True)
+    c = seg - ref
+    s1 = np.zeros((blocks, span + 1))
+    s2 = np.zeros((blocks, span + 1))
+    np.cumsum(c, axis=1, out=s1[:, 1:])
+    np.cumsum(c * c, axis=1, out=s2[:, 1:])
+    s1 = s1[:, window:] - s1[:, :window]
+    s2 = s2[:, window:] - s2[:, :window]
+    mean = (ref + s1 / window).ravel()[:rows]
+    var = (np.maximum(s2 - s1 * s1 / window, 0.0) / (window - 1)).ravel()[:rows]
+    return mean, np.sqrt(var)
+
+
+def ewma(x, alpha):
+    """adjust=False EWMA: y[0] = x[0], y[i] = alpha * x[i] + (1 - alpha) * y[i-1].
+
+    Within a block y[k] = d**k * cumsum(u * d**-j)[k] plus the previous
+    block's last value decayed by d**(k + 1), with d = 1 - alpha; only the
+    block ends are carried in a loop (len(x) / block_size steps).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    u = alpha * x
+    if n:
+        u[0] = x[0]
+    d = 1.0 - alpha
+    if n == 0 or d == 0.0:
+        return u
+    size = int(min(n, max(1, EWMA_LOG_RANGE // -np.log(d))))
+    blocks = -(-n // size)
+    k = np.arange(size)
+    padded = np.zeros(blocks * size)
+    padded[:n] = u
+    decay = d ** k
+    local = np.cumsum(padded.reshape(blocks, size) / decay, axis=1) * decay
+    carry = np.empty(blocks)
+    c = 0.0
+    d_size = d ** size
+    for b in range(blocks):
+        carry[b] = c
+        c = local[b, -1] + d_size * c
+    return (local + carry[:, None] * (decay * d)).ravel()[:n]
+
+
+def rolling_features(x, window, alpha=None):
+    """Features of every prefix of x as a dict of float64 arrays.
+
+    alpha defaults to 2 / (window + 1), the pandas span convention.
+    """
+    if window < 2:
+        raise ValueError("window must be at least 2")
+    alpha = 2 / (window + 1) if alpha is None else alpha
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    out = {k: np.full(n, np.nan) for k in Features._fields}
+    out["ewma"] = ewma(x, alpha)
+    if n < window:
+        return out
+
+    out["mean"][window - 1:], out["std"][window - 1:] = _rolling_moments(x, window)
+    step = max(1, CHUNK_ELEMENTS // window)
+    for lo in range(window - 1, n, step):
+        hi = min(lo + step, n)
+        seg = x[lo - window + 1:hi]
+        win = sliding_window_view(seg, window)
+        out["min"][lo:hi] = win.min(axis=1)
+        out["max"][lo:hi] = win.max(axis=1)
+        out["pct_rank"][lo:hi] = np.count_nonzero(win <= seg[window - 1:, None], axis=1) / window
+    out["zscore"][window - 1:] = _zscore(x[window - 1:], out["mean"][window - 1:], out["std"][window - 1:])
+    return out
+
+
+class RollingFeatures:
+    """Streaming rolling_features: O(1) mean/std/min/max/ewma, O(log w) search for pct_rank.
+
+    Mean and variance use the sliding-window form of Welford's update, min and
+    max use monotonic deques of (index, value), and pct_rank keeps the window
+    in a sorted list (bisect to find, then a memmove of at most w floats).
+    """
+
+    def __init__(self, window, alpha=None):
+        if window < 2:
+            raise ValueError("window must be at least 2")
+        self.window = window
+        self.alpha = 2 / (window + 1) if alpha is None else alpha
+        self.values = deque()
+        self.sorted = []
+        self.max_q = deque()
+        self.min_q = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self._since_resync = 0
+
+    def _resync(self):
+        vals = np.fromiter(self.values, dtype=np.float64, count=len(self.values))
+        self.mean = float(vals.mean())
+        self.m2 = float(((vals - self.mean) ** 2).sum())
+        self._since_resync = 0
+
+    def update(self, x):
+        """Adds one value and returns its Features."""
+        x = float(x)
+        i = self.n
+        self.n += 1
+        self.ewma = x if self.ewma is None else self.alpha * x + (1 - self.alpha) * self.ewma
+
+        self.values.append(x)
+        insort(self.sorted, x)
+        while self.max_q and self.max_q[-1][1] <= x:
+            self.max_q.pop()
+        self.max_q.append((i, x))
+        while self.min_q and self.min_q[-1][1] >= x:
+            self.min_q.pop()
+        self.min_q.append((i, x))
+
+        size = len(self.values)
+        if size > self.window:
+            old = self.values.popleft()
+            del self.sorted[bisect_right(self.sorted, old) - 1]
+            new_mean = self.mean + (x - old) / self.window
+            self.m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.mean = new_mean
+            size -= 1
+        else:
+            delta = x - self.mean
+            self.mean += delta / size
+            self.m2 += delta * (x - self.mean)
+        if self.max_q[0][0] <= i - self.window:
+            self.max_q.popleft()
+        if self.min_q[0][0] <= i - self.window:
+            self.min_q.popleft()
+
+        self._since_resync += 1
+        if self._since_resync >= self.window:
+            self._resync()
+
+        if size < self.window:
+            nan = float("nan")
+            return Features(nan, nan, nan, self.ewma, nan, nan, nan)
+        std = (max(self.m2, 0.0) / (size - 1)) ** 0.5
+        z = 0.0 if std <= FLAT_STD_TOL * abs(self.mean) else (x - self.mean) / std
+        rank = bisect_right(self.sorted, x) / size
+        return Features(self.mean, std, z, self.ewma, self.min_q[0][1], self.max_q[0][1], rank)
+
+
+def stream_features(x, window, alpha=None):
+    """Runs RollingFeatures over x; same dict layout as rolling_features."""
+    acc = RollingFeatures(window, alpha)
+    rows = [acc.update(v) for v in np.asarray(x, dtype=np.float64).tolist()]
+    return {k: np.array([r[j] for r in rows], dtype=np.float64) for j, k in enumerate(Features._fields)}
+
+
+def basis_pct(spot, mark):
+    """mark / spot - 1 with the simulate_gemini convention for spot == 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(spot != 0, mark / spot - 1, 0.0)
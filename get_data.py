@@ -1,124 +1,79 @@
-import requests
+import argparse
+
+import numpy as np
 import pandas as pd
-import time
-from datetime import datetime
+
+from dataset_io import fallback_path, write_dataset
+from market_cache import MarketDataCache
+from term_structure import build_index, fetch_quarterlies, save_index
+from validate import repair, summarize
 
 # Config
 START_STR = "2023-01-01 00:00:00"
 END_STR   = "2023-11-28 23:59:59" # Use end of day for clarity
-START_MS = int(pd.Timestamp(START_STR).timestamp() * 1000)
-END_MS   = int(pd.Timestamp(END_STR).timestamp() * 1000)
-LIMIT = 1000 # Max limit for funding rate history
-
-# URLs and Symbols
-FUND_URL     = "https://dapi.binance.com/dapi/v1/fundingRate"
-MARKKL_URL   = "https://dapi.binance.com/dapi/v1/markPriceKlines"
-SPOT_URL     = "https://api.binance.com/api/v3/klines"
+
+# Symbols (endpoint URLs live in async_fetch.py / market_cache.py)
 SYMBOL_PERP  = "BTCUSD_PERP"
 SYMBOL_SPOT  = "BTCUSDT"
 KLINE_INTERVAL = "1h" # Interval for spot and mark price klines
+CACHE_DIR = "data_cache" # Local month-partitioned cache; only missing ranges are downloaded
+OUTPUT_FILE = "coinm_full_data_corrected.parquet" # Needs pyarrow; falls back to CSV without it
+WRITE_CSV = False # Also export the merged frame as CSV
+REPAIR_REPORT = "repair_report.csv" # Issues found by the validation stage
+GRID_MS = None # Funding interval for validation; None infers it from the data
+FETCH_QUARTERLIES = False # Also fetch the BTCUSD_YYMMDD delivery futures
+QUARTERLY_PAIR = "BTCUSD"
+QUARTERLIES_INDEX = "coinm_quarterlies_index.npz" # Term-structure index for term_structure.py
+
+
+def cached_frame(cache, kind, symbol, column, start_ms, end_ms, interval=None):
+    """Reads a series through the local cache, downloading only the ranges it does not hold yet."""
+    rows = cache.get(kind, symbol, start_ms, end_ms, interval)
+    df = pd.DataFrame({"Time": pd.to_datetime(rows["time"], unit="ms"), column: rows["value"]})
+    return df.set_index("Time")
+
+
+def fetch(start=START_STR, end=END_STR, symbol_perp=SYMBOL_PERP, symbol_spot=SYMBOL_SPOT,
+          interval=KLINE_INTERVAL, cache_dir=CACHE_DIR):
+    """Funding, spot and mark series through the cache, merged on fundingTime."""
+    start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+    end_ms = int(pd.Timestamp(end).timestamp() * 1000)
+    cache = MarketDataCache(cache_dir)
+
+    # --- Fetch Funding history (cached, paginated) ---
+    print("Fetching Funding Rate History...")
+    df_fund = cached_frame(cache, "funding", symbol_perp, "fundingRate", start_ms, end_ms).reset_index()
+    df_fund = df_fund.rename(columns={"Time": "fundingTime"})
+    df_fund["symbol"] = symbol_perp
+    df_fund = df_fund[["fundingTime", "symbol", "fundingRate"]]
+    if not df_fund.empty:
+        print(f"Fetched {len(df_fund)} funding rate records.")
+    else:
+        print("No funding rate data fetched.")
+
+    # --- Fetch Spot price (cached, paginated) ---
+    print("\nFetching Spot Klines...")
+    df_spot = cached_frame(cache, "spot", symbol_spot, "spotPrice", start_ms, end_ms, interval)
+    if not df_spot.empty:
+        print(f"Fetched {len(df_spot)} spot klines.")
+    else:
+        print("No spot kline data fetched.")
+
+    # --- Fetch Historical mark-price (cached, paginated) ---
+    # Note: Data likely only available from around 2023-11-01 onwards from this endpoint
+    print("\nFetching Mark Price Klines...")
+    mark_df = cached_frame(cache, "mark", symbol_perp, "markPrice", start_ms, end_ms, interval)
+    if not mark_df.empty:
+        print(f"Fetched {len(mark_df)} mark price klines.")
+    else:
+        print("No mark price kline data fetched.")
+
+    # --- Merge Data ---
+    print("\nMerging data...")
+    if df_fund.empty:
+        print("Funding data is empty, cannot merge.")
+        return pd.DataFrame(columns=["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"])
 
-def fetch_paginated_data(url, params, data_key_time='fundingTime'):
-    """Fetches paginated data from a Binance endpoint."""
-    all_data = []
-    local_params = params.copy() # Avoid modifying the original params dict
-    fetch_start_time = local_params.get("startTime")
-
-    while True:
-        try:
-            print(f"Fetching data starting from: {pd.to_datetime(local_params.get('startTime'), unit='ms')}...")
-            resp = requests.get(url, params=local_params)
-            resp.raise_for_status() # Raise exception for bad status codes (4xx or 5xx)
-            data = resp.json()
-
-            if not data:
-                print("No more data received.")
-                break
-
-            all_data.extend(data)
-            last_record_time = data[-1][data_key_time]
-
-            # Stop if the last record time exceeds the overall end time or if fewer records than limit received
-            if last_record_time >= END_MS or len(data) < local_params.get("limit", LIMIT):
-                 print(f"Finished fetching. Last timestamp: {pd.to_datetime(last_record_time, unit='ms')}")
-                 break
-
-            # Prepare for the next request: start from the timestamp of the last record + 1ms
-            local_params["startTime"] = last_record_time + 1
-            time.sleep(0.3) # Increased sleep slightly
-
-        except requests.exceptions.RequestException as e:
-            print(f"HTTP Request failed: {e}")
-            time.sleep(5) # Wait longer after an error
-            continue # Retry last request
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            break # Exit loop on other errors
-
-    # Filter data to ensure it's within the original START_MS and END_MS range
-    # This is important because the API might return records starting slightly before startTime
-    # and the last batch might contain records after END_MS
-    filtered_data = [d for d in all_data if fetch_start_time <= d[data_key_time] <= END_MS]
-    return filtered_data
-
-
-def fetch_klines(url, symbol, interval="1h", kline_start_time=START_MS, kline_end_time=END_MS):
-    """Modified fetch_klines using the paginated helper."""
-    params = {"symbol": symbol, "interval": interval, "startTime": kline_start_time, "endTime": kline_end_time, "limit": LIMIT}
-    # Klines endpoint returns list of lists, time is the first element (index 0)
-    klines_data = fetch_paginated_data(url, params, data_key_time=0)
-    return pd.DataFrame(klines_data)
-
-
-# --- Fetch Funding history (Paginated) ---
-print("Fetching Funding Rate History...")
-fund_params = {"symbol": SYMBOL_PERP, "startTime": START_MS, "endTime": END_MS, "limit": LIMIT}
-fund_data = fetch_paginated_data(FUND_URL, fund_params, data_key_time='fundingTime')
-df_fund = pd.DataFrame(fund_data)
-if not df_fund.empty:
-    df_fund["fundingTime"] = pd.to_datetime(df_fund["fundingTime"], unit="ms")
-    df_fund = df_fund[["fundingTime", "symbol", "fundingRate"]] # Select desired columns
-    print(f"Fetched {len(df_fund)} funding rate records.")
-else:
-    print("No funding rate data fetched.")
-    # Handle case where no data is returned, maybe exit or create empty df
-    df_fund = pd.DataFrame(columns=["fundingTime", "symbol", "fundingRate"])
-
-
-# --- Fetch Spot price (Paginated) ---
-print("\nFetching Spot Klines...")
-df_spot = fetch_klines(SPOT_URL, SYMBOL_SPOT, KLINE_INTERVAL)
-if not df_spot.empty:
-    # Keep Open time [0] and Close Price [4]
-    df_spot = df_spot[[0, 4]].rename(columns={0: "Open time", 4: "spotPrice"})
-    df_spot["Time"] = pd.to_datetime(df_spot["Open time"], unit="ms")
-    df_spot = df_spot.set_index("Time")[["spotPrice"]].astype(float) # Convert price to float
-    print(f"Fetched {len(df_spot)} spot klines.")
-else:
-    print("No spot kline data fetched.")
-    df_spot = pd.DataFrame(columns=["spotPrice"]) # Empty df with correct column
-
-
-# --- Fetch Historical mark-price (Paginated) ---
-# Note: Data likely only available from around 2023-11-01 onwards from this endpoint
-print("\nFetching Mark Price Klines...")
-mark_df = fetch_klines(MARKKL_URL, SYMBOL_PERP, KLINE_INTERVAL)
-if not mark_df.empty:
-    # Keep Open time [0] and Close Price [4]
-    mark_df = mark_df[[0, 4]].rename(columns={0: "Open time", 4: "markPrice"})
-    mark_df["Time"] = pd.to_datetime(mark_df["Open time"], unit="ms")
-    mark_df = mark_df.set_index("Time")[["markPrice"]].astype(float) # Convert price to float
-    print(f"Fetched {len(mark_df)} mark price klines.")
-else:
-    print("No mark price kline data fetched.")
-    mark_df = pd.DataFrame(columns=["markPrice"]) # Empty df with correct column
-
-# --- Merge Data ---
-print("\nMerging data...")
-if df_fund.empty:
-    print("Funding data is empty, cannot merge.")
-    merged = pd.DataFrame(columns=["fundingTime", "symbol", "fundingRate", "spotPrice", "markPrice"])
-else:
     # Set fundingTime as index for joining
     merged = df_fund.set_index("fundingTime")
 
@@ -135,18 +90,83 @@ else:
     merged = merged.reset_index()
 
     # Reorder columns for desired output
-    merged = merged[["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"]]
-
-# --- Final Output ---
-# Mark price before ~2023-11-01 will be NaN because the data wasn't available from the kline endpoint
-# The incorrect filling loop has been removed.
-
-print("\nSample of merged data:")
-print(merged.head())
-print("\nCheck for NaN values in markPrice (expected before Nov 2023):")
-print(merged.isnull().sum())
-
-# Export
-output_filename = "coinm_full_data_corrected.csv"
-merged.to_csv(output_filename, index=False, date_format='%Y-%m-%d %H:%M:%S.%f') # Ensure milliseconds are saved if needed
-print(f"\n✅ Saved {len(merged)} rows to {output_filename}")
\ No newline at end of file
+    return merged[["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"]]
+
+
+def fetch_term_structure(merged, start=START_STR, end=END_STR, interval=KLINE_INTERVAL, cache_dir=CACHE_DIR,
+                         pair=QUARTERLY_PAIR):
+    """Mark klines of every quarterly in range (cached), indexed on the merged funding grid."""
+    start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+    end_ms = int(pd.Timestamp(end).timestamp() * 1000)
+    quarterlies = fetch_quarterlies(MarketDataCache(cache_dir), start_ms, end_ms, interval, pair)
+    grid_ms = merged["fundingTime"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    return build_index(grid_ms, merged["spotPrice"].to_numpy(), merged["fundingRate"].to_numpy(),
+                       merged["markPrice"].to_numpy(), quarterlies)
+
+
+def run(start=START_STR, end=END_STR, output_file=OUTPUT_FILE, write_csv=WRITE_CSV, quarterlies=FETCH_QUARTERLIES,
+        index_file=QUARTERLIES_INDEX, grid_ms=GRID_MS, **kwargs):
+    # Checked before downloading so a missing pyarrow can't fail the final write
+    target = fallback_path(output_file)
+    if target != output_file:
+        print(f"⚠️ pyarrow is not installed (pip install pyarrow): writing {target} instead of {output_file}")
+        output_file, write_csv = target, False
+    merged = fetch(start, end, **kwargs)
+
+    # --- Validate: snap to the funding grid, null outlier/stale prices, report everything ---
+    print("\nValidating data...")
+    merged, report = repair(merged, grid_ms=grid_ms)
+    report.to_csv(REPAIR_REPORT, index=False)
+    print(summarize(report).to_string())
+    print(f"{len(report)} issues written to {REPAIR_REPORT}")
+
+    # --- Final Output ---
+    # Mark price before ~2023-11-01 will be NaN because the data wasn't available from the kline endpoint
+    # The incorrect filling loop has been removed.
+
+    print("\nSample of merged data:")
+    print(merged.head())
+    print("\nCheck for NaN values in markPrice (expected before Nov 2023):")
+    print(merged.isnull().sum())
+
+    # Export: typed, compressed Parquet (memory-mapped by the simulations); CSV is optional
+    write_dataset(merged, output_file)
+    print(f"\n✅ Saved {len(merged)} rows to {output_file}")
+    if write_csv:
+        csv_filename = output_file.rsplit(".", 1)[0] + ".csv"
+        write_dataset(merged, csv_filename) # Ensure milliseconds are saved if needed
+        print(f"✅ Saved {len(merged)} rows to {csv_filename}")
+
+    # --- Quarterly term structure (optional) ---
+    if quarterlies:
+        print("\nFetching quarterly term structure...")
+        index = fetch_term_structure(merged, start, end, kwargs.get("interval", KLINE_INTERVAL),
+                                     kwargs.get("cache_dir", CACHE_DIR))
+        save_index(index, index_file)
+        print(f"✅ Saved {len(index['symbols'])} quarterlies x {len(merged)} rows to {index_file}")
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch funding/spot/mark through the local cache and merge them.")
+    parser.add_argument("--start", default=START_STR)
+    parser.add_argument("--end", default=END_STR)
+    parser.add_argument("--symbol-perp", default=SYMBOL_PERP)
+    parser.add_argument("--symbol-spot", default=SYMBOL_SPOT)
+    parser.add_argument("--interval", default=KLINE_INTERVAL)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--csv", action="store_true", default=WRITE_CSV, help="also export the merged frame as CSV")
+    parser.add_argument("--quarterlies", action="store_true", default=FETCH_QUARTERLIES,
+                        help="also fetch the quarterly term structure and write its index")
+    parser.add_argument("--quarterlies-index", default=QUARTERLIES_INDEX)
+    parser.add_argument("--grid-ms", type=int, default=GRID_MS,
+                        help="funding interval in ms for validation (default: inferred)")
+    args = parser.parse_args(argv)
+    run(args.start, args.end, args.output, args.csv, args.quarterlies, args.quarterlies_index, args.grid_ms,
+        symbol_perp=args.symbol_perp,
+        symbol_spot=args.symbol_spot, interval=args.interval, cache_dir=args.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
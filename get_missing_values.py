@@ -1,59 +1,134 @@
-import pandas as pd
-import requests
+import argparse
 import time
-from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import metrics
 
 # --- Parámetros ---
 CSV_PATH = "coinm_full_data_2024.csv"
 OUTPUT_PATH = "coinm_full_data_2024_filled.csv"
 SYMBOL = "BTCUSDT"
 MAX_OFFSET_SECONDS = 300  # máximo buscar hasta 5 minutos (60*5)
+KLINES_URL = "https://api.binance.com/api/v3/klines"
+WINDOW_LIMIT = 1000  # velas de 1s por request (máximo de la API)
+WINDOW_MS = WINDOW_LIMIT * 1000
+
 
-# --- Función para obtener el precio spot más cercano ---
-def get_spot_price_nearest(timestamp_ms):
+# --- Agrupar gaps en ventanas compartidas ---
+def group_gaps(gap_ms):
     """
-    Dado un timestamp en milisegundos, intenta obtener el precio spot más cercano
-    desde la API de Binance con incrementos de 5 segundos.
+    Agrupa timestamps (ms, ordenados) en ventanas de WINDOW_LIMIT velas de 1s.
+    Un gap entra en la ventana actual si su búsqueda completa
+    [ts, ts + MAX_OFFSET_SECONDS] cabe dentro de la ventana.
+    Devuelve una lista de (inicio_ventana, array_de_gaps).
     """
-    base_url = "https://api.binance.com/api/v3/klines"
-    interval = "1s"  # granularidad máxima permitida
-
-    for offset in range(0, MAX_OFFSET_SECONDS + 1, 5):
-        try_ts = timestamp_ms + (offset * 1000)
-        params = {
-            "symbol": SYMBOL,
-            "interval": "1s",
-            "startTime": try_ts,
-            "limit": 1
-        }
-        response = requests.get(base_url, params=params)
-        data = response.json()
-
-        if isinstance(data, list) and len(data) > 0:
-            price = float(data[0][4])  # precio de cierre
-            found_time = pd.to_datetime(data[0][0], unit='ms')
-            return price, found_time
-    return None, None
-
-# --- Cargar el CSV ---
-df = pd.read_csv(CSV_PATH, parse_dates=["fundingTime"])
-
-# --- Llenar valores vacíos ---
-filled_count = 0
-
-for idx, row in df.iterrows():
-    if pd.isna(row["spotPrice"]):
-        ts = int(row["fundingTime"].timestamp() * 1000)
-        price, found_time = get_spot_price_nearest(ts)
-        if price:
-            df.at[idx, "spotPrice"] = price
-            print(f"✅ Fecha buscada: {row['fundingTime']} | Encontrada: {found_time} | Spot Price: {price}")
-            filled_count += 1
+    windows = []
+    if len(gap_ms) == 0:
+        return windows
+    start = gap_ms[0]
+    first = 0
+    for k in range(1, len(gap_ms)):
+        if gap_ms[k] + MAX_OFFSET_SECONDS * 1000 >= start + WINDOW_MS:
+            windows.append((start, gap_ms[first:k]))
+            start = gap_ms[k]
+            first = k
+    windows.append((start, gap_ms[first:]))
+    return windows
+
+
+# --- Una request de 1000 velas de 1s por ventana ---
+def fetch_window(start_ms):
+    params = {
+        "symbol": SYMBOL,
+        "interval": "1s",
+        "startTime": int(start_ms),
+        "endTime": int(start_ms + WINDOW_MS - 1),
+        "limit": WINDOW_LIMIT,
+    }
+    import requests
+
+    with metrics.stage("http.spot_1s"):
+        response = requests.get(KLINES_URL, params=params)
+    metrics.count("http.requests")
+    metrics.count("http.bytes", len(response.content))
+    data = response.json()
+    if not isinstance(data, list) or not data:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    open_times = np.fromiter((k[0] for k in data), dtype=np.int64, count=len(data))
+    closes = np.fromiter((float(k[4]) for k in data), dtype=np.float64, count=len(data))
+    return open_times, closes
+
+
+# --- Resolver cada gap en memoria: primera vela con open time >= ts ---
+def resolve_gaps(gaps, open_times, closes):
+    pos = np.searchsorted(open_times, gaps, side="left")
+    found = pos < len(open_times)
+    pos = np.minimum(pos, max(len(open_times) - 1, 0))
+    if len(open_times):
+        found &= (open_times[pos] - gaps) <= MAX_OFFSET_SECONDS * 1000
+        prices = np.where(found, closes[pos], np.nan)
+        found_times = np.where(found, open_times[pos], -1)
+    else:
+        prices = np.full(len(gaps), np.nan)
+        found_times = np.full(len(gaps), -1)
+    return prices, found_times
+
+
+def fill(csv_path=CSV_PATH, output_path=OUTPUT_PATH):
+    """Completa los spotPrice vacíos con la primera vela de 1s en los MAX_OFFSET_SECONDS siguientes."""
+    # --- Cargar el CSV ---
+    df = pd.read_csv(csv_path, parse_dates=["fundingTime"])
+
+    # --- Llenar valores vacíos ---
+    missing = df["spotPrice"].isna().to_numpy()
+    gap_idx = np.flatnonzero(missing)
+    gap_ms = df["fundingTime"].to_numpy()[gap_idx].astype("datetime64[ms]").astype(np.int64)
+    order = np.argsort(gap_ms, kind="stable")
+    gap_idx = gap_idx[order]
+    gap_ms = gap_ms[order]
+
+    print(f"🔎 Spot prices faltantes: {len(gap_idx)}")
+    windows = group_gaps(gap_ms)
+    print(f"🪟 Ventanas a consultar: {len(windows)}")
+
+    prices = np.full(len(gap_ms), np.nan)
+    found_times = np.full(len(gap_ms), -1, dtype=np.int64)
+    done = 0
+    for w, (start_ms, gaps) in enumerate(windows):
+        open_times, closes = fetch_window(start_ms)
+        p, ft = resolve_gaps(gaps, open_times, closes)
+        prices[done:done + len(gaps)] = p
+        found_times[done:done + len(gaps)] = ft
+        done += len(gaps)
+        if w < len(windows) - 1:
+            with metrics.stage("sleep"):
+                time.sleep(0.25)  # respetar rate limits
+
+    filled = ~np.isnan(prices)
+    df.loc[df.index[gap_idx[filled]], "spotPrice"] = prices[filled]
+
+    for ts, price, ft in zip(gap_ms, prices, found_times):
+        if ft >= 0:
+            print(f"✅ Fecha buscada: {pd.to_datetime(ts, unit='ms')} | Encontrada: {pd.to_datetime(ft, unit='ms')} | Spot Price: {price}")
         else:
-            print(f"❌ No se pudo encontrar spot para {row['fundingTime']}")
+            print(f"❌ No se pudo encontrar spot para {pd.to_datetime(ts, unit='ms')}")
+
+    filled_count = int(filled.sum())
+    print(f"\n🟢 Spot prices completados: {filled_count}")
+    df.to_csv(output_path, index=False)
+    print(f"📁 Archivo guardado como: {output_path}")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rellena spotPrice faltantes con velas de 1s de Binance.")
+    parser.add_argument("--input", default=CSV_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+    fill(args.input, args.output)
 
-        time.sleep(0.25)  # respetar rate limits
 
-print(f"\n🟢 Spot prices completados: {filled_count}")
-df.to_csv(OUTPUT_PATH, index=False)
-print(f"📁 Archivo guardado como: {OUTPUT_PATH}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
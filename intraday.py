@@ -0,0 +1,216 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import annualized_return, max_drawdown
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from get_data import CACHE_DIR, SYMBOL_PERP, SYMBOL_SPOT
+
+# Intra-interval resolution for the carry strategy.
+# get_data.py samples spot and mark only at the 8-hourly fundingTime, so exits
+# can only happen on those stamps. This stage keeps 1m (or 1s) spot and mark
+# bars as flat arrays (int64 ms times + float64 closes, saved as .npz) and
+# cuts them into one segment per funding interval with a single searchsorted.
+#
+# The funding schedule still drives funding accrual and entries, and the
+# funding-rate exit is checked at funding times. While a position is open,
+# the basis exit and an optional stop-loss are evaluated on every bar of the
+# following interval with one vectorized scan of that segment, so the total
+# work stays linear in the number of bars.
+#
+# The bars come from the market-data cache (market_cache.py), either ahead of
+# time with build_bars or in the same run with --fetch:
+#
+#   python intraday.py coinm_full_data_2024.csv bars_2024.npz --fetch
+#   python intraday.py coinm_full_data_2024.csv bars_2024.npz --stop-loss 0.01
+
+BAR_INTERVAL = "1m"
+EXIT_FUNDING = 1
+EXIT_BASIS = 2
+EXIT_STOP = 3
+
+
+def load_minute_bars(cache, symbol_perp, symbol_spot, start_ms, end_ms, interval="1m"):
+    """Spot and mark closes on the spot bar times, through the market-data cache."""
+    spot = cache.get("spot", symbol_spot, start_ms, end_ms, interval)
+    mark = cache.get("mark", symbol_perp, start_ms, end_ms, interval)
+    return align_bars(spot["time"].to_numpy(), spot["value"].to_numpy(),
+                      mark["time"].to_numpy(), mark["value"].to_numpy())
+
+
+def align_bars(spot_times, spot_close, mark_times, mark_close):
+    """Backward as-of join of the mark closes onto the spot bar times."""
+    spot_times = np.asarray(spot_times, dtype=np.int64)
+    mark_times = np.asarray(mark_times, dtype=np.int64)
+    pos = np.searchsorted(mark_times, spot_times, side="right") - 1
+    ok = pos >= 0
+    return {
+        "time": spot_times[ok],
+        "spot": np.asarray(spot_close, dtype=np.float64)[ok],
+        "mark": np.asarray(mark_close, dtype=np.float64)[pos[ok]],
+    }
+
+
+def save_bars(bars, path):
+    np.savez(path, time=bars["time"], spot=bars["spot"], mark=bars["mark"])
+
+
+def load_bars(path):
+    with np.load(path) as f:
+        return {"time": f["time"], "spot": f["spot"], "mark": f["mark"]}
+
+
+def build_bars(funding_ms, path, symbol_perp=SYMBOL_PERP, symbol_spot=SYMBOL_SPOT, interval=BAR_INTERVAL,
+               cache_dir=CACHE_DIR):
+    """Fetches (through the cache) and saves the bars from the first funding event to one interval past the last."""
+    from market_cache import MarketDataCache
+    from validate import infer_grid
+
+    start = int(funding_ms[0])
+    end = int(funding_ms[-1]) + infer_grid(funding_ms) - 1
+    bars = load_minute_bars(MarketDataCache(cache_dir), symbol_perp, symbol_spot, start, end, interval)
+    save_bars(bars, path)
+    return bars
+
+
+def segment_bounds(funding_ms, bar_times):
+    """For funding event i, bars (funding_ms[i], funding_ms[i+1]) are bar_times[lo[i]:hi[i]].
+
+    Also returns the as-of bar index at each funding time (-1 if none).
+    """
+    asof = np.searchsorted(bar_times, funding_ms, side="right") - 1
+    lo = asof + 1
+    hi = np.append(np.searchsorted(bar_times, funding_ms[1:], side="left"), len(bar_times))
+    return asof, lo, np.maximum(hi, lo)
+
+
+def simulate_gemini_intraday(funding_ms, rate, bars, initial_cash=1000.0, capital_allocation_pct=0.95,
+                             spot_fee_rate=0.001, futures_fee_rate=0.0005, min_trade_size_btc=0.0001,
+                             min_fr_entry=0.0001, basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005,
+                             stop_loss=None):
+    """simulation_gemini.py rules with minute-level basis exits and an optional stop-loss.
+
+    stop_loss is a fraction of the entry notional: the trade is closed on the
+    first bar where the basis PnL, (spot - mark) - (entry_spot - entry_mark),
+    falls below -stop_loss * entry_spot per coin.
+    """
+    bar_t, bar_s, bar_m = bars["time"], bars["spot"], bars["mark"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bar_basis_pct = bar_m / bar_s - 1
+    bar_spread = bar_s - bar_m
+    asof, lo, hi = segment_bounds(np.asarray(funding_ms, dtype=np.int64), bar_t)
+    rate_l = np.asarray(rate, dtype=np.float64).tolist()
+    n = len(rate_l)
+
+    equity = np.full(n, np.nan)
+    trades = []
+
+    cash = initial_cash
+    in_position = False
+    btc_spot = btc_funding = position_size = entry_cost = 0.0
+    entry_spot = entry_mark = 0.0
+    entry_time = None
+
+    def close(k, reason):
+        nonlocal cash, in_position, btc_spot, btc_funding, position_size, entry_cost
+        s, m = bar_s[k], bar_m[k]
+        total_btc = btc_spot + btc_funding
+        futures_fee = position_size * m * futures_fee_rate
+        cash += total_btc * s * (1 - spot_fee_rate) - futures_fee
+        trades.append({
+            "entry_time": entry_time,
+            "exit_time": int(bar_t[k]),
+            "exit_reason": reason,
+            "size": position_size,
+            "entry_spot": entry_spot,
+            "entry_mark": entry_mark,
+            "exit_spot": s,
+            "exit_mark": m,
+            "funding_btc": btc_funding,
+            "basis_pnl": position_size * ((s - m) - (entry_spot - entry_mark)),
+            "costs": entry_cost + total_btc * s * spot_fee_rate + futures_fee,
+            "cash_after": cash,
+        })
+        btc_spot = btc_funding = position_size = entry_cost = 0.0
+        in_position = False
+
+    for i in range(n):
+        k = asof[i]
+        if k < 0:
+            continue
+        s, m, fr = bar_s[k], bar_m[k], rate_l[i]
+        basis_pct = bar_basis_pct[k]
+        equity[i] = cash + (btc_spot + btc_funding) * s
+
+        if in_position:
+            btc_funding += position_size * fr
+            if fr <= fr_exit:
+                close(k, EXIT_FUNDING)
+            elif basis_pct < basis_exit:
+                close(k, EXIT_BASIS)
+        elif fr > min_fr_entry and basis_pct > basis_entry:
+            potential_btc = cash * capital_allocation_pct / s
+            if potential_btc >= min_trade_size_btc:
+                spot_cost = potential_btc * s
+                futures_fee = potential_btc * m * futures_fee_rate
+                cost = spot_cost * spot_fee_rate + futures_fee
+                if cash >= spot_cost + cost:
+                    cash -= spot_cost + cost
+                    in_position = True
+                    btc_spot = position_size = potential_btc
+                    btc_funding = 0.0
+                    entry_cost = cost
+                    entry_spot, entry_mark = s, m
+                    entry_time = int(bar_t[k])
+
+        # Scan the bars up to the next funding event for a basis exit / stop-loss
+        if in_position and hi[i] > lo[i]:
+            seg = slice(lo[i], hi[i])
+            hit = bar_basis_pct[seg] < basis_exit
+            if stop_loss is not None:
+                hit_stop = (bar_spread[seg] - (entry_spot - entry_mark)) < -stop_loss * entry_spot
+                hit = hit | hit_stop
+            if hit.any():
+                j = int(np.argmax(hit))
+                reason = EXIT_STOP if stop_loss is not None and hit_stop[j] else EXIT_BASIS
+                close(lo[i] + j, reason)
+
+    end_equity = cash + (btc_spot + btc_funding) * (bar_s[-1] if len(bar_s) else 0.0)
+    return {"equity": equity, "trades": pd.DataFrame(trades), "end_equity": end_equity}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carry backtest with minute-level exits.")
+    parser.add_argument("funding", help="merged funding dataset (CSV/Parquet/Arrow)")
+    parser.add_argument("bars", help=".npz with time/spot/mark minute bars (see save_bars)")
+    parser.add_argument("--fetch", action="store_true", help="build the bars file from the market-data cache first")
+    parser.add_argument("--symbol-perp", default=SYMBOL_PERP)
+    parser.add_argument("--symbol-spot", default=SYMBOL_SPOT)
+    parser.add_argument("--interval", default=BAR_INTERVAL, help="bar interval for --fetch, e.g. 1m")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--stop-loss", type=float, default=None)
+    parser.add_argument("--output", default="intraday_trades.csv")
+    args = parser.parse_args(argv)
+
+    df = read_dataset(args.funding, columns=FEATURE_COLUMNS).sort_values("fundingTime")
+    funding_ms = df["fundingTime"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    if args.fetch:
+        bars = build_bars(funding_ms, args.bars, args.symbol_perp, args.symbol_spot, args.interval, args.cache_dir)
+        print(f"✅ {len(bars['time'])} barras guardadas en: {args.bars}")
+    else:
+        bars = load_bars(args.bars)
+    res = simulate_gemini_intraday(funding_ms, df["fundingRate"].to_numpy(), bars, stop_loss=args.stop_loss)
+
+    days = (funding_ms[-1] - funding_ms[0]) / 86_400_000 if len(funding_ms) else 0
+    trades = res["trades"]
+    trades.to_csv(args.output, index=False)
+    print(f"End equity: ${res['end_equity']:.2f}")
+    print(f"APY: {annualized_return(res['end_equity'], 1000.0, days) * 100:.2f}%")
+    print(f"Max drawdown: {max_drawdown(res['equity'][~np.isnan(res['equity'])]) * 100:.2f}%")
+    print(f"Trades: {len(trades)}")
+    print(f"✅ Trades guardados en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
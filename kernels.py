@@ -0,0 +1,282 @@
+import os
+
+import numpy as np
+
+from backtest_engine import (
+    ACTION_CLOSE,
+    ACTION_NONE,
+    ACTION_OPEN,
+    ACTION_TRADE_MARK_GT_SPOT,
+    ACTION_TRADE_SPOT_GT_MARK,
+    TRADE_DTYPE,
+)
+
+# Compiled versions of the sequential state machines in backtest_engine.py
+# (simulate_gemini, simulate_basis_hold) and monte_carlo.py
+# (simulate_gemini_batch).
+#
+# The loops below are the same statements in the same order as the Python
+# ones, on contiguous float64 arrays, so the compiled results are
+# bit-identical: Numba compiles without fastmath and LLVM doesn't contract
+# a * b + c into FMAs unless told to. The Python versions stay the
+# fallback and the reference.
+#
+# Numba is optional. Without it, or with CASH_CARRY_JIT=0, ENABLED is False
+# and the callers keep their pure-Python loops. Compiled code is cached in
+# __pycache__ (cache=True), so only the first run on a machine pays the
+# compile; pool workers load the cached code.
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENABLED = numba is not None and os.environ.get("CASH_CARRY_JIT", "1") != "0"
+
+
+def _jit(func):
+    return numba.njit(cache=True, nogil=True)(func) if numba is not None else func
+
+
+@_jit
+def _gemini_loop(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct, spot_fee_rate,
+                 futures_fee_rate, min_trade_size_btc, action_out, equity_out, cash_out, btc_out,
+                 funding_pnl_out, basis_pnl_out, costs_out, trades):
+    n = len(rate)
+    n_trades = 0
+    cash = initial_cash
+    btc_spot = 0.0
+    btc_funding = 0.0
+    in_position = False
+    entry_spot = 0.0
+    entry_mark = 0.0
+    position_size = 0.0
+    entry_cost = 0.0
+
+    for i in range(n):
+        spot_i = spot[i]
+        mark_i = mark[i]
+        equity_out[i] = cash + (btc_spot + btc_funding) * spot_i
+
+        if in_position:
+            funding_btc = position_size * rate[i]
+            btc_funding += funding_btc
+            funding_pnl_out[i] = funding_btc * spot_i
+
+            if exit_[i]:
+                action_out[i] = ACTION_CLOSE
+                total_btc_to_sell = btc_spot + btc_funding
+                proceeds = total_btc_to_sell * spot_i * (1 - spot_fee_rate)
+                futures_fee = position_size * mark_i * futures_fee_rate
+                cash += proceeds - futures_fee
+                costs_out[i] = entry_cost + (total_btc_to_sell * spot_i * spot_fee_rate) + futures_fee
+
+                basis_move = (spot_i - mark_i) - (entry_spot - entry_mark)
+                basis_pnl_out[i] = position_size * basis_move
+                trades[n_trades, 0] = i
+                trades[n_trades, 1] = ACTION_CLOSE
+                trades[n_trades, 2] = position_size
+                trades[n_trades, 3] = spot_i
+                trades[n_trades, 4] = mark_i
+                trades[n_trades, 5] = entry_spot
+                trades[n_trades, 6] = entry_mark
+                trades[n_trades, 7] = btc_funding
+                trades[n_trades, 8] = basis_move
+                trades[n_trades, 9] = costs_out[i]
+                n_trades += 1
+
+                btc_spot = 0.0
+                btc_funding = 0.0
+                in_position = False
+                position_size = 0.0
+                entry_cost = 0.0
+
+        elif enter[i]:
+            potential_btc = cash * capital_allocation_pct / spot_i
+            if potential_btc >= min_trade_size_btc:
+                entry_spot = spot_i
+                entry_mark = mark_i
+                position_size = potential_btc
+                spot_cost = position_size * spot_i
+                futures_fee = position_size * mark_i * futures_fee_rate
+                entry_cost = spot_cost * spot_fee_rate + futures_fee
+                total_needed = spot_cost + entry_cost
+
+                if cash >= total_needed:
+                    action_out[i] = ACTION_OPEN
+                    cash -= total_needed
+                    btc_spot = position_size
+                    btc_funding = 0.0
+                    in_position = True
+                    trades[n_trades, 0] = i
+                    trades[n_trades, 1] = ACTION_OPEN
+                    trades[n_trades, 2] = position_size
+                    trades[n_trades, 3] = spot_i
+                    trades[n_trades, 4] = mark_i
+                    trades[n_trades, 5] = entry_spot
+                    trades[n_trades, 6] = entry_mark
+                    trades[n_trades, 7] = 0.0
+                    trades[n_trades, 8] = 0.0
+                    trades[n_trades, 9] = entry_cost
+                    n_trades += 1
+
+        cash_out[i] = cash
+        btc_out[i] = btc_spot + btc_funding
+    return n_trades
+
+
+def gemini(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct, spot_fee_rate,
+           futures_fee_rate, min_trade_size_btc):
+    """simulate_gemini's loop on precomputed enter / exit masks; same output dict."""
+    n = len(rate)
+    out = {
+        "action": np.zeros(n, dtype=np.int8),
+        "equity": np.empty(n),
+        "cash": np.empty(n),
+        "btc": np.empty(n),
+        "funding_pnl": np.zeros(n),
+        "basis_pnl": np.zeros(n),
+        "costs": np.zeros(n),
+    }
+    trades = np.empty((n, 10))
+    k = _gemini_loop(
+        np.ascontiguousarray(rate, dtype=np.float64), np.ascontiguousarray(spot, dtype=np.float64),
+        np.ascontiguousarray(mark, dtype=np.float64), np.ascontiguousarray(enter, dtype=np.bool_),
+        np.ascontiguousarray(exit_, dtype=np.bool_), float(initial_cash), float(capital_allocation_pct),
+        float(spot_fee_rate), float(futures_fee_rate), float(min_trade_size_btc),
+        out["action"], out["equity"], out["cash"], out["btc"], out["funding_pnl"], out["basis_pnl"],
+        out["costs"], trades)
+    table = np.empty(k, dtype=TRADE_DTYPE)
+    for col, name in enumerate(TRADE_DTYPE.names):
+        table[name] = trades[:k, col]
+    out["trades"] = table
+    return out
+
+
+@_jit
+def _basis_hold_loop(rate, spot, mark, basis_pct, valid, signal, initial_cash, hold_steps, spot_fee, perp_fee,
+                     idx_out, action_out, pnl_out, cash_out):
+    n = len(rate)
+    k = 0
+    cash = initial_cash
+    i = 0
+    while i < n - hold_steps:
+        pnl = 0.0
+        action = ACTION_NONE
+        if not valid[i]:
+            i += 1
+            continue
+
+        if signal[i]:
+            j = i + hold_steps
+            if not valid[j]:
+                i += 1
+                continue
+            spot_entry = spot[i]
+            mark_entry = mark[i]
+            spot_exit = spot[j]
+            mark_exit = mark[j]
+            spot_gt_mark = basis_pct[i] > 0
+
+            notional = cash
+            cash -= notional * spot_fee + notional * perp_fee
+
+            size = notional / spot_entry if spot_gt_mark else notional / mark_entry
+            if not size > 0:
+                i += 1
+                continue
+
+            if spot_gt_mark:
+                spot_pnl = (spot_exit - spot_entry) * size
+                perp_pnl = (mark_entry - mark_exit) * size
+                funding_px = mark_entry
+            else:
+                spot_pnl = (spot_entry - spot_exit) * size
+                perp_pnl = (mark_exit - mark_entry) * size
+                funding_px = spot_entry
+
+            funding_pnl = 0.0
+            for r in rate[i + 1:j + 1]:
+                if r == r:
+                    funding_pnl += r * size * funding_px
+
+            close_notional = size * (spot_exit + mark_exit) / 2
+            pnl = (spot_pnl + perp_pnl + funding_pnl
+                   - close_notional * spot_fee - close_notional * perp_fee)
+            cash += pnl
+            action = ACTION_TRADE_SPOT_GT_MARK if spot_gt_mark else ACTION_TRADE_MARK_GT_SPOT
+            idx_out[k] = i
+            i += hold_steps
+        else:
+            idx_out[k] = i
+            i += 1
+
+        action_out[k] = action
+        pnl_out[k] = pnl
+        cash_out[k] = cash
+        k += 1
+    return k
+
+
+def basis_hold(rate, spot, mark, basis_pct, valid, signal, initial_cash, hold_steps, spot_fee, perp_fee):
+    """simulate_basis_hold's loop; returns (index, action, pnl, cash) of the recorded rows."""
+    n = len(rate)
+    idx = np.empty(n, dtype=np.int64)
+    action = np.empty(n, dtype=np.int8)
+    pnl = np.empty(n)
+    cash = np.empty(n)
+    k = _basis_hold_loop(
+        np.ascontiguousarray(rate, dtype=np.float64), np.ascontiguousarray(spot, dtype=np.float64),
+        np.ascontiguousarray(mark, dtype=np.float64), np.ascontiguousarray(basis_pct, dtype=np.float64),
+        np.ascontiguousarray(valid, dtype=np.bool_), np.ascontiguousarray(signal, dtype=np.bool_),
+        float(initial_cash), int(hold_steps), float(spot_fee), float(perp_fee), idx, action, pnl, cash)
+    return idx[:k], action[:k], pnl[:k], cash[:k]
+
+
+@_jit
+def _gemini_paths_loop(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct, spot_fee_rate,
+                       futures_fee_rate, min_trade_size_btc, equity_out, holding_out):
+    T, P = rate.shape
+    for p in range(P):
+        cash = initial_cash
+        btc_spot = 0.0
+        btc_funding = 0.0
+        size = 0.0
+        in_pos = False
+        for t in range(T):
+            s = spot[t, p]
+            m = mark[t, p]
+            if in_pos:
+                btc_funding += size * rate[t, p]
+                if exit_[t, p]:
+                    total = btc_spot + btc_funding
+                    cash += total * s * (1 - spot_fee_rate) - size * m * futures_fee_rate
+                    btc_spot = 0.0
+                    btc_funding = 0.0
+                    size = 0.0
+                    in_pos = False
+            elif enter[t, p]:
+                pot = cash * capital_allocation_pct / s
+                spot_cost = pot * s
+                needed = spot_cost + (spot_cost * spot_fee_rate + pot * m * futures_fee_rate)
+                if pot >= min_trade_size_btc and cash >= needed:
+                    cash -= needed
+                    btc_spot = pot
+                    size = pot
+                    btc_funding = 0.0
+                    in_pos = True
+            equity_out[t, p] = cash + (btc_spot + btc_funding) * s
+            holding_out[t, p] = in_pos
+
+
+def gemini_paths(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct, spot_fee_rate,
+                 futures_fee_rate, min_trade_size_btc):
+    """monte_carlo.simulate_gemini_batch one path at a time; returns (equity, holding), both (T, P)."""
+    equity = np.empty(rate.shape)
+    holding = np.empty(rate.shape, dtype=np.bool_)
+    _gemini_paths_loop(
+        np.ascontiguousarray(rate, dtype=np.float64), np.ascontiguousarray(spot, dtype=np.float64),
+        np.ascontiguousarray(mark, dtype=np.float64), np.ascontiguousarray(enter, dtype=np.bool_),
+        np.ascontiguousarray(exit_, dtype=np.bool_), float(initial_cash), float(capital_allocation_pct),
+        float(spot_fee_rate), float(futures_fee_rate), float(min_trade_size_btc), equity, holding)
+    return equity, holding
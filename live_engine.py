@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import namedtuple
+
+from async_fetch import BACKOFF_BASE, BACKOFF_MAX, MAX_RETRIES
+from dataset_io import FEATURE_COLUMNS, read_dataset
+
+# Streaming version of the simulation_gemini.py strategy.
+# CarryStrategy holds the same entry/exit state machine as
+# backtest_engine.simulate_gemini but is fed one event at a time with O(1)
+# work per event: price ticks only update the latest spot/mark, and each
+# funding event runs one step of the state machine on those prices.
+#
+# Tick sources are async iterators of Event. ReplaySource replays the cached
+# CSV/Parquet files (used in tests and for dry runs); BinanceWebsocketSource
+# listens to the COIN-M mark-price stream and the spot kline stream. Dropped
+# connections are re-opened with the same capped exponential backoff as
+# async_fetch.py; a stream that runs out of retries ends the iteration with
+# its error instead of leaving the consumer waiting on an empty queue.
+
+Event = namedtuple("Event", ["kind", "ts", "value"])  # kind: "mark" | "spot" | "funding"
+Decision = namedtuple("Decision", ["ts", "action", "spot", "mark", "funding_rate", "size", "equity", "reason"])
+
+OPEN = "apertura"
+CLOSE = "cierre"
+
+MARK_WS = "wss://dstream.binance.com/ws/{symbol}@markPrice@1s"
+SPOT_WS = "wss://stream.binance.com:9443/ws/{symbol}@kline_1m"
+
+
+class CarryStrategy:
+    """Incremental long spot / short perp carry with the simulation_gemini.py rules."""
+
+    def __init__(self, initial_cash=1000.0, capital_allocation_pct=0.95, spot_fee_rate=0.001,
+                 futures_fee_rate=0.0005, min_trade_size_btc=0.0001, min_fr_entry=0.0001,
+                 basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005):
+        self.capital_allocation_pct = capital_allocation_pct
+        self.spot_fee_rate = spot_fee_rate
+        self.futures_fee_rate = futures_fee_rate
+        self.min_trade_size_btc = min_trade_size_btc
+        self.min_fr_entry = min_fr_entry
+        self.basis_entry = basis_entry
+        self.fr_exit = fr_exit
+        self.basis_exit = basis_exit
+
+        self.cash = initial_cash
+        self.btc_spot = self.btc_funding = 0.0
+        self.in_position = False
+        self.entry_spot = self.entry_mark = 0.0
+        self.position_size = 0.0
+        self.entry_cost = 0.0
+        self.spot = self.mark = None
+
+    @property
+    def equity(self):
+        spot = self.spot or 0.0
+        return self.cash + (self.btc_spot + self.btc_funding) * spot
+
+    def on_event(self, event):
+        """Feeds one event; returns a Decision on open/close, else None."""
+        if event.kind == "mark":
+            self.mark = event.value
+        elif event.kind == "spot":
+            self.spot = event.value
+        elif event.kind == "funding":
+            if self.spot is None or self.mark is None:
+                return None
+            return self.step(event.ts, event.value, self.spot, self.mark)
+        return None
+
+    def step(self, ts, fr, spot, mark):
+        """One funding interval of the state machine (same arithmetic as simulate_gemini)."""
+        basis_pct = (mark / spot) - 1 if spot else 0
+
+        if self.in_position:
+            funding_btc = self.position_size * fr
+            self.btc_funding += funding_btc
+
+            if fr <= self.fr_exit or basis_pct < self.basis_exit:
+                reason = "FR" if fr <= self.fr_exit else "Basis"
+                size = self.position_size
+                total_btc_to_sell = self.btc_spot + self.btc_funding
+                proceeds = total_btc_to_sell * spot * (1 - self.spot_fee_rate)
+                futures_fee = self.position_size * mark * self.futures_fee_rate
+                self.cash += proceeds - futures_fee
+                self.btc_spot = self.btc_funding = 0.0
+                self.in_position = False
+                self.position_size = 0.0
+                self.entry_cost = 0.0
+                return Decision(ts, CLOSE, spot, mark, fr, size, self.cash, reason)
+            return None
+
+        if fr > self.min_fr_entry and basis_pct > self.basis_entry:
+            potential_btc = self.cash * self.capital_allocation_pct / spot
+            if potential_btc >= self.min_trade_size_btc:
+                spot_cost = potential_btc * spot
+                futures_fee = potential_btc * mark * self.futures_fee_rate
+                entry_cost = spot_cost * self.spot_fee_rate + futures_fee
+                total_needed = spot_cost + entry_cost
+                if self.cash >= total_needed:
+                    self.entry_spot = spot
+                    self.entry_mark = mark
+                    self.position_size = potential_btc
+                    self.entry_cost = entry_cost
+                    self.cash -= total_needed
+                    self.btc_spot = potential_btc
+                    self.btc_funding = 0.0
+                    self.in_position = True
+                    return Decision(ts, OPEN, spot, mark, fr, potential_btc, self.equity, "entry")
+        return None
+
+
+class ReplaySource:
+    """Replays a merged dataset as mark, spot and funding events per row.
+
+    speed=None replays as fast as possible; otherwise sleeps (gap / speed)
+    seconds between funding timestamps.
+    """
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+
+    async def __aiter__(self):
+        df = read_dataset(self.path, columns=FEATURE_COLUMNS).sort_values("fundingTime")
+        times = df["fundingTime"].to_numpy()
+        spot = df["spotPrice"].tolist()
+        mark = df["markPrice"].tolist()
+        rate = df["fundingRate"].tolist()
+        prev = None
+        for i, t in enumerate(times):
+            ts = int(t.astype("datetime64[ms]").astype("int64"))
+            if self.speed and prev is not None:
+                await asyncio.sleep((ts - prev) / 1000 / self.speed)
+            prev = ts
+            yield Event("mark", ts, mark[i])
+            yield Event("spot", ts, spot[i])
+            yield Event("funding", ts, rate[i])
+            # Let the consumer run between rows, like a real feed would
+            await asyncio.sleep(0)
+
+
+class BinanceWebsocketSource:
+    """Mark-price and spot-kline websocket streams merged into one event stream.
+
+    The markPrice stream carries the current funding rate ("r") and the next
+    funding time ("T"); a funding event is emitted with the last rate once a
+    message arrives at or after that time.
+    """
+
+    def __init__(self, symbol_perp="btcusd_perp", symbol_spot="btcusdt", max_retries=MAX_RETRIES):
+        self.symbol_perp = symbol_perp.lower()
+        self.symbol_spot = symbol_spot.lower()
+        self.max_retries = max_retries
+        self._next_funding = None
+        self._last_rate = None
+
+    async def _mark_stream(self, session, queue):
+        """Returns the number of messages read once the connection closes."""
+        import aiohttp
+
+        n = 0
+        async with session.ws_connect(MARK_WS.format(symbol=self.symbol_perp), heartbeat=30) as ws:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                n += 1
+                data = json.loads(msg.data)
+                ts = data["E"]
+                # Funding state survives reconnects so an event due during the gap is still emitted
+                if self._next_funding is not None and ts >= self._next_funding and self._last_rate is not None:
+                    await queue.put(Event("funding", self._next_funding, self._last_rate))
+                await queue.put(Event("mark", ts, float(data["p"])))
+                self._last_rate = float(data["r"])
+                self._next_funding = data["T"]
+        return n
+
+    async def _spot_stream(self, session, queue):
+        import aiohttp
+
+        n = 0
+        async with session.ws_connect(SPOT_WS.format(symbol=self.symbol_spot), heartbeat=30) as ws:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                n += 1
+                k = json.loads(msg.data)["k"]
+                await queue.put(Event("spot", k["T"], float(k["c"])))
+        return n
+
+    async def _reconnecting(self, stream, session, queue):
+        """Runs `stream` forever, reconnecting with exponential backoff.
+
+        A connection that delivered messages resets the retry count; after
+        max_retries consecutive failures the last error is raised.
+        """
+        import aiohttp
+
+        failures = 0
+        while True:
+            try:
+                if await stream(session, queue):
+                    failures = 0
+                error = ConnectionError(f"{stream.__name__} closed by the server")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if failures == self.max_retries:
+                raise error
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** failures) * (0.5 + random.random() / 2)
+            failures += 1
+            print(f"Websocket {stream.__name__} lost ({error!r}); reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def __aiter__(self):
+        import aiohttp
+
+        queue = asyncio.Queue(maxsize=1024)
+        async with aiohttp.ClientSession() as session:
+            tasks = [asyncio.create_task(self._reconnecting(self._mark_stream, session, queue)),
+                     asyncio.create_task(self._reconnecting(self._spot_stream, session, queue))]
+            getter = None
+            try:
+                while True:
+                    # Wait on the queue and on the streams, so a dead stream surfaces here
+                    getter = asyncio.ensure_future(queue.get())
+                    done, _ = await asyncio.wait([getter, *tasks], return_when=asyncio.FIRST_COMPLETED)
+                    if getter in done:
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    dead = next(t for t in tasks if t.done())
+                    dead.result()  # re-raises the error that ended the stream
+                    raise ConnectionError("websocket stream ended")
+            finally:
+                if getter is not None:
+                    getter.cancel()
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_live(source, strategy, on_decision=print, queue_size=256):
+    """Drives `strategy` from `source` and calls on_decision for every open/close.
+
+    The source runs in its own task behind a bounded queue, so a slow consumer
+    applies backpressure instead of letting a backlog (and latency) grow
+    without limit. Returns latency stats in seconds from queue put to decision.
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    done = object()
+
+    async def pump():
+        async for event in source:
+            await queue.put((time.perf_counter(), event))
+        await queue.put((time.perf_counter(), done))
+
+    stats = {"events": 0, "decisions": 0, "max_latency": 0.0, "total_latency": 0.0}
+    producer = asyncio.create_task(pump())
+    try:
+        while True:
+            received, event = await queue.get()
+            if event is done:
+                break
+            stats["events"] += 1
+            decision = strategy.on_event(event)
+            if decision is not None:
+                latency = time.perf_counter() - received
+                stats["decisions"] += 1
+                stats["total_latency"] += latency
+                stats["max_latency"] = max(stats["max_latency"], latency)
+                on_decision(decision)
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live / replay runner for the carry strategy.")
+    parser.add_argument("--replay", help="merged dataset to replay instead of the websocket feed")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed-up factor (default: max)")
+    args = parser.parse_args(argv)
+
+    source = ReplaySource(args.replay, args.speed) if args.replay else BinanceWebsocketSource()
+    strategy = CarryStrategy()
+    stats = asyncio.run(run_live(source, strategy, on_decision=lambda d: print(
+        f"{d.ts} {d.action:<9} spot={d.spot:.2f} mark={d.mark:.2f} fr={d.funding_rate:.6f} "
+        f"size={d.size:.6f} equity={d.equity:.2f} ({d.reason})")))
+    print(f"\nEvents: {stats['events']} | Decisions: {stats['decisions']} | "
+          f"Max latency: {stats['max_latency'] * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from async_fetch import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    FUND_URL,
+    FUNDING_INTERVAL_MS,
+    INTERVAL_MS,
+    LIMIT,
+    MARKKL_URL,
+    MAX_RETRIES,
+    SPOT_URL,
+)
+
+# Local, incremental cache of the funding, spot-kline and mark-kline series.
+#
+# Layout:
+#   data_cache/manifest.json                      covered [start, end] ms ranges per series
+#   data_cache/<kind>/<symbol>[_<interval>]/YYYY-MM.csv   rows "time,value"
+#
+# A request only downloads the parts of [start, end] the manifest does not
+# cover yet. Every page is appended to its month partitions and recorded in
+# the manifest before the next page is requested, so an interrupted download
+# resumes from the last written page. Pages are fetched with the same
+# exponential backoff as async_fetch.py on network errors, 418/429 and 5xx.
+
+CACHE_DIR = "data_cache"
+MANIFEST = "manifest.json"
+KINDS = {
+    # kind: (url, time key, value key)
+    "funding": (FUND_URL, "fundingTime", "fundingRate"),
+    "spot": (SPOT_URL, 0, 4),
+    "mark": (MARKKL_URL, 0, 4),
+}
+
+
+def merge_ranges(ranges):
+    """Sorts and merges overlapping or adjacent inclusive [start, end] ranges."""
+    out = []
+    for s, e in sorted(ranges):
+        if out and s <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+def missing_ranges(covered, start, end):
+    """Parts of [start, end] not inside any covered range."""
+    gaps = []
+    cur = start
+    for s, e in merge_ranges(covered):
+        if e < cur:
+            continue
+        if s > end:
+            break
+        if s > cur:
+            gaps.append([cur, min(s - 1, end)])
+        cur = max(cur, e + 1)
+        if cur > end:
+            break
+    if cur <= end:
+        gaps.append([cur, end])
+    return gaps
+
+
+def _default_fetch_page(url, params, max_retries=MAX_RETRIES):
+    """GET with exponential backoff on 418/429/5xx and network errors, as in async_fetch.py."""
+    import requests
+
+    for attempt in range(max_retries + 1):
+        try:
+            resp = requests.get(url, params=params, timeout=30)
+            resp.raise_for_status()
+            metrics.count("http.bytes", len(resp.content))
+            return resp.json()
+        except requests.exceptions.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            if status is not None and 400 <= status < 500 and status not in (418, 429):
+                raise
+            if attempt == max_retries:
+                raise
+            metrics.count("http.retries")
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+            if status in (418, 429):
+                # Rate limited: wait at least as long as the exchange asks
+                delay = max(delay, float(e.response.headers.get("Retry-After", 0)))
+            print(f"HTTP Request failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class MarketDataCache:
+    def __init__(self, root=CACHE_DIR, fetch_page=None, sleep=0.3):
+        self.root = root
+        self.fetch_page = fetch_page or _default_fetch_page
+        self.sleep = sleep
+        os.makedirs(root, exist_ok=True)
+        self._manifest_path = os.path.join(root, MANIFEST)
+        self.manifest = self._read_manifest()
+
+    # --- manifest ---
+    def _read_manifest(self):
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._manifest_path)
+
+    def _mark_covered(self, key, start, end):
+        ranges = self.manifest.get(key, []) + [[int(start), int(end)]]
+        self.manifest[key] = merge_ranges(ranges)
+        self._write_manifest()
+
+    @staticmethod
+    def series_key(kind, symbol, interval=None):
+        return f"{kind}/{symbol}" if kind == "funding" else f"{kind}/{symbol}_{interval}"
+
+    def covered(self, kind, symbol, interval=None):
+        return [list(r) for r in self.manifest.get(self.series_key(kind, symbol, interval), [])]
+
+    def missing(self, kind, symbol, start, end, interval=None):
+        return missing_ranges(self.covered(kind, symbol, interval), start, end)
+
+    # --- partitions ---
+    def _series_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _append_rows(self, key, times, values):
+        if len(times) == 0:
+            return
+        times = np.asarray(times, dtype=np.int64)
+        months = times.astype("datetime64[ms]").astype("datetime64[M]")
+        d = self._series_dir(key)
+        os.makedirs(d, exist_ok=True)
+        for month in np.unique(months):
+            sel = months == month
+            path = os.path.join(d, f"{month}.csv")
+            chunk = pd.DataFrame({"time": times[sel], "value": np.asarray(values, dtype=np.float64)[sel]})
+            chunk.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+    # --- fetch ---
+    def ensure(self, kind, symbol, start, end, interval=None):
+        """Downloads whatever part of [start, end] is not cached yet; returns rows written."""
+        url, time_key, value_key = KINDS[kind]
+        step = FUNDING_INTERVAL_MS if kind == "funding" else INTERVAL_MS[interval]
+        key = self.series_key(kind, symbol, interval)
+        # Never mark the still-open period as covered; it would be frozen with partial data
+        end = min(end, int(time.time() * 1000) - step)
+        written = 0
+
+        for gap_start, gap_end in missing_ranges(self.manifest.get(key, []), start, end):
+            cur = gap_start
+            while cur <= gap_end:
+                params = {"symbol": symbol, "startTime": cur, "endTime": gap_end, "limit": LIMIT}
+                if interval and kind != "funding":
+                    params["interval"] = interval
+                print(f"Fetching {key} starting from: {pd.to_datetime(cur, unit='ms')}...")
+                with metrics.stage(f"http.{kind}") as st:
+                    page = self.fetch_page(url, params)
+                    st.rows = len(page)
+                metrics.count("http.requests")
+                page = [r for r in page if cur <= r[time_key] <= gap_end]
+                if not page:
+                    self._mark_covered(key, cur, gap_end)
+                    break
+
+                times = [r[time_key] for r in page]
+                with metrics.stage("cache.write", rows=len(page)):
+                    self._append_rows(key, times, [float(r[value_key]) for r in page])
+                written += len(page)
+                last = times[-1]
+                if len(page) < LIMIT or last + step > gap_end:
+                    # Nothing after the last record within the gap
+                    self._mark_covered(key, cur, gap_end)
+                    break
+                self._mark_covered(key, cur, last)
+                cur = last + 1
+                with metrics.stage("sleep"):
+                    time.sleep(self.sleep)
+        return written
+
+    # --- read ---
+    def load(self, kind, symbol, start, end, interval=None):
+        """Cached rows in [start, end] as a DataFrame with columns time (ms) and value."""
+        key = self.series_key(kind, symbol, interval)
+        d = self._series_dir(key)
+        first = np.datetime64(int(start), "ms").astype("datetime64[M]")
+        last = np.datetime64(int(end), "ms").astype("datetime64[M]")
+        frames = []
+        with metrics.stage("cache.read") as st:
+            for month in np.arange(first, last + 1):
+                path = os.path.join(d, f"{month}.csv")
+                if os.path.exists(path):
+                    frames.append(pd.read_csv(path, dtype={"time": np.int64, "value": np.float64}))
+            st.rows = sum(len(f) for f in frames)
+        if not frames:
+            return pd.DataFrame({"time": np.empty(0, dtype=np.int64), "value": np.empty(0)})
+        df = pd.concat(frames, ignore_index=True)
+        df = df[(df["time"] >= start) & (df["time"] <= end)]
+        return df.drop_duplicates("time", keep="last").sort_values("time").reset_index(drop=True)
+
+    def get(self, kind, symbol, start, end, interval=None):
+        """ensure() + load()."""
+        self.ensure(kind, symbol, start, end, interval)
+        return self.load(kind, symbol, start, end, interval)
@@ -0,0 +1,232 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+# Stage timers and counters for the fetch and backtest pipelines.
+#
+#   with metrics.stage("load", rows=n): ...     wall time, call count, rows
+#   metrics.count("http.requests")              plain counters
+#
+# Everything is off by default: stage() then returns one shared no-op object
+# and count() / timed() return after a single global check, so instrumented
+# code pays next to nothing. Counts from pool worker processes are not
+# collected; the parent's stages cover the pool as a whole.
+#
+# cli.py enables it with --metrics PATH (JSON, or Prometheus text exposition
+# for *.prom / *.txt) and --profile PATH, which runs SamplingProfiler and
+# writes collapsed stacks ("a;b;c 42" per line, the input format of
+# flamegraph.pl / speedscope).
+#
+# Only the standard library is imported here so that backtest_engine and the
+# pool workers can use it without extra imports.
+
+PREFIX = "cash_carry"
+
+_enabled = False
+_timers = {}  # name -> [seconds, calls, rows]
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+class _NullStage:
+    """Returned by stage() while disabled; setting .rows is a no-op."""
+
+    __slots__ = ()
+    rows = property(lambda self: 0, lambda self, value: None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("name", "rows", "t0")
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        with _lock:
+            t = _timers.setdefault(self.name, [0.0, 0, 0])
+            t[0] += elapsed
+            t[1] += 1
+            t[2] += self.rows
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+def stage(name, rows=0):
+    """Context manager (sync or async) timing one run of stage `name`.
+
+    Rows processed can be passed up front or set on the returned object
+    (`st.rows = len(df)`) before the block ends.
+    """
+    if not _enabled:
+        return _NULL
+    return _Stage(name, rows)
+
+
+def timed(name):
+    """Decorator: stage(name) around every call, rows = len(first argument)."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name, len(args[0]) if args and hasattr(args[0], "__len__") else 0):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] += n
+
+
+def snapshot():
+    """{"stages": {name: {seconds, calls, rows, rows_per_second}}, "counters": {...}}."""
+    with _lock:
+        stages = {
+            name: {
+                "seconds": sec,
+                "calls": calls,
+                "rows": rows,
+                "rows_per_second": rows / sec if rows and sec > 0 else 0.0,
+            }
+            for name, (sec, calls, rows) in sorted(_timers.items())
+        }
+        return {"stages": stages, "counters": dict(sorted(_counters.items()))}
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(snap=None):
+    """Snapshot in the Prometheus text exposition format."""
+    snap = snap or snapshot()
+    lines = []
+    for field, kind in (("seconds", "counter"), ("calls", "counter"), ("rows", "counter"),
+                        ("rows_per_second", "gauge")):
+        metric = f"{PREFIX}_stage_{field}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, s in snap["stages"].items():
+            lines.append(f'{metric}{{stage="{name}"}} {s[field]}')
+    for name, value in snap["counters"].items():
+        metric = f"{PREFIX}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    """JSON, or Prometheus text when the path ends in .prom / .txt."""
+    snap = snapshot()
+    text = prometheus_text(snap) if path.endswith((".prom", ".txt")) else json.dumps(snap, indent=1)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def summary():
+    """Human-readable table of the stages and counters."""
+    snap = snapshot()
+    lines = [f"{'stage':<32} {'calls':>7} {'seconds':>10} {'rows':>12} {'rows/s':>12}"]
+    for name, s in snap["stages"].items():
+        lines.append(f"{name:<32} {s['calls']:>7} {s['seconds']:>10.3f} {s['rows']:>12,} "
+                     f"{s['rows_per_second']:>12,.0f}")
+    for name, value in snap["counters"].items():
+        lines.append(f"{name:<32} {value:>7,}")
+    return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Samples the target thread's stack every `interval` seconds from a daemon thread.
+
+    Costs nothing between samples; results are collapsed-stack counts.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
@@ -0,0 +1,247 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset_io import FEATURE_COLUMNS, read_dataset
+
+# Monte Carlo risk engine for the simulation_gemini.py strategy.
+# The historical fundingRate, basis_pct and spot log-return series are
+# resampled jointly into synthetic paths, either by stationary block
+# bootstrap or by regime resampling (funding-rate terciles with a fitted
+# Markov transition matrix). Paths are simulated as columns of (T, P) arrays
+# by simulate_gemini_batch, which steps all paths together.
+#
+# Work is split into chunks of paths; each chunk is generated and simulated
+# inside a pool worker from its own SeedSequence, so only seeds and the small
+# history arrays cross process boundaries and runtime scales with cores.
+
+INPUT_FILE = "coinm_full_data_2024_filled.csv"
+OUTPUT_FILE = "monte_carlo_paths.csv"
+INITIAL_CAPITAL_USD = 1000.0
+N_PATHS = 20_000
+BLOCK_SIZE = 21  # mean block length: one week of 8h funding events
+CHUNK_PATHS = 1000
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+_history = {}
+
+
+def history_arrays(df):
+    """Aligned funding rate, basis_pct and spot log returns from a merged dataset."""
+    df = df.sort_values("fundingTime")
+    spot = df["spotPrice"].fillna(df["markPrice"]).to_numpy(dtype=np.float64)
+    mark = df["markPrice"].to_numpy(dtype=np.float64)
+    rate = df["fundingRate"].to_numpy(dtype=np.float64)
+    ok = np.isfinite(spot) & np.isfinite(mark) & np.isfinite(rate) & (spot > 0)
+    spot, mark, rate = spot[ok], mark[ok], rate[ok]
+    log_ret = np.diff(np.log(spot), prepend=np.log(spot[0]))
+    return {"rate": rate, "basis_pct": mark / spot - 1, "log_ret": log_ret, "spot0": spot[0]}
+
+
+def block_bootstrap_indices(rng, n_hist, length, n_paths, block_size=BLOCK_SIZE):
+    """(length, n_paths) history indices of a stationary (Politis-Romano) bootstrap.
+
+    Each row starts a new circular block at a random index with probability
+    1 / block_size and otherwise continues the current one, so block lengths
+    are geometric with mean block_size.
+    """
+    t = np.arange(length)[:, None]
+    new = rng.random((length, n_paths)) < 1.0 / block_size
+    new[0] = True
+    # Row where the block containing each row started
+    first = np.maximum.accumulate(np.where(new, t, 0), axis=0)
+    starts = rng.integers(0, n_hist, size=(length, n_paths))
+    return (np.take_along_axis(starts, first, axis=0) + t - first) % n_hist
+
+
+def regime_labels(rate, n_regimes=3):
+    """Funding-rate quantile bucket of every history row, and the number of buckets.
+
+    Funding sits on the 0.0001 floor for long stretches, so tied quantile
+    edges are merged and empty buckets dropped.
+    """
+    edges = np.unique(np.quantile(rate, np.linspace(0, 1, n_regimes + 1)[1:-1]))
+    buckets = np.searchsorted(edges, rate, side="right")
+    _, labels = np.unique(buckets, return_inverse=True)
+    return labels, int(labels.max()) + 1
+
+
+def regime_resample_indices(rng, rate, length, n_paths, n_regimes=3):
+    """(length, n_paths) indices: Markov regime sequence, rows drawn within the regime."""
+    labels, n_regimes = regime_labels(rate, n_regimes)
+    trans = np.ones((n_regimes, n_regimes))  # Laplace smoothing
+    np.add.at(trans, (labels[:-1], labels[1:]), 1)
+    cum = np.cumsum(trans / trans.sum(axis=1, keepdims=True), axis=1)
+
+    pools = [np.flatnonzero(labels == r) for r in range(n_regimes)]
+    regimes = np.empty((length, n_paths), dtype=np.int64)
+    regimes[0] = labels[rng.integers(0, len(labels), n_paths)]
+    u = rng.random((length, n_paths))
+    for t in range(1, length):
+        regimes[t] = (u[t][:, None] > cum[regimes[t - 1]]).sum(axis=1)
+    np.minimum(regimes, n_regimes - 1, out=regimes)
+
+    idx = np.empty((length, n_paths), dtype=np.int64)
+    for r, pool in enumerate(pools):
+        sel = regimes == r
+        idx[sel] = pool[rng.integers(0, len(pool), int(sel.sum()))]
+    return idx
+
+
+def build_paths(hist, idx):
+    """Synthetic (T, P) rate / spot / mark arrays from history indices."""
+    rate = hist["rate"][idx]
+    log_ret = hist["log_ret"][idx]
+    log_ret[0] = 0.0
+    spot = hist["spot0"] * np.exp(np.cumsum(log_ret, axis=0))
+    mark = spot * (1 + hist["basis_pct"][idx])
+    return rate, spot, mark
+
+
+def simulate_gemini_batch(rate, spot, mark, initial_cash=INITIAL_CAPITAL_USD, capital_allocation_pct=0.95,
+                          spot_fee_rate=0.001, futures_fee_rate=0.0005, min_trade_size_btc=0.0001,
+                          min_fr_entry=0.0001, basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005, jit=True):
+    """simulate_gemini over independent paths stored as columns of (T, P) arrays.
+
+    Uses the same per-element arithmetic as backtest_engine.simulate_gemini.
+    Returns mark-to-market equity (T, P) and a (T, P) in-position mask.
+    With Numba installed (and jit=True) the paths run one after another in
+    kernels.gemini_paths, with bit-identical results.
+    """
+    T, P = rate.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        basis_pct = np.where(spot != 0, mark / spot - 1, 0.0)
+    enter = (rate > min_fr_entry) & (basis_pct > basis_entry)
+    exit_ = (rate <= fr_exit) | (basis_pct < basis_exit)
+
+    if jit:
+        import kernels
+
+        if kernels.ENABLED:
+            return kernels.gemini_paths(rate, spot, mark, enter, exit_, initial_cash, capital_allocation_pct,
+                                        spot_fee_rate, futures_fee_rate, min_trade_size_btc)
+
+    cash = np.full(P, float(initial_cash))
+    btc_spot = np.zeros(P)
+    btc_funding = np.zeros(P)
+    size = np.zeros(P)
+    in_pos = np.zeros(P, dtype=bool)
+    equity = np.empty((T, P))
+    holding = np.empty((T, P), dtype=bool)
+
+    for t in range(T):
+        s, m = spot[t], mark[t]
+        was_in = in_pos.copy()
+
+        btc_funding += np.where(was_in, size * rate[t], 0.0)
+        ex = was_in & exit_[t]
+        if ex.any():
+            total = btc_spot[ex] + btc_funding[ex]
+            cash[ex] += total * s[ex] * (1 - spot_fee_rate) - size[ex] * m[ex] * futures_fee_rate
+            btc_spot[ex] = btc_funding[ex] = size[ex] = 0.0
+            in_pos[ex] = False
+
+        en = ~was_in & enter[t]
+        if en.any():
+            pot = cash[en] * capital_allocation_pct / s[en]
+            spot_cost = pot * s[en]
+            needed = spot_cost + (spot_cost * spot_fee_rate + pot * m[en] * futures_fee_rate)
+            ok = (pot >= min_trade_size_btc) & (cash[en] >= needed)
+            idx = np.flatnonzero(en)[ok]
+            cash[idx] -= needed[ok]
+            btc_spot[idx] = size[idx] = pot[ok]
+            btc_funding[idx] = 0.0
+            in_pos[idx] = True
+
+        equity[t] = cash + (btc_spot + btc_funding) * s
+        holding[t] = in_pos
+    return equity, holding
+
+
+def path_metrics(equity, holding, initial_cash=INITIAL_CAPITAL_USD):
+    """End equity, max drawdown and time-in-position per path."""
+    peak = np.maximum.accumulate(np.vstack([np.full(equity.shape[1], initial_cash), equity]), axis=0)[1:]
+    drawdown = 1 - equity / peak
+    return {
+        "end_equity": equity[-1],
+        "max_drawdown": drawdown.max(axis=0),
+        "time_in_position": holding.mean(axis=0),
+    }
+
+
+def _init_worker(hist):
+    _history.update(hist)
+
+
+def _run_chunk(task):
+    seed, n_paths, length, method, block_size, params = task
+    rng = np.random.default_rng(seed)
+    hist = _history
+    if method == "regime":
+        idx = regime_resample_indices(rng, hist["rate"], length, n_paths)
+    else:
+        idx = block_bootstrap_indices(rng, len(hist["rate"]), length, n_paths, block_size)
+    rate, spot, mark = build_paths(hist, idx)
+    equity, holding = simulate_gemini_batch(rate, spot, mark, **params)
+    return path_metrics(equity, holding, params.get("initial_cash", INITIAL_CAPITAL_USD))
+
+
+def run_monte_carlo(hist, n_paths=N_PATHS, length=None, method="block", block_size=BLOCK_SIZE,
+                    seed=0, workers=None, chunk_paths=CHUNK_PATHS, **params):
+    """Simulates n_paths synthetic paths on a process pool; returns a per-path DataFrame."""
+    import pandas as pd
+
+    length = length or len(hist["rate"])
+    n_chunks = -(-n_paths // chunk_paths)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    sizes = [min(chunk_paths, n_paths - k * chunk_paths) for k in range(n_chunks)]
+    tasks = [(sd, sz, length, method, block_size, params) for sd, sz in zip(seeds, sizes)]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(hist,)) as pool:
+        parts = list(pool.map(_run_chunk, tasks))
+    return pd.DataFrame({k: np.concatenate([p[k] for p in parts]) for k in parts[0]})
+
+
+def summarize(paths, initial_cash=INITIAL_CAPITAL_USD):
+    """Quantiles of the per-path metrics plus tail statistics of end equity."""
+    table = paths.quantile(QUANTILES)
+    table.loc["mean"] = paths.mean()
+    end = paths["end_equity"].to_numpy()
+    var_5 = np.quantile(end, 0.05)
+    tail = {
+        "prob_loss": float((end < initial_cash).mean()),
+        "var_5pct_usd": float(initial_cash - var_5),
+        "cvar_5pct_usd": float(initial_cash - end[end <= var_5].mean()),
+    }
+    return table, tail
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo risk engine for the carry strategy.")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--paths", type=int, default=N_PATHS)
+    parser.add_argument("--length", type=int, default=None, help="funding events per path (default: history length)")
+    parser.add_argument("--method", choices=["block", "regime"], default="block")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="mean block length (block method)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    hist = history_arrays(read_dataset(args.input, columns=FEATURE_COLUMNS))
+    paths = run_monte_carlo(hist, n_paths=args.paths, length=args.length, method=args.method,
+                            block_size=args.block_size, seed=args.seed, workers=args.workers)
+    paths.to_csv(args.output, index=False)
+
+    table, tail = summarize(paths)
+    print(table.to_string())
+    print(f"\nProb. of loss: {tail['prob_loss']:.2%} | VaR 5%: ${tail['var_5pct_usd']:.2f} | "
+          f"CVaR 5%: ${tail['cvar_5pct_usd']:.2f}")
+    print(f"✅ {len(paths)} paths guardados en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from async_fetch import AsyncBinanceFetcher, merge_frames
+from backtest_engine import annualized_return, max_drawdown
+from dataset_io import read_dataset
+
+# Multi-symbol portfolio mode for the simulation_gemini.py strategy.
+# Funding, spot and mark for N symbols are aligned on one funding-time grid
+# as (T, N) arrays. The backtest steps every symbol together once per funding
+# interval: exits, funding accrual and entries are vector operations over the
+# symbol axis and share one cash balance.
+#
+# Allocation: at each step the deployable cash (cash * capital_allocation_pct)
+# is split equally across the symbols that meet the entry rules at that step.
+# With a single symbol this reduces exactly to simulate_gemini().
+
+INITIAL_CAPITAL_USD = 1000.0
+SYMBOLS_PERP = ["BTCUSD_PERP", "ETHUSD_PERP", "SOLUSD_PERP", "BNBUSD_PERP"]
+
+
+def spot_symbol(symbol_perp):
+    """BTCUSD_PERP -> BTCUSDT"""
+    return symbol_perp.split("USD_")[0] + "USDT"
+
+
+def load_panel(df, grid="min"):
+    """Pivots a long fundingTime/symbol/... frame into aligned (T, N) arrays.
+
+    fundingTime is rounded to `grid` first so that millisecond jitter between
+    symbols (00:00:00.005 vs 00:00:00.000) lands on the same row. Prices are
+    forward-filled per symbol; funding rates are left NaN where a symbol has
+    no funding event.
+    """
+    df = df.copy()
+    df["fundingTime"] = pd.to_datetime(df["fundingTime"]).dt.round(grid)
+    df = df.drop_duplicates(["fundingTime", "symbol"], keep="last")
+    wide = df.pivot(index="fundingTime", columns="symbol",
+                    values=["fundingRate", "spotPrice", "markPrice"]).sort_index()
+    symbols = list(wide["fundingRate"].columns)
+    spot = wide["spotPrice"].ffill()
+    return {
+        "fundingTime": wide.index.to_numpy(),
+        "symbols": symbols,
+        "fundingRate": np.ascontiguousarray(wide["fundingRate"].to_numpy(dtype=np.float64)),
+        # Same fallback as the single-symbol scripts when spot is missing
+        "spotPrice": np.ascontiguousarray(spot.fillna(wide["markPrice"]).to_numpy(dtype=np.float64)),
+        "markPrice": np.ascontiguousarray(wide["markPrice"].ffill().to_numpy(dtype=np.float64)),
+    }
+
+
+async def _fetch_panel(symbols, start_ms, end_ms, interval):
+    async with AsyncBinanceFetcher() as fetcher:
+        parts = await asyncio.gather(*(
+            fetcher.fetch_all(start_ms, end_ms, symbol_perp=s, symbol_spot=spot_symbol(s), interval=interval)
+            for s in symbols))
+    return pd.concat([merge_frames(*p) for p in parts], ignore_index=True)
+
+
+def fetch_panel(symbols, start_ms, end_ms, interval="1h"):
+    """Downloads the merged long frame for every symbol concurrently."""
+    return asyncio.run(_fetch_panel(symbols, start_ms, end_ms, interval))
+
+
+def simulate_portfolio(rate, spot, mark, initial_cash=INITIAL_CAPITAL_USD, capital_allocation_pct=0.95,
+                       spot_fee_rate=0.001, futures_fee_rate=0.0005, min_trade_size=0.0001,
+                       min_fr_entry=0.0001, basis_entry=0.0015, fr_exit=0.0, basis_exit=0.0005,
+                       entry_mask=None):
+    """Steps the gemini entry/exit rules over (T, N) arrays with a shared cash balance.
+
+    entry_mask, if given, is a (T, N) boolean array ANDed into the entry signal.
+    """
+    T, N = rate.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        basis_pct = np.where(spot != 0, mark / spot - 1, 0.0)
+        enter_sig = (rate > min_fr_entry) & (basis_pct > basis_entry) & (spot > 0)
+    if entry_mask is not None:
+        enter_sig &= np.asarray(entry_mask, dtype=bool)
+    exit_sig = (rate <= fr_exit) | (basis_pct < basis_exit)
+    rate0 = np.nan_to_num(rate)
+    spot_px = np.nan_to_num(spot)
+
+    in_pos = np.zeros(N, dtype=bool)
+    size = np.zeros(N)
+    spot_coins = np.zeros(N)
+    funding_coins = np.zeros(N)  # funding received, in coin
+    entry_basis = np.zeros(N)
+    entry_cost = np.zeros(N)
+    flows = np.zeros(N)  # realized USD cash flows per symbol
+
+    equity = np.empty(T)
+    cash_out = np.empty(T)
+    symbol_pnl = np.empty((T, N))
+    funding_pnl = np.zeros((T, N))
+    basis_pnl = np.zeros((T, N))
+    costs = np.zeros((T, N))
+    opens = np.zeros((T, N), dtype=bool)
+    closes = np.zeros((T, N), dtype=bool)
+
+    cash = initial_cash
+    for t in range(T):
+        s = spot_px[t]
+        m = mark[t]
+
+        # Funding accrual and exits for open positions
+        if in_pos.any():
+            funding_coin = np.where(in_pos, size * rate0[t], 0.0)
+            funding_coins += funding_coin
+            funding_pnl[t] = funding_coin * s
+
+            ex = in_pos & exit_sig[t]
+            if ex.any():
+                sell_value = (spot_coins[ex] + funding_coins[ex]) * s[ex]
+                futures_fee = size[ex] * m[ex] * futures_fee_rate
+                proceeds = sell_value * (1 - spot_fee_rate) - futures_fee
+                cash += proceeds.sum()
+                flows[ex] += proceeds
+                costs[t, ex] = entry_cost[ex] + sell_value * spot_fee_rate + futures_fee
+                basis_pnl[t, ex] = size[ex] * ((s[ex] - m[ex]) - entry_basis[ex])
+                closes[t, ex] = True
+                in_pos[ex] = False
+                size[ex] = spot_coins[ex] = funding_coins[ex] = entry_cost[ex] = 0.0
+
+        # Entries: symbols that were flat at the start of this step
+        new = enter_sig[t] & ~in_pos & ~closes[t]
+        k = int(new.sum())
+        if k:
+            budget = cash * capital_allocation_pct / k
+            qty = budget / s[new]
+            spot_cost = qty * s[new]
+            fee = spot_cost * spot_fee_rate + qty * m[new] * futures_fee_rate
+            needed = spot_cost + fee
+            # Below-minimum candidates are dropped before the budget check so they use no cash
+            ok = qty >= min_trade_size
+            ok &= np.cumsum(np.where(ok, needed, 0.0)) <= cash
+            idx = np.flatnonzero(new)[ok]
+            if len(idx):
+                cash -= needed[ok].sum()
+                flows[idx] -= needed[ok]
+                in_pos[idx] = True
+                size[idx] = qty[ok]
+                spot_coins[idx] = qty[ok]
+                funding_coins[idx] = 0.0
+                entry_basis[idx] = s[idx] - m[idx]
+                entry_cost[idx] = fee[ok]
+                opens[t, idx] = True
+
+        holdings = (spot_coins + funding_coins) * s
+        symbol_pnl[t] = flows + holdings
+        cash_out[t] = cash
+        equity[t] = cash + holdings.sum()
+
+    return {
+        "equity": equity,
+        "cash": cash_out,
+        "symbol_pnl": symbol_pnl,
+        "funding_pnl": funding_pnl,
+        "basis_pnl": basis_pnl,
+        "costs": costs,
+        "opens": opens,
+        "closes": closes,
+    }
+
+
+def summarize(panel, res, initial_cash=INITIAL_CAPITAL_USD):
+    """Per-symbol and aggregate summary table."""
+    times = panel["fundingTime"]
+    days = (times[-1] - times[0]) / np.timedelta64(1, "D") if len(times) else 0.0
+    rows = []
+    for j, sym in enumerate(panel["symbols"]):
+        rows.append({
+            "symbol": sym,
+            "pnl_usd": res["symbol_pnl"][-1, j],
+            "funding_pnl_usd": res["funding_pnl"][:, j].sum(),
+            "basis_pnl_usd": res["basis_pnl"][:, j].sum(),
+            "costs_usd": res["costs"][:, j].sum(),
+            "trades": int(res["opens"][:, j].sum()),
+        })
+    end = res["equity"][-1]
+    rows.append({
+        "symbol": "PORTFOLIO",
+        "pnl_usd": end - initial_cash,
+        "funding_pnl_usd": res["funding_pnl"].sum(),
+        "basis_pnl_usd": res["basis_pnl"].sum(),
+        "costs_usd": res["costs"].sum(),
+        "trades": int(res["opens"].sum()),
+        "end_equity_usd": end,
+        "apy": annualized_return(end, initial_cash, days),
+        "max_drawdown": max_drawdown(np.concatenate(([initial_cash], res["equity"]))),
+    })
+    return pd.DataFrame(rows)
+
+
+def equity_frame(panel, res):
+    """Aggregate equity plus one PnL curve per symbol, indexed by funding time."""
+    out = pd.DataFrame(res["symbol_pnl"], columns=[f"{s}_pnl_usd" for s in panel["symbols"]])
+    out.insert(0, "equity_usd", res["equity"])
+    out.insert(0, "timestamp", panel["fundingTime"])
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-symbol cash-and-carry portfolio backtest.")
+    parser.add_argument("inputs", nargs="+", help="merged datasets (CSV/Parquet/Arrow) with a symbol column")
+    parser.add_argument("--output", default="portfolio_equity.csv")
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CAPITAL_USD)
+    parser.add_argument("--forecast", action="store_true", help="enter only on forecast carry above fees")
+    parser.add_argument("--horizon", type=int, default=21, help="forecast horizon in funding events")
+    parser.add_argument("--pooled", action="store_true", help="one forecast model for all symbols")
+    parser.add_argument("--refit-every", type=int, default=21, help="forecast refit period in events")
+    args = parser.parse_args(argv)
+
+    df = pd.concat([read_dataset(p) for p in args.inputs], ignore_index=True)
+    panel = load_panel(df)
+    entry_mask = None
+    if args.forecast:
+        import forecast
+
+        # One batched fit over every symbol of the panel
+        expected = forecast.forecast(panel["fundingRate"], panel["spotPrice"], panel["markPrice"],
+                                     horizon=args.horizon, refit_every=args.refit_every,
+                                     pooled=args.pooled)["forecast"]
+        entry_mask = forecast.entry_mask(expected)
+    res = simulate_portfolio(panel["fundingRate"], panel["spotPrice"], panel["markPrice"], args.initial_cash,
+                             entry_mask=entry_mask)
+    equity_frame(panel, res).to_csv(args.output, index=False)
+    print(summarize(panel, res, args.initial_cash).to_string(index=False))
+    print(f"\n✅ Equity curves guardadas en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse
+
+import numpy as np
+
+# Summary and analytics of the CSVs the backtests write.
+#
+#   python report.py strategy_results.csv simulacion_completa.csv basis_empirical_results.csv
+#   python report.py results/*.csv --save-table results.npz --monthly monthly.csv
+#   python report.py results.npz
+#
+# Each file is read once, only the columns listed below, into a result set:
+# time, equity and per-row PnL arrays. Result sets are stacked into one
+# columnar table, (rows, sets) matrices padded with NaN where a set is
+# shorter, and every metric is computed column-wise over the whole table in
+# one pass: Sharpe, Sortino, max drawdown and its duration, funding / basis /
+# costs attribution, monthly returns and trade statistics. A table can be
+# saved as .npz and passed back instead of the CSVs, so reports over many
+# result sets don't parse them again.
+#
+# Each script names its columns differently, so every field is picked from
+# the first match in its candidate list. walk_forward.py output is one row per
+# test window (end_cash at test_end); sweep.py output is one row per
+# parameter set with no time axis and is rejected.
+
+TIME_COLUMNS = ["fundingTime", "timestamp", "Time", "test_end"]
+EQUITY_COLUMNS = ["equity_mtm_usd", "equity_usd", "Cash Balance", "end_cash", "equity"]
+SWEEP_COLUMNS = ["rank", "apy"]
+FUNDING_COLUMNS = ["funding_pnl_usd"]
+BASIS_COLUMNS = ["basis_pnl_usd", "hedge_pnl_usd"]
+COSTS_COLUMNS = ["costs_usd"]
+POSITION_COLUMNS = ["operacion", "Action", "Position", "position"]
+# Rows whose value starts with the marker open a trade; in the other position
+# columns a trade opens whenever the value changes to a non-flat one
+TRADE_COLUMNS = {"operacion": "apertura", "Action": "TRADE"}
+FLAT_POSITIONS = ["Cash", "CASH", "Hold", "nada"]
+# simulation_gemini.py's equity_usd is marked before each row's action and on
+# the spot leg only; its equity_mtm_usd (hedged, after the action) is used
+# instead. Funding / basis / costs columns are attribution only.
+INITIAL_CASH = 1000.0
+MS_PER_DAY = 86_400_000
+MS_PER_YEAR = 365 * MS_PER_DAY
+
+SUMMARY_COLUMNS = [
+    "rows", "start", "end", "end_equity", "apy", "max_drawdown", "max_drawdown_days", "sharpe", "sortino",
+    "funding_pnl", "basis_pnl", "costs", "other_pnl", "trades", "win_rate", "avg_trade", "best_trade",
+    "worst_trade", "profit_factor",
+]
+
+
+def _first(columns, candidates):
+    return next((c for c in candidates if c in columns), None)
+
+
+def _trade_starts(col, values):
+    """Boolean mask of the rows that open a trade, from a position/action column."""
+    values = values.astype(str)
+    if col in TRADE_COLUMNS:
+        return np.char.startswith(values, TRADE_COLUMNS[col])
+    held = ~np.isin(values, FLAT_POSITIONS)
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    return held & changed
+
+
+def result_set(columns, initial_cash=INITIAL_CASH):
+    """Result set (dict of arrays) from a mapping of column name -> values (a DataFrame works).
+
+    Per-row PnL is the change in equity. A trade's PnL is the per-row PnL
+    summed from its opening row to the next one.
+    """
+    import pandas as pd
+
+    names = list(columns.keys())
+    time_col = _first(names, TIME_COLUMNS)
+    equity_col = _first(names, EQUITY_COLUMNS)
+    if time_col is None and all(c in names for c in SWEEP_COLUMNS):
+        raise ValueError("Parameter sweep table (one row per parameter set, no time column); "
+                         "report.py needs the per-row output of a backtest")
+    if time_col is None or equity_col is None:
+        raise ValueError(f"No time/equity column among {names}")
+    times = pd.to_datetime(pd.Series(columns[time_col]), format="ISO8601").to_numpy("datetime64[ms]").astype(np.int64)
+    equity = np.asarray(columns[equity_col], dtype=np.float64)
+    n = len(equity)
+
+    out = {"time": times, "equity": equity}
+    for field, candidates in (("funding", FUNDING_COLUMNS), ("basis", BASIS_COLUMNS), ("costs", COSTS_COLUMNS)):
+        col = _first(names, candidates)
+        if col is not None:
+            out[field] = np.asarray(columns[col], dtype=np.float64)
+    out["net"] = np.diff(equity, prepend=initial_cash)
+    pos_col = _first(names, POSITION_COLUMNS)
+    out["start"] = _trade_starts(pos_col, np.asarray(columns[pos_col])) if pos_col else np.zeros(n, dtype=bool)
+    return out
+
+
+def read_result_set(path, initial_cash=INITIAL_CASH):
+    """Reads one results CSV (only the columns the report uses) into a result set."""
+    import pandas as pd
+
+    wanted = set(TIME_COLUMNS + EQUITY_COLUMNS + FUNDING_COLUMNS + BASIS_COLUMNS + COSTS_COLUMNS + POSITION_COLUMNS
+                 + SWEEP_COLUMNS)
+    df = pd.read_csv(path, usecols=lambda c: c in wanted)
+    return result_set(df, initial_cash)
+
+
+def pack(names, sets):
+    """Stacks result sets into one table of (rows, sets) matrices; shorter sets are padded."""
+    S = len(sets)
+    rows = np.array([len(s["equity"]) for s in sets], dtype=np.int64)
+    T = int(rows.max()) if S else 0
+    table = {
+        "names": np.array(names, dtype=str),
+        "rows": rows,
+        "time": np.full((T, S), np.nan),
+        "equity": np.full((T, S), np.nan),
+        "net": np.zeros((T, S)),
+        "start": np.zeros((T, S), dtype=bool),
+        "funding": np.full((T, S), np.nan),
+        "basis": np.full((T, S), np.nan),
+        "costs": np.full((T, S), np.nan),
+    }
+    for j, s in enumerate(sets):
+        n = rows[j]
+        for key in ("time", "equity", "net", "start", "funding", "basis", "costs"):
+            if key in s:
+                table[key][:n, j] = s[key]
+    return table
+
+
+def save_table(table, path):
+    np.savez_compressed(path, **table)
+
+
+def load_table(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def unpack(table):
+    """(names, result sets) of a table; the inverse of pack."""
+    sets = []
+    for j, n in enumerate(table["rows"].tolist()):
+        s = {key: table[key][:n, j] for key in ("equity", "net", "start")}
+        s["time"] = table["time"][:n, j].astype(np.int64)
+        for key in ("funding", "basis", "costs"):
+            if not np.isnan(table[key][:n, j]).all():
+                s[key] = table[key][:n, j]
+        sets.append(s)
+    return table["names"].tolist(), sets
+
+
+def _last(matrix, rows, default):
+    """matrix[rows - 1, j] per column, default where a column is empty."""
+    S = matrix.shape[1]
+    out = np.full(S, default, dtype=np.float64)
+    has = rows > 0
+    out[has] = matrix[rows[has] - 1, np.arange(S)[has]]
+    return out
+
+
+def analyze(table, initial_cash=INITIAL_CASH):
+    """Metrics of every result set in a packed table.
+
+    Returns {"summary": dict of per-set arrays (SUMMARY_COLUMNS),
+    "monthly": {"set", "month", "return"}, "trades": {"set", "pnl"}}.
+    Returns are per row (one funding period for most scripts) and are
+    annualized with the median row spacing of each set.
+    """
+    equity = table["equity"]
+    time = table["time"]
+    rows = table["rows"]
+    T, S = equity.shape
+    valid = ~np.isnan(equity)
+
+    start = time[0] if T else np.full(S, np.nan)
+    end = _last(time, rows, np.nan)
+    end_equity = _last(equity, rows, initial_cash)
+    days = (end - start) / MS_PER_DAY
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        apy = np.where((days > 0) & (end_equity > 0) & (initial_cash > 0),
+                       (end_equity / initial_cash) ** (365 / days) - 1, np.nan)
+
+        # Per-row returns; the first row is measured against the initial cash
+        prev = np.vstack([np.full((1, S), initial_cash), equity[:-1]])
+        ret = equity / prev - 1
+        n_ret = np.count_nonzero(~np.isnan(ret), axis=0)
+        mean = np.nansum(ret, axis=0) / n_ret
+        std = np.sqrt(np.nansum((ret - mean) ** 2, axis=0) / (n_ret - 1))
+        downside = np.sqrt(np.nansum(np.minimum(ret, 0.0) ** 2, axis=0) / n_ret)
+        step = np.nanmedian(np.diff(time, axis=0), axis=0) if T > 1 else np.full(S, np.nan)
+        scale = np.sqrt(MS_PER_YEAR / step)
+        sharpe = np.where(std > 0, mean / std * scale, np.nan)
+        sortino = np.where(downside > 0, mean / downside * scale, np.nan)
+
+        # Drawdown against the running peak, initial cash included; fmax skips the padding
+        peak = np.fmax.accumulate(np.vstack([np.full((1, S), initial_cash), equity]), axis=0)[1:]
+        dd = 1 - equity / peak
+        drawdown = np.where(valid.any(axis=0), np.nanmax(np.where(valid, dd, -np.inf), axis=0), 0.0)
+        drawdown = np.maximum(drawdown, 0.0)
+        # Time since the last row at the peak; the start counts as a peak
+        at_peak = np.where(valid & (equity >= peak), time, np.nan)
+        if T:
+            at_peak[0] = time[0]
+        underwater = time - np.fmax.accumulate(at_peak, axis=0)
+        dd_days = np.where(valid.any(axis=0), np.nanmax(np.where(valid, underwater, -np.inf), axis=0), 0.0) / MS_PER_DAY
+
+    attribution = {}
+    for key in ("funding", "basis", "costs"):
+        present = ~np.isnan(table[key]).all(axis=0)
+        attribution[key] = np.where(present, np.nansum(table[key], axis=0), np.nan)
+    other = (end_equity - initial_cash) - (attribution["funding"] + attribution["basis"] - attribution["costs"])
+
+    trades = _trade_pnl(table)
+    monthly = _monthly_returns(table, initial_cash)
+
+    summary = {
+        "rows": rows,
+        "start": start.astype("datetime64[ms]") if T else start,
+        "end": end.astype("datetime64[ms]"),
+        "end_equity": end_equity,
+        "apy": apy,
+        "max_drawdown": drawdown,
+        "max_drawdown_days": dd_days,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "funding_pnl": attribution["funding"],
+        "basis_pnl": attribution["basis"],
+        "costs": attribution["costs"],
+        "other_pnl": other,
+        **_trade_stats(trades, S),
+    }
+    return {"summary": summary, "monthly": monthly, "trades": trades}
+
+
+def _trade_pnl(table):
+    """PnL of every trade: the per-row PnL summed from its opening row to the next one."""
+    start = table["start"]
+    S = start.shape[1]
+    opened = np.cumsum(start, axis=0)
+    counts = opened[-1] if len(start) else np.zeros(S, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    in_trade = opened > 0
+    trade_id = (opened + offsets - 1)[in_trade]
+    pnl = np.bincount(trade_id, weights=table["net"][in_trade], minlength=int(counts.sum()))
+    return {"set": np.repeat(np.arange(S), counts), "pnl": pnl}
+
+
+def _trade_stats(trades, S):
+    pnl = trades["pnl"]
+    sets = trades["set"]
+    count = np.bincount(sets, minlength=S)
+    wins = np.bincount(sets, weights=pnl > 0, minlength=S)
+    gross_win = np.bincount(sets, weights=np.maximum(pnl, 0.0), minlength=S)
+    gross_loss = -np.bincount(sets, weights=np.minimum(pnl, 0.0), minlength=S)
+    best = np.full(S, np.nan)
+    worst = np.full(S, np.nan)
+    has = count > 0
+    # Trades are grouped by set, so each non-empty set starts at its offset
+    first = np.concatenate(([0], np.cumsum(count)[:-1]))[has]
+    if len(first):
+        best[has] = np.maximum.reduceat(pnl, first)
+        worst[has] = np.minimum.reduceat(pnl, first)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "trades": count,
+            "win_rate": np.where(has, wins / count, np.nan),
+            "avg_trade": np.where(has, (gross_win - gross_loss) / count, np.nan),
+            "best_trade": best,
+            "worst_trade": worst,
+            "profit_factor": np.where(gross_loss > 0, gross_win / gross_loss, np.nan),
+        }
+
+
+def _monthly_returns(table, initial_cash):
+    """Return of each calendar month of each set, from month-end equity."""
+    equity = table["equity"]
+    valid = ~np.isnan(equity)
+    ms = np.where(valid, table["time"], 0).astype(np.int64)
+    month = np.where(valid, ms.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64), -1)
+    nxt = np.vstack([month[1:], np.full((1, month.shape[1]), -2)]) if len(month) else month
+    month_end = valid & (month != nxt)
+    # Transposed so the month ends come out grouped by set, in time order
+    s, t = np.nonzero(month_end.T)
+    close = equity[t, s]
+    prev = np.empty_like(close)
+    prev[1:] = close[:-1]
+    first = np.ones(len(s), dtype=bool)
+    first[1:] = s[1:] != s[:-1]
+    prev[first] = initial_cash
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = close / prev - 1
+    return {"set": s, "month": month[t, s].astype("datetime64[M]"), "return": ret}
+
+
+def summarize_results(df, initial_cash=INITIAL_CASH):
+    """analyze() summary of one results frame, as a dict."""
+    import pandas as pd
+
+    table = pack(["df"], [result_set(df, initial_cash)])
+    summary = analyze(table, initial_cash)["summary"]
+    out = {k: v[0].item() for k, v in summary.items()}
+    out["start"] = pd.Timestamp(out["start"])
+    out["end"] = pd.Timestamp(out["end"])
+    return out
+
+
+def load(paths, initial_cash=INITIAL_CASH):
+    """Packed table of CSVs and saved .npz tables."""
+    names, sets = [], []
+    for path in paths:
+        if path.endswith(".npz"):
+            more_names, more_sets = unpack(load_table(path))
+            names += more_names
+            sets += more_sets
+        else:
+            names.append(path)
+            sets.append(read_result_set(path, initial_cash))
+    return pack(names, sets)
+
+
+def frames(table, initial_cash=INITIAL_CASH):
+    """(summary, monthly) DataFrames of a table: one row per result set, months x files."""
+    import pandas as pd
+
+    result = analyze(table, initial_cash)
+    summary = pd.DataFrame({"file": table["names"], **{k: result["summary"][k] for k in SUMMARY_COLUMNS}})
+    summary["start"] = pd.to_datetime(summary["start"])
+    summary["end"] = pd.to_datetime(summary["end"])
+    monthly = result["monthly"]
+    monthly = pd.DataFrame({
+        "set": monthly["set"],
+        "month": monthly["month"].astype(str),
+        "return": monthly["return"],
+    }).pivot(index="month", columns="set", values="return")
+    # Pivot on the set index, names can repeat across inputs
+    monthly.columns = table["names"][monthly.columns.to_numpy()]
+    return summary, monthly
+
+
+def report(paths, initial_cash=INITIAL_CASH):
+    """One summary row per result set."""
+    return frames(load(paths, initial_cash), initial_cash)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize backtest result CSVs.")
+    parser.add_argument("paths", nargs="+", help="result CSVs or tables saved with --save-table")
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CASH)
+    parser.add_argument("--output", default=None, help="also write the summary as CSV")
+    parser.add_argument("--monthly", default=None, help="write monthly returns (months x files) as CSV")
+    parser.add_argument("--save-table", default=None, help="save the columnar table as .npz for later reports")
+    args = parser.parse_args(argv)
+
+    table = load(args.paths, args.initial_cash)
+    out, monthly = frames(table, args.initial_cash)
+    print(out.to_string(index=False))
+    if args.output:
+        out.to_csv(args.output, index=False)
+        print(f"\n✅ Reporte guardado en: {args.output}")
+    if args.monthly:
+        monthly.to_csv(args.monthly)
+        print(f"✅ Retornos mensuales guardados en: {args.monthly}")
+    if args.save_table:
+        save_table(table, args.save_table)
+        print(f"✅ Tabla guardada en: {args.save_table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+# Content-addressed cache of backtest results.
+#
+#   res = cached_call(simulate_gemini, rate, spot, mark, initial_cash=1000.0)
+#
+# The key hashes three things: the bytes of the input arrays (the data slice),
+# the source of the strategy function (its code version) and the parameters
+# as sorted JSON. The code version covers the file that defines the function
+# and every module of this repo it imports, transitively and including
+# imports inside functions (backtest_engine -> kernels), so editing any code
+# the result depends on gives a new key. Changing any of the three gives a new
+# key, so a stale result can never be returned; entries nobody asks for any
+# more simply age out.
+#
+# Entries are compressed .npz files, result_cache/<key[:2]>/<key>.npz, holding
+# the dict of arrays the simulate_* functions return (scalars as 0-d arrays).
+# A hit touches the file's mtime. The cache keeps a running byte total and,
+# once a put takes it over max_bytes, rescans the directory and deletes the
+# oldest files until it is under LOW_WATER * max_bytes (LRU by mtime), so a
+# full cache rescans once per few puts rather than on every one. Files are
+# written to a temp name and renamed, so pool workers and notebooks can share
+# one directory.
+#
+# Set CASH_CARRY_CACHE=0 to bypass the cache in the scripts.
+
+CACHE_DIR = "result_cache"
+MAX_BYTES = 512 * 2**20
+LOW_WATER = 0.9
+
+_code_versions = {}
+_default = None
+
+
+def data_fingerprint(*arrays):
+    """Hash of the dtype, shape and bytes of each array."""
+    h = hashlib.blake2b(digest_size=20)
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def local_imports(path):
+    """Paths of the modules next to `path` that its source imports, anywhere in the file."""
+    root = os.path.dirname(path)
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    paths = (os.path.join(root, f"{name}.py") for name in names)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def code_version(func):
+    """Hash of the file that defines func (decorators unwrapped) and the local modules it imports."""
+    path = os.path.abspath(inspect.getsourcefile(inspect.unwrap(func)))
+    version = _code_versions.get(path)
+    if version is None:
+        seen = set()
+        todo = [path]
+        while todo:
+            p = todo.pop()
+            if p not in seen:
+                seen.add(p)
+                todo += local_imports(p)
+        h = hashlib.blake2b(digest_size=20)
+        for p in sorted(seen):
+            h.update(os.path.basename(p).encode())
+            with open(p, "rb") as f:
+                h.update(f.read())
+        version = _code_versions[path] = h.hexdigest()
+    return version
+
+
+def result_key(func, arrays, params, depends=()):
+    """Cache key of func(*arrays, **params), or None if a parameter can't be hashed.
+
+    Array-valued parameters (e.g. entry_mask) are hashed by content; other
+    values must be JSON-serializable. `depends` lists further functions whose
+    source files are part of the code version.
+    """
+    plain = {}
+    extra = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, np.ndarray):
+            plain[name] = "array"
+            extra.append(value)
+        else:
+            plain[name] = value
+    try:
+        params_json = json.dumps(plain, sort_keys=True)
+    except TypeError:
+        return None
+    func = inspect.unwrap(func)
+    h = hashlib.blake2b(digest_size=20)
+    versions = [code_version(f) for f in (func, *depends)]
+    for part in (f"{func.__module__}.{func.__qualname__}", *versions, data_fingerprint(*arrays, *extra),
+                 params_json):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._bytes = None  # running total, read from disk on the first put
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Stored result dict, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                result = {name: f[name] for name in f.files}
+        except (FileNotFoundError, OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return {k: v.item() if v.ndim == 0 else v for k, v in result.items()}
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **{k: np.asarray(v) for k, v in result.items()})
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self.entries())
+        try:
+            self._bytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        self._bytes += os.path.getsize(tmp)
+        os.replace(tmp, path)
+        # Other processes sharing the directory aren't counted, so the
+        # rescan in evict() also resyncs the total
+        if self._bytes > self.max_bytes:
+            self.evict(LOW_WATER * self.max_bytes)
+
+    def entries(self):
+        """(mtime, size, path) of every stored result."""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".npz"):
+                    st = entry.stat()
+                    out.append((st.st_mtime, st.st_size, entry.path))
+        return out
+
+    def evict(self, target=None):
+        """Deletes least recently used entries until the cache fits in target bytes (max_bytes)."""
+        target = self.max_bytes if target is None else target
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        self._bytes = 0
+
+    def call(self, func, *arrays, **params):
+        """func(*arrays, **params), from the cache when possible."""
+        key = result_key(func, arrays, params)
+        if key is None:
+            return func(*arrays, **params)
+        result = self.get(key)
+        if result is None:
+            result = func(*arrays, **params)
+            self.put(key, result)
+        return result
+
+
+def default_cache():
+    """Process-wide ResultCache under CACHE_DIR, or None if CASH_CARRY_CACHE=0."""
+    global _default
+    if os.environ.get("CASH_CARRY_CACHE", "1") == "0":
+        return None
+    if _default is None:
+        _default = ResultCache()
+    return _default
+
+
+def cached_call(func, *arrays, cache=None, **params):
+    """func(*arrays, **params) through `cache` (default_cache() if None)."""
+    cache = cache or default_cache()
+    if cache is None:
+        return func(*arrays, **params)
+    return cache.call(func, *arrays, **params)
@@ -1,9 +1,16 @@
-# Guarda este archivo como simulacion_cash_carry_completa.py
-# Luego corrélo con: python simulacion_cash_carry_completa.py
+# Simulación cash & carry completa (estrategia "gemini").
+# Correr con: python simulation_gemini.py  (o python cli.py backtest gemini)
+
+import argparse
 
 import pandas as pd
 import numpy as np
 
+from backtest_engine import gemini_audit_formulas, load_arrays, simulate_gemini
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from result_cache import cached_call
+from slippage import SlippageModel
+
 # Parámetros de simulación
 INPUT_FILE = "coinm_full_data_2024_filled.csv"
 OUTPUT_FILE = "simulacion_completa.csv"
@@ -16,107 +23,102 @@ MIN_FR_ENTRY = 0.0001
 BASIS_ENTRY = 0.0015
 FR_EXIT = 0.0
 BASIS_EXIT = 0.0005
-
-# Inicialización
-df = pd.read_csv(INPUT_FILE, parse_dates=["fundingTime"])
-df = df.sort_values("fundingTime")
-df = df.set_index("fundingTime")
-
-cash = INITIAL_CAPITAL_USD
-btc_spot = 0.0
-btc_funding = 0.0
-in_position = False
-cumulative_pnl = 0.0
-entry_spot = entry_mark = 0.0
-position_size = 0.0
-entry_cost = 0.0
-
-rows = []
-
-for timestamp, row in df.iterrows():
-    spot = row["spotPrice"]
-    mark = row["markPrice"]
-    fr = row["fundingRate"]
-    basis_pct = (mark / spot) - 1 if spot else 0
-
-    # Equity
-    total_btc = btc_spot + btc_funding
-    equity = cash + total_btc * spot
-
-    funding_pnl = basis_pnl = 0.0
-    funding_formula = basis_formula = ""
-    costs = 0.0
-    operacion = "nada"
-
-    if in_position:
-        # Funding
-        funding_btc = position_size * fr
-        btc_funding += funding_btc
-        funding_pnl = funding_btc * spot
-        funding_formula = f"{funding_btc:.6f} * {spot:.2f} = {funding_pnl:.2f}"
-
-        # Condición de salida
-        if fr <= FR_EXIT or basis_pct < BASIS_EXIT:
-            reason = "FR" if fr <= FR_EXIT else "Basis"
-            operacion = "cierre"
-            total_btc_to_sell = btc_spot + btc_funding
-            proceeds = total_btc_to_sell * spot * (1 - SPOT_FEE_RATE)
-            futures_fee = position_size * mark * FUTURES_FEE_RATE
-            cash += proceeds - futures_fee
-            costs = entry_cost + (total_btc_to_sell * spot * SPOT_FEE_RATE) + futures_fee
-
-            basis_move = (spot - mark) - (entry_spot - entry_mark)
-            basis_pnl = position_size * basis_move
-            basis_formula = f"({spot:.2f} - {mark:.2f}) - ({entry_spot:.2f} - {entry_mark:.2f}) = {basis_move:.2f}; {basis_move:.2f} * {position_size:.6f}"
-
-            btc_spot = btc_funding = 0.0
-            in_position = False
-            position_size = 0.0
-            entry_cost = 0.0
-
-    else:
-        # Entrada
-        if fr > MIN_FR_ENTRY and basis_pct > BASIS_ENTRY:
-            usd_to_spend = cash * CAPITAL_ALLOCATION_PCT
-            potential_btc = usd_to_spend / spot
-            if potential_btc >= MIN_TRADE_SIZE_BTC:
-                entry_spot = spot
-                entry_mark = mark
-                position_size = potential_btc
-                spot_cost = position_size * spot
-                spot_fee = spot_cost * SPOT_FEE_RATE
-                futures_fee = position_size * mark * FUTURES_FEE_RATE
-                entry_cost = spot_fee + futures_fee
-                total_needed = spot_cost + entry_cost
-
-                if cash >= total_needed:
-                    operacion = "apertura"
-                    cash -= total_needed
-                    btc_spot = position_size
-                    btc_funding = 0.0
-                    in_position = True
-
-    # Calcular PnL
-    total_pnl = funding_pnl + basis_pnl
-    cumulative_pnl += total_pnl
-
-    # Guardar fila
-    rows.append({
-        "timestamp": timestamp,
-        "operacion": operacion,
+SPOT_DEPTH_FILE = None  # snapshots L2 "time,side,price,qty" (o .npz) para el slippage
+PERP_DEPTH_FILE = None
+AUDIT_FORMULAS = True  # columnas funding_pnl_formula / basis_pnl_formula en el CSV
+USE_FORECAST = False  # entrar sólo si el carry esperado (forecast.py) supera los fees
+FORECAST_HORIZON = 21  # eventos de funding (7 días)
+FORECAST_REFIT_EVERY = 21  # reajustar el modelo cada N eventos (1 = en cada evento, mucha memoria)
+MIN_EDGE = 0.0
+
+
+def run(input_file=INPUT_FILE, output_file=OUTPUT_FILE, initial_capital=INITIAL_CAPITAL_USD,
+        spot_depth_file=SPOT_DEPTH_FILE, perp_depth_file=PERP_DEPTH_FILE, audit_formulas=AUDIT_FORMULAS,
+        use_forecast=USE_FORECAST, forecast_horizon=FORECAST_HORIZON, min_edge=MIN_EDGE,
+        refit_every=FORECAST_REFIT_EVERY):
+    # Inicialización
+    df = read_dataset(input_file, columns=FEATURE_COLUMNS)
+    df = df.sort_values("fundingTime")
+    df = df.set_index("fundingTime")
+
+    arr = load_arrays(df.reset_index(), fill_spot=False)
+    spot = arr["spotPrice"]
+    mark = arr["markPrice"]
+    slippage = None
+    if spot_depth_file or perp_depth_file:
+        times_ms = arr["fundingTime"].astype("datetime64[ms]").astype(np.int64)
+        slippage = SlippageModel.from_files(times_ms, spot_depth_file, perp_depth_file)
+    expected_carry = entry_mask = None
+    if use_forecast:
+        import forecast
+
+        expected_carry = forecast.forecast(arr["fundingRate"], spot, mark, horizon=forecast_horizon,
+                                           refit_every=refit_every)["forecast"]
+        entry_mask = forecast.entry_mask(
+            expected_carry, forecast.round_trip_cost(SPOT_FEE_RATE, FUTURES_FEE_RATE), min_edge)
+    res = cached_call(
+        simulate_gemini, arr["fundingRate"], spot, mark, initial_cash=initial_capital,
+        capital_allocation_pct=CAPITAL_ALLOCATION_PCT,
+        spot_fee_rate=SPOT_FEE_RATE,
+        futures_fee_rate=FUTURES_FEE_RATE,
+        min_trade_size_btc=MIN_TRADE_SIZE_BTC,
+        min_fr_entry=MIN_FR_ENTRY,
+        basis_entry=BASIS_ENTRY,
+        fr_exit=FR_EXIT,
+        basis_exit=BASIS_EXIT,
+        entry_mask=entry_mask,
+        slippage=slippage,
+    )
+
+    total_pnl = res["funding_pnl"] + res["basis_pnl"]
+    rows = {
+        "timestamp": df.index.to_numpy(),
+        "operacion": np.array(["nada", "apertura", "cierre"])[res["action"]],
         "spotPrice": spot,
         "markPrice": mark,
-        "fundingRate": fr,
-        "equity_usd": equity,
-        "funding_pnl_usd": funding_pnl,
-        "funding_pnl_formula": funding_formula,
-        "basis_pnl_usd": basis_pnl,
-        "basis_pnl_formula": basis_formula,
-        "costs_usd": costs,
+        "fundingRate": arr["fundingRate"],
+        "equity_usd": res["equity"],
+        "equity_mtm_usd": res["equity_mtm"],
+        "funding_pnl_usd": res["funding_pnl"],
+        "basis_pnl_usd": res["basis_pnl"],
+        "costs_usd": res["costs"],
         "total_pnl_usd": total_pnl,
-        "cumulative_pnl_usd": cumulative_pnl,
-    })
-
-# Exportar CSV
-pd.DataFrame(rows).to_csv(OUTPUT_FILE, index=False)
-print(f"✅ Archivo generado: {OUTPUT_FILE}")
\ No newline at end of file
+        "cumulative_pnl_usd": np.cumsum(total_pnl),
+    }
+
+    out = pd.DataFrame(rows)
+    if expected_carry is not None:
+        out.insert(out.columns.get_loc("fundingRate") + 1, "expected_carry", expected_carry)
+
+    # Fórmulas de auditoría: sólo se generan si se exportan
+    if audit_formulas:
+        funding_formula, basis_formula = gemini_audit_formulas(res, arr["fundingRate"], spot, mark)
+        out.insert(out.columns.get_loc("funding_pnl_usd") + 1, "funding_pnl_formula", funding_formula)
+        out.insert(out.columns.get_loc("basis_pnl_usd") + 1, "basis_pnl_formula", basis_formula)
+
+    # Exportar CSV
+    out.to_csv(output_file, index=False)
+    print(f"✅ Archivo generado: {output_file}")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cash & carry gated on funding and basis thresholds.")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CAPITAL_USD)
+    parser.add_argument("--spot-depth", default=SPOT_DEPTH_FILE, help="L2 snapshots for spot slippage")
+    parser.add_argument("--perp-depth", default=PERP_DEPTH_FILE, help="L2 snapshots for perp slippage")
+    parser.add_argument("--no-formulas", action="store_true", help="skip the audit formula columns")
+    parser.add_argument("--forecast", action="store_true", help="enter only on forecast carry above fees")
+    parser.add_argument("--horizon", type=int, default=FORECAST_HORIZON, help="forecast horizon in funding events")
+    parser.add_argument("--min-edge", type=float, default=MIN_EDGE, help="required carry above fees")
+    parser.add_argument("--refit-every", type=int, default=FORECAST_REFIT_EVERY, help="forecast refit period in events")
+    args = parser.parse_args(argv)
+    run(args.input, args.output, args.initial_cash, args.spot_depth, args.perp_depth,
+        AUDIT_FORMULAS and not args.no_formulas, USE_FORECAST or args.forecast, args.horizon, args.min_edge,
+        args.refit_every)
+
+
+if __name__ == "__main__":
+    main()
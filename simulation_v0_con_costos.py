@@ -1,61 +1,70 @@
+import argparse
+
+import numpy as np
 import pandas as pd
 
+from backtest_engine import load_arrays, simulate_v0_costs
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from result_cache import cached_call
+
 INPUT_CSV = "coinm_full_data_2024.csv"
 OUTPUT_CSV = "strategy_results.csv"
 INITIAL_CASH = 1000.0
+COST_RATE = 0.0015  # por pata
+USE_FORECAST = False  # entrar sólo si el carry esperado (forecast.py) supera los costos
+FORECAST_HORIZON = 21  # eventos de funding (7 días)
+FORECAST_REFIT_EVERY = 21  # reajustar el modelo cada N eventos (1 = en cada evento, mucha memoria)
+MIN_EDGE = 0.0
+
+
+def run(input_csv=INPUT_CSV, output_csv=OUTPUT_CSV, initial_cash=INITIAL_CASH, use_forecast=USE_FORECAST,
+        forecast_horizon=FORECAST_HORIZON, min_edge=MIN_EDGE, refit_every=FORECAST_REFIT_EVERY):
+    df = read_dataset(input_csv, columns=FEATURE_COLUMNS).sort_values("fundingTime")
+    arr = load_arrays(df)
+    # El rate realizado (prev_rate) llega tarde a la decisión: con --forecast se
+    # entra según el carry esperado de los próximos eventos
+    entry_mask = None
+    if use_forecast:
+        import forecast
+
+        expected = forecast.forecast(arr["fundingRate"], arr["spotPrice"], arr["markPrice"],
+                                     horizon=forecast_horizon, refit_every=refit_every)["forecast"]
+        entry_mask = forecast.entry_mask(expected, 2 * COST_RATE, min_edge)
+    # Funding se procesa con el rate del ciclo anterior (prev_rate) dentro del engine
+    res = cached_call(simulate_v0_costs, arr["fundingRate"], arr["spotPrice"], arr["markPrice"], initial_cash=initial_cash,
+                      cost_rate=COST_RATE, entry_mask=entry_mask)
+    cash = float(res["cash"][-1]) if len(df) else initial_cash
+
+    results = {
+        "fundingTime": df["fundingTime"].to_numpy(),
+        "Funding Rate": arr["fundingRate"],
+        "Position": np.where(res["position"] != 0, "ARB", "Cash"),
+        "Funding+Basis P&L": res["pnl"],
+        "Cash Balance": res["cash"],
+    }
+
+    out = pd.DataFrame(results)
+    out.to_csv(output_csv, index=False)
+
+    print(f"Start cash: ${initial_cash:.2f}")
+    print(f"End cash:   ${cash:.2f}")
+    print(f"Results saved to {output_csv}")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulation_v0 with flat costs per leg.")
+    parser.add_argument("--input", default=INPUT_CSV)
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CASH)
+    parser.add_argument("--forecast", action="store_true", help="enter only on forecast carry above costs")
+    parser.add_argument("--horizon", type=int, default=FORECAST_HORIZON, help="forecast horizon in funding events")
+    parser.add_argument("--min-edge", type=float, default=MIN_EDGE, help="required carry above costs")
+    parser.add_argument("--refit-every", type=int, default=FORECAST_REFIT_EVERY, help="forecast refit period in events")
+    args = parser.parse_args(argv)
+    run(args.input, args.output, args.initial_cash, USE_FORECAST or args.forecast, args.horizon, args.min_edge,
+        args.refit_every)
+
 
-df = pd.read_csv(INPUT_CSV, parse_dates=["fundingTime"]).sort_values("fundingTime")
-cash = INITIAL_CASH
-position = None
-entry = {}
-results = []
-prev_rate = None  # Almacena el funding rate del ciclo anterior
-
-for _, r in df.iterrows():
-    current_rate = float(r["fundingRate"])
-    t = r["fundingTime"]
-    spot = r["spotPrice"] if pd.notna(r["spotPrice"]) else float(r["markPrice"])
-    perp = float(r["markPrice"])
-    spot = float(spot) if pd.notna(spot) else perp
-    pnl = 0.0
-
-    # Procesar funding basado en prev_rate si hay posición abierta
-    if position == "ARB":
-        if prev_rate is not None:
-            funding_gain = cash * prev_rate
-            funding_cost = funding_gain * 0.0015
-            net_funding = funding_gain - funding_cost
-            pnl += net_funding
-
-        # Cerrar posición si el current_rate es ≤ 0
-        if current_rate <= 0:
-            basis_move = (spot - perp) - (entry["spot"] - entry["perp"])
-            basis_gain = entry["size"] * basis_move
-            closing_notional = entry["size"] * perp
-            closing_cost = closing_notional * 0.0015
-            pnl += (basis_gain - closing_cost)
-            position = None
-
-    # Abrir posición si el current_rate es positivo y no hay posición
-    if current_rate > 0 and position is None:
-        open_cost = cash * 0.0015
-        cash -= open_cost
-        position = "ARB"
-        entry = {"spot": spot, "perp": perp, "size": cash / perp}
-
-    cash += pnl
-    results.append({
-        "fundingTime": t,
-        "Funding Rate": current_rate,
-        "Position": position or "Cash",
-        "Funding+Basis P&L": pnl,
-        "Cash Balance": cash
-    })
-    prev_rate = current_rate  # Actualizar para la próxima iteración
-
-out = pd.DataFrame(results)
-out.to_csv(OUTPUT_CSV, index=False)
-
-print(f"Start cash: ${INITIAL_CASH:.2f}")
-print(f"End cash:   ${cash:.2f}")
-print(f"Results saved to {OUTPUT_CSV}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,87 @@
+import argparse
+
+import numpy as np
 import pandas as pd
 
+from backtest_engine import (
+    LONG_SPOT_SHORT_PERP,
+    SHORT_SPOT_LONG_PERP,
+    load_arrays,
+    simulate_with_rev,
+)
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from result_cache import cached_call
+
 INPUT_CSV  = "coinm_full_data_2024.csv"
 OUTPUT_CSV = "strategy_results.csv"
 INITIAL_CASH = 1000.0
+USE_FORECAST = False  # entrar sólo si el carry esperado (forecast.py) de esa dirección supera los fees
+FORECAST_HORIZON = 21  # eventos de funding (7 días)
+FORECAST_REFIT_EVERY = 21  # reajustar el modelo cada N eventos (1 = en cada evento, mucha memoria)
+MIN_EDGE = 0.0
 
-df = pd.read_csv(INPUT_CSV, parse_dates=["fundingTime"]).sort_values("fundingTime")
-cash = INITIAL_CASH
-position = None
-entry = {}
-results = []
 
-for _, r in df.iterrows():
-    rate = float(r["fundingRate"])
-    t = r["fundingTime"]
-    spot = r["spotPrice"] if pd.notna(r["spotPrice"]) else float(r["markPrice"])
-    perp = float(r["markPrice"])
-    basis = spot - perp
-    pnl = 0.0
+def run(input_csv=INPUT_CSV, output_csv=OUTPUT_CSV, initial_cash=INITIAL_CASH, use_forecast=USE_FORECAST,
+        forecast_horizon=FORECAST_HORIZON, min_edge=MIN_EDGE, refit_every=FORECAST_REFIT_EVERY):
+    df = read_dataset(input_csv, columns=FEATURE_COLUMNS).sort_values("fundingTime")
+    arr = load_arrays(df)
+    # Con --forecast cada dirección tiene su propio gate: el carry esperado de
+    # long spot / short perp es el forecast, el de la reversa su opuesto
+    entry_mask = short_entry_mask = None
+    if use_forecast:
+        import forecast
 
-    # Open SHORT_PERP_LONG_SPOT if funding > 0
-    if rate > 0 and position is None:
-        position = "SHORT_PERP_LONG_SPOT"
-        entry = {"spot": spot, "perp": perp, "size": cash / perp}
+        expected = forecast.forecast(arr["fundingRate"], arr["spotPrice"], arr["markPrice"],
+                                     horizon=forecast_horizon, refit_every=refit_every)["forecast"]
+        entry_mask = forecast.entry_mask(expected, min_edge=min_edge)
+        short_entry_mask = forecast.entry_mask(expected, min_edge=min_edge, short=True)
+    res = cached_call(simulate_with_rev, arr["fundingRate"], arr["spotPrice"], arr["markPrice"], initial_cash=initial_cash,
+                      entry_mask=entry_mask, short_entry_mask=short_entry_mask)
+    cash = float(res["cash"][-1]) if len(df) else initial_cash
 
-    # Open LONG_PERP_SHORT_SPOT if funding < 0 and basis > 0
-    if rate < 0 and position is None and basis > 0:
-        position = "LONG_PERP_SHORT_SPOT"
-        entry = {"spot": spot, "perp": perp, "size": cash / perp}
+    position_labels = np.select(
+        [res["position"] == LONG_SPOT_SHORT_PERP, res["position"] == SHORT_SPOT_LONG_PERP],
+        ["SHORT_PERP_LONG_SPOT", "LONG_PERP_SHORT_SPOT"],
+        "CASH",
+    )
+    results = {
+        "fundingTime": df["fundingTime"].to_numpy(),
+        "Funding Rate": arr["fundingRate"],
+        "Basis": res["basis"],
+        "Position": position_labels,
+        "Funding+Basis P&L": res["pnl"],
+        "Cash Balance": res["cash"],
+    }
 
-    # Collect funding payment while in position
-    if position in ("SHORT_PERP_LONG_SPOT", "LONG_PERP_SHORT_SPOT"):
-        pnl += cash * rate
+    out = pd.DataFrame(results)
+    out.to_csv(output_csv, index=False)
 
-    # Close SHORT_PERP_LONG_SPOT when funding ≤ 0
-    if position == "SHORT_PERP_LONG_SPOT" and rate <= 0:
-        basis_move = (spot - perp) - (entry["spot"] - entry["perp"])
-        pnl += entry["size"] * basis_move
-        position = None
+    # APY Calculation
+    total_hours = (df["fundingTime"].max() - df["fundingTime"].min()).total_seconds() / 3600
+    total_days = total_hours / 24
+    apy = (cash / initial_cash) ** (365 / total_days) - 1
 
-    # Close LONG_PERP_SHORT_SPOT when funding ≥ 0
-    if position == "LONG_PERP_SHORT_SPOT" and rate >= 0:
-        basis_move = (entry["spot"] - entry["perp"]) - (spot - perp)
-        pnl += entry["size"] * basis_move
-        position = None
+    print(f"Start cash: ${initial_cash:.2f}")
+    print(f"End cash:   ${cash:.2f}")
+    print(f"Duration days: {total_days:.1f}")
+    print(f"Annual Percentage Yield (APY): {apy*100:.2f}%")
+    print(f"Results saved to {output_csv}")
+    return out
 
-    cash += pnl
-    results.append({
-        "fundingTime": t,
-        "Funding Rate": rate,
-        "Basis": basis,
-        "Position": position or "CASH",
-        "Funding+Basis P&L": pnl,
-        "Cash Balance": cash
-    })
 
-out = pd.DataFrame(results)
-out.to_csv(OUTPUT_CSV, index=False)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carry in both directions depending on the funding sign.")
+    parser.add_argument("--input", default=INPUT_CSV)
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CASH)
+    parser.add_argument("--forecast", action="store_true", help="enter each direction only on its forecast carry above fees")
+    parser.add_argument("--horizon", type=int, default=FORECAST_HORIZON, help="forecast horizon in funding events")
+    parser.add_argument("--min-edge", type=float, default=MIN_EDGE, help="required carry above fees")
+    parser.add_argument("--refit-every", type=int, default=FORECAST_REFIT_EVERY, help="forecast refit period in events")
+    args = parser.parse_args(argv)
+    run(args.input, args.output, args.initial_cash, USE_FORECAST or args.forecast, args.horizon, args.min_edge,
+        args.refit_every)
 
-# APY Calculation
-total_hours = (df["fundingTime"].max() - df["fundingTime"].min()).total_seconds() / 3600
-total_days = total_hours / 24
-apy = (cash / INITIAL_CASH) ** (365 / total_days) - 1
 
-print(f"Start cash: ${INITIAL_CASH:.2f}")
-print(f"End cash:   ${cash:.2f}")
-print(f"Duration days: {total_days:.1f}")
-print(f"Annual Percentage Yield (APY): {apy*100:.2f}%")
-print(f"Results saved to {OUTPUT_CSV}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# Execution-cost model from historical L2 depth snapshots.
+# A DepthBook keeps every snapshot of one market in flat arrays: snapshot
+# times, per-side offsets into the level arrays, and for each level its
+# price, cumulative quantity and cumulative notional (best level first). A
+# VWAP lookup is then two searchsorted calls: one for the snapshot at or
+# before the requested time, one for the size within that snapshot's levels.
+#
+# Snapshot files are CSV rows "time,side,price,qty" (time in ms, side "bid"
+# or "ask", qty in BTC) or the .npz written by save_depth. COIN-M perp books
+# quoted in contracts can be converted with contracts_to_btc first.
+#
+# Impact is the VWAP's adverse move from the snapshot's best price as a
+# fraction. simulate_gemini adds it to the spot / futures fee rate of the leg,
+# so fills stay at spotPrice / markPrice and slippage is paid as a cost.
+
+BID = 0
+ASK = 1
+SIDES = {"bid": BID, "ask": ASK}
+
+
+def contracts_to_btc(qty_contracts, price, contract_usd=100.0):
+    """Inverse-perp contract counts to BTC at the level price."""
+    return np.asarray(qty_contracts, dtype=np.float64) * contract_usd / np.asarray(price, dtype=np.float64)
+
+
+class DepthBook:
+    def __init__(self, times, offsets, price, cum_qty, cum_notional):
+        self.times = times  # (S,) int64 ms, sorted
+        self.offsets = offsets  # (2, S + 1) level ranges per side
+        self.price = price  # (2, L) levels, best first within each snapshot
+        self.cum_qty = cum_qty
+        self.cum_notional = cum_notional
+
+    @classmethod
+    def from_frame(cls, df):
+        """Builds the book from rows with columns time, side, price, qty."""
+        if df["side"].dtype.kind not in "iu":
+            df = df.assign(side=df["side"].map(SIDES))
+        times = np.unique(df["time"].to_numpy(dtype=np.int64))
+        sides = []
+        for side in (BID, ASK):
+            part = df[df["side"] == side]
+            # Best first: bids descending, asks ascending
+            part = part.sort_values(["time", "price"], ascending=[True, side == ASK], kind="stable")
+            t = part["time"].to_numpy(dtype=np.int64)
+            price = part["price"].to_numpy(dtype=np.float64)
+            qty = part["qty"].to_numpy(dtype=np.float64)
+            offsets = np.searchsorted(t, np.append(times, np.iinfo(np.int64).max), side="left")
+            # Cumulative sums restart at every snapshot. The leading zero keeps
+            # the lookup valid for snapshots (or a whole side) without levels.
+            cq = np.concatenate(([0.0], np.cumsum(qty)))
+            cn = np.concatenate(([0.0], np.cumsum(qty * price)))
+            start = offsets[:-1]
+            counts = np.diff(offsets)
+            base_q = np.repeat(cq[start], counts)
+            base_n = np.repeat(cn[start], counts)
+            sides.append((offsets, price, cq[1:] - base_q, cn[1:] - base_n))
+        width = max(len(s[1]) for s in sides)
+        pad = lambda a: np.pad(a, (0, width - len(a)))
+        return cls(
+            times,
+            np.vstack([s[0] for s in sides]),
+            np.vstack([pad(s[1]) for s in sides]),
+            np.vstack([pad(s[2]) for s in sides]),
+            np.vstack([pad(s[3]) for s in sides]),
+        )
+
+    def snapshot(self, time_ms):
+        """Index of the last snapshot at or before time_ms (-1 if none)."""
+        return int(np.searchsorted(self.times, time_ms, side="right")) - 1
+
+    def vwap(self, time_ms, side, qty):
+        """(vwap, impact) of taking qty BTC from `side` of the book at time_ms.
+
+        Buying takes the asks, selling the bids. Size beyond the visible depth
+        fills at the worst level. Returns (nan, 0.0) without a usable snapshot.
+        """
+        s = self.snapshot(time_ms)
+        if s < 0:
+            return float("nan"), 0.0
+        lo, hi = self.offsets[side, s], self.offsets[side, s + 1]
+        if hi <= lo:
+            return float("nan"), 0.0
+        if qty <= 0:
+            return float(self.price[side, lo]), 0.0
+        cq = self.cum_qty[side, lo:hi]
+        k = min(int(np.searchsorted(cq, qty, side="left")), hi - lo - 1)
+        filled_q = cq[k - 1] if k else 0.0
+        filled_n = self.cum_notional[side, lo + k - 1] if k else 0.0
+        px = self.price[side, lo + k]
+        vwap = (filled_n + (qty - filled_q) * px) / qty
+        best = self.price[side, lo]
+        impact = vwap / best - 1 if side == ASK else 1 - vwap / best
+        return float(vwap), float(impact)
+
+
+def save_depth(book, path):
+    np.savez(path, times=book.times, offsets=book.offsets, price=book.price,
+             cum_qty=book.cum_qty, cum_notional=book.cum_notional)
+
+
+def load_depth(path):
+    """DepthBook from a "time,side,price,qty" CSV or a save_depth .npz."""
+    if str(path).endswith(".npz"):
+        with np.load(path) as f:
+            return DepthBook(f["times"], f["offsets"], f["price"], f["cum_qty"], f["cum_notional"])
+    return DepthBook.from_frame(pd.read_csv(path))
+
+
+class SlippageModel:
+    """Per-trade extra cost rates for simulate_gemini from spot and perp depth.
+
+    Opening buys spot (asks) and shorts the perp (bids); closing sells spot
+    (bids) and buys back the perp (asks). `times` are the simulation rows'
+    fundingTime in ms. A leg without a book (None) adds no slippage.
+    """
+
+    def __init__(self, times, spot_book=None, perp_book=None):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.spot_book = spot_book
+        self.perp_book = perp_book
+
+    @classmethod
+    def from_files(cls, times, spot_path=None, perp_path=None):
+        return cls(times, spot_path and load_depth(spot_path), perp_path and load_depth(perp_path))
+
+    def _impact(self, book, i, side, qty):
+        return 0.0 if book is None else book.vwap(self.times[i], side, qty)[1]
+
+    def cost_rates(self, i, spot_qty, perp_qty, opening):
+        """(spot, perp) impact rates for trading spot_qty / perp_qty BTC on row i."""
+        if opening:
+            return self._impact(self.spot_book, i, ASK, spot_qty), self._impact(self.perp_book, i, BID, perp_qty)
+        return self._impact(self.spot_book, i, BID, spot_qty), self._impact(self.perp_book, i, ASK, perp_qty)
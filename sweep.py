@@ -0,0 +1,207 @@
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest_engine import (
+    ACTION_NONE,
+    ACTION_OPEN,
+    annualized_return,
+    load_arrays,
+    max_drawdown,
+    simulate_basis_hold,
+    simulate_gemini,
+)
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from result_cache import default_cache, result_key
+
+# Parameter sweep for the cash-and-carry thresholds.
+# The input CSV is parsed once in the parent process and copied into a
+# shared-memory block; every worker maps that block instead of receiving a
+# pickled DataFrame per task. Only the parameter dicts travel to the workers.
+# Rows already in the result cache (same data, code and parameters) are read
+# in the parent and never reach the pool.
+#
+# Examples:
+#   python sweep.py gemini --min-fr-entry 0.00005:0.0003:0.00005 --basis-entry 0.0005,0.001,0.0015
+#   python sweep.py basis --threshold 0.002:0.008:0.001 --hold-steps 1:6:1
+
+INPUT_FILE = "coinm_full_data_2024_filled.csv"
+OUTPUT_FILE = "sweep_results.csv"
+INITIAL_CAPITAL_USD = 1000.0
+
+# Defaults match the constants in simulation_gemini.py / simulation.py
+GEMINI_PARAMS = {
+    "min_fr_entry": "0.0001",
+    "basis_entry": "0.0015",
+    "fr_exit": "0.0",
+    "basis_exit": "0.0005",
+    "capital_allocation_pct": "0.95",
+}
+BASIS_PARAMS = {
+    "threshold": "0.005",
+    "hold_steps": "3",
+}
+INT_PARAMS = {"hold_steps"}
+
+# Rows of the shared block
+ROW_RATE, ROW_SPOT, ROW_SPOT_FILLED, ROW_MARK = range(4)
+
+_worker = {}
+
+
+def parse_range(text, cast=float):
+    """Parses "a,b,c" or an inclusive "start:stop:step" range into a list of values."""
+    if ":" in text:
+        start, stop, step = (float(x) for x in text.split(":"))
+        if step <= 0:
+            raise ValueError(f"Range step must be positive: {text}")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        values = [start + k * step for k in range(count)]
+        # Round away the float noise from start + k * step
+        values = [round(v, 12) for v in values]
+    else:
+        values = [float(x) for x in text.split(",") if x.strip()]
+    return [cast(v) for v in values]
+
+
+def build_grid(param_texts):
+    """Cartesian product of every parameter range as a list of dicts."""
+    names = list(param_texts)
+    ranges = [parse_range(param_texts[k], int if k in INT_PARAMS else float) for k in names]
+    return [dict(zip(names, combo)) for combo in itertools.product(*ranges)]
+
+
+def to_shared_memory(arr):
+    """Copies rate/spot/mark into a new shared-memory block; returns (shm, view)."""
+    n = len(arr["fundingRate"])
+    spot = arr["spotPrice"]
+    spot_filled = np.where(np.isnan(spot), arr["markPrice"], spot)
+    shm = shared_memory.SharedMemory(create=True, size=max(4 * n * 8, 1))
+    data = np.ndarray((4, n), dtype=np.float64, buffer=shm.buf)
+    data[ROW_RATE] = arr["fundingRate"]
+    data[ROW_SPOT] = spot
+    data[ROW_SPOT_FILLED] = spot_filled
+    data[ROW_MARK] = arr["markPrice"]
+    return shm, data
+
+
+def _init_worker(shm_name, n, days, initial_cash):
+    # Pool workers share the parent's resource tracker, so the block is
+    # unlinked exactly once by the parent in run_sweep
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["data"] = np.ndarray((4, n), dtype=np.float64, buffer=shm.buf)
+    _worker["days"] = days
+    _worker["initial_cash"] = initial_cash
+
+
+def run_one(strategy, params, data, days, initial_cash):
+    """Runs one parameter set and returns its summary row."""
+    rate = data[ROW_RATE]
+    mark = data[ROW_MARK]
+    if strategy == "gemini":
+        spot = data[ROW_SPOT]
+        res = simulate_gemini(rate, spot, mark, initial_cash, **params, jit=True)
+        equity = res["cash"] + res["btc"] * np.nan_to_num(spot)
+        trades = int(np.count_nonzero(res["action"] == ACTION_OPEN))
+    else:
+        res = simulate_basis_hold(rate, data[ROW_SPOT_FILLED], mark, initial_cash, **params, jit=True)
+        equity = res["cash"]
+        trades = int(np.count_nonzero(res["action"] != ACTION_NONE))
+
+    end_cash = float(equity[-1]) if len(equity) else initial_cash
+    return {
+        **params,
+        "end_cash": end_cash,
+        "apy": annualized_return(end_cash, initial_cash, days),
+        "trades": trades,
+        "max_drawdown": max_drawdown(np.concatenate(([initial_cash], equity))),
+    }
+
+
+def _run_task(task):
+    strategy, params = task
+    return run_one(strategy, params, _worker["data"], _worker["days"], _worker["initial_cash"])
+
+
+def run_sweep(df, strategy, grid, workers=None, initial_cash=INITIAL_CAPITAL_USD, cache=None):
+    """Runs every parameter set in grid on a process pool and returns the ranked table.
+
+    cache: a result_cache.ResultCache, default_cache() if None, False to skip.
+    """
+    import pandas as pd
+
+    df = df.sort_values("fundingTime").reset_index(drop=True)
+    arr = load_arrays(df, fill_spot=False)
+    n = len(df)
+    days = (df["fundingTime"].max() - df["fundingTime"].min()).total_seconds() / 86400 if n else 0.0
+
+    cache = default_cache() if cache is None else cache or None
+    rows = [None] * len(grid)
+    keys = [None] * len(grid)
+    if cache is not None:
+        data = (arr["fundingTime"].astype("datetime64[ms]"), arr["fundingRate"], arr["spotPrice"], arr["markPrice"])
+        for i, params in enumerate(grid):
+            # run_one's code version covers backtest_engine and kernels through its imports
+            keys[i] = result_key(run_one, data, {"strategy": strategy, "params": params, "days": days,
+                                                 "initial_cash": initial_cash})
+            rows[i] = cache.get(keys[i]) if keys[i] else None
+    todo = [i for i, row in enumerate(rows) if row is None]
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        shm, _ = to_shared_memory(arr)
+        try:
+            tasks = [(strategy, grid[i]) for i in todo]
+            chunksize = max(1, len(tasks) // (workers * 4))
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(shm.name, n, days, initial_cash),
+            ) as pool:
+                for i, row in zip(todo, pool.map(_run_task, tasks, chunksize=chunksize)):
+                    rows[i] = row
+                    if cache is not None and keys[i]:
+                        cache.put(keys[i], row)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    out = pd.DataFrame(rows)
+    if out.empty:
+        return out
+    out = out.sort_values(["apy", "max_drawdown"], ascending=[False, True], na_position="last")
+    out.insert(0, "rank", np.arange(1, len(out) + 1))
+    return out.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep for the cash-and-carry strategies.")
+    parser.add_argument("strategy", choices=["gemini", "basis"])
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CAPITAL_USD)
+    for name, default in {**GEMINI_PARAMS, **BASIS_PARAMS}.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", default=default,
+                            help=f"values as a,b,c or start:stop:step (default {default})")
+    args = parser.parse_args(argv)
+
+    names = GEMINI_PARAMS if args.strategy == "gemini" else BASIS_PARAMS
+    grid = build_grid({k: getattr(args, k) for k in names})
+
+    df = read_dataset(args.input, columns=FEATURE_COLUMNS)
+    print(f"Running {len(grid)} parameter sets on {len(df)} rows...")
+    out = run_sweep(df, args.strategy, grid, workers=args.workers, initial_cash=args.initial_cash)
+    out.to_csv(args.output, index=False)
+
+    print(out.head(10).to_string(index=False))
+    print(f"\n✅ Sweep guardado en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
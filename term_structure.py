@@ -0,0 +1,367 @@
+import argparse
+import datetime as dt
+
+import numpy as np
+
+from async_fetch import FUNDING_INTERVAL_MS
+
+# Quarterly delivery futures (BTCUSD_YYMMDD) next to the perpetual.
+#
+# On a dated future the carry is not funding but the basis to expiry,
+# annualized: (future / spot - 1) * 365 / days_to_expiry. Binance COIN-M lists
+# the current and the next quarter, each delivering at 08:00 UTC on the last
+# Friday of Mar/Jun/Sep/Dec.
+#
+# fetch_quarterlies pulls the mark-price klines of every quarterly alive in a
+# range through the market-data cache (so the raw term structure is stored in
+# data_cache/mark/BTCUSD_YYMMDD_<interval>/). build_index puts it on the
+# funding grid of the merged dataset as (time x contract) matrices: price,
+# days to expiry and annualized basis, plus the combined hedge matrices used
+# by simulate_roll_carry, where column 0 is the perp and column k + 1 is
+# quarterly k. save_index / load_index keep it as .npz.
+#
+# simulate_roll_carry holds long spot against whichever hedge pays more:
+# the perp (funding annualized) or a quarterly with at least min_dte days
+# left. The best hedge per row is an argmax over the carry matrix computed
+# before the loop; inside the loop every lookup is a flat list index.
+
+PAIR = "BTCUSD"
+SYMBOL_PERP = "BTCUSD_PERP"
+DELIVERY_HOUR_UTC = 8
+LISTING_DAYS = 200  # a quarterly trades for about two quarters before delivery
+DAY_MS = 86_400_000
+PERIODS_PER_YEAR = 365 * DAY_MS / FUNDING_INTERVAL_MS
+
+INPUT_FILE = "coinm_full_data_2024_filled.csv"
+INDEX_FILE = "coinm_quarterlies_index.npz"
+OUTPUT_FILE = "roll_carry_results.csv"
+INITIAL_CASH = 1000.0
+
+ACTION_NONE = 0
+ACTION_OPEN = 1
+ACTION_CLOSE = 2
+ACTION_ROLL = 3
+HEDGE_NONE = -1
+HEDGE_PERP = 0
+
+
+def last_friday(year, month):
+    """Date of the last Friday of a month."""
+    nxt = dt.date(year + month // 12, month % 12 + 1, 1)
+    last = nxt - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - 4) % 7)
+
+
+def quarterly_contracts(start_ms, end_ms, pair=PAIR):
+    """(symbol, expiry ms) of every quarterly trading at some point in [start_ms, end_ms]."""
+    start = dt.datetime.fromtimestamp(start_ms / 1000, dt.timezone.utc)
+    out = []
+    year, month = start.year, 3 * ((start.month - 1) // 3) + 3
+    while True:
+        day = last_friday(year, month)
+        expiry = dt.datetime(day.year, day.month, day.day, DELIVERY_HOUR_UTC, tzinfo=dt.timezone.utc)
+        expiry_ms = int(expiry.timestamp() * 1000)
+        if expiry_ms - LISTING_DAYS * DAY_MS > end_ms:
+            break
+        if expiry_ms >= start_ms:
+            out.append((f"{pair}_{day:%y%m%d}", expiry_ms))
+        year, month = (year + 1, 3) if month == 12 else (year, month + 3)
+    return out
+
+
+def fetch_quarterlies(cache, start_ms, end_ms, interval="1h", pair=PAIR):
+    """{symbol: (expiry ms, times ms, mark closes)} through the market-data cache."""
+    out = {}
+    for symbol, expiry_ms in quarterly_contracts(start_ms, end_ms, pair):
+        lo = max(start_ms, expiry_ms - LISTING_DAYS * DAY_MS)
+        hi = min(end_ms, expiry_ms)
+        rows = cache.get("mark", symbol, lo, hi, interval)
+        print(f"{symbol}: {len(rows)} mark klines")
+        out[symbol] = (expiry_ms, rows["time"].to_numpy(np.int64), rows["value"].to_numpy(np.float64))
+    return out
+
+
+def asof(grid_ms, times, values):
+    """Last value at or before each grid time; NaN before the first one."""
+    pos = np.searchsorted(times, grid_ms, side="right") - 1
+    out = np.full(len(grid_ms), np.nan)
+    ok = pos >= 0
+    out[ok] = values[pos[ok]]
+    return out
+
+
+def build_index(grid_ms, spot, rate, mark, quarterlies):
+    """Term-structure matrices on the funding grid.
+
+    quarterlies is fetch_quarterlies' {symbol: (expiry_ms, times, closes)}.
+    Quarterly prices are as-of the grid time and NaN outside the contract's
+    life; dte is in days (+inf for the perp column of the hedge matrices).
+    Missing spot falls back to mark, as in the simulations.
+    """
+    grid_ms = np.asarray(grid_ms, dtype=np.int64)
+    spot = np.asarray(spot, dtype=np.float64)
+    spot = np.where(np.isnan(spot), np.asarray(mark, dtype=np.float64), spot)
+    items = sorted(quarterlies.items(), key=lambda kv: kv[1][0])
+    symbols = [s for s, _ in items]
+    expiry = np.array([e for _, (e, _, _) in items], dtype=np.int64)
+    n, k = len(grid_ms), len(items)
+
+    price = np.full((n, k), np.nan)
+    for j, (_, (e, times, closes)) in enumerate(items):
+        price[:, j] = asof(grid_ms, np.asarray(times, dtype=np.int64), np.asarray(closes, dtype=np.float64))
+    dte = (expiry[None, :] - grid_ms[:, None]) / DAY_MS
+    price[dte <= 0] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        basis_ann = (price / spot[:, None] - 1) * 365 / dte
+
+    return {
+        "grid_ms": grid_ms,
+        "symbols": np.array(symbols, dtype=str),
+        "expiry_ms": expiry,
+        "price": price,
+        "dte": dte,
+        "basis_ann": basis_ann,
+        # hedge matrices: column 0 perp, column j + 1 quarterly j
+        "hedge_price": np.column_stack([np.asarray(mark, dtype=np.float64), price]),
+        "hedge_dte": np.column_stack([np.full(n, np.inf), dte]),
+        "carry": np.column_stack([np.asarray(rate, dtype=np.float64) * PERIODS_PER_YEAR, basis_ann]),
+    }
+
+
+def basis_by_dte(index, max_days=LISTING_DAYS):
+    """(contract, whole days to expiry) -> mean annualized basis; NaN where never observed."""
+    k = len(index["symbols"])
+    days = np.floor(index["dte"]).astype(np.int64)
+    ok = ~np.isnan(index["basis_ann"]) & (days >= 0) & (days <= max_days)
+    cols = np.broadcast_to(np.arange(k), days.shape)
+    flat = cols[ok] * (max_days + 1) + days[ok]
+    total = np.bincount(flat, weights=index["basis_ann"][ok], minlength=k * (max_days + 1))
+    count = np.bincount(flat, minlength=k * (max_days + 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (total / count).reshape(k, max_days + 1)
+
+
+def save_index(index, path):
+    np.savez(path, **index)
+
+
+def load_index(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def align_index(index, grid_ms, rate, mark):
+    """Index rows for another funding grid, matched on exact timestamps.
+
+    Rows missing from the saved index get NaN quarterly prices; the perp
+    column is rebuilt from the given rate / mark.
+    """
+    grid_ms = np.asarray(grid_ms, dtype=np.int64)
+    src = index["grid_ms"]
+    pos = np.minimum(np.searchsorted(src, grid_ms), len(src) - 1)
+    hit = src[pos] == grid_ms
+    out = dict(index)
+    out["grid_ms"] = grid_ms
+    for name in ("price", "basis_ann"):
+        m = index[name][pos]
+        m[~hit] = np.nan
+        out[name] = m
+    out["dte"] = (index["expiry_ms"][None, :] - grid_ms[:, None]) / DAY_MS
+    n = len(grid_ms)
+    out["hedge_price"] = np.column_stack([np.asarray(mark, dtype=np.float64), out["price"]])
+    out["hedge_dte"] = np.column_stack([np.full(n, np.inf), out["dte"]])
+    out["carry"] = np.column_stack([np.asarray(rate, dtype=np.float64) * PERIODS_PER_YEAR, out["basis_ann"]])
+    return out
+
+
+def hedge_names(index):
+    return [SYMBOL_PERP] + index["symbols"].tolist()
+
+
+def simulate_roll_carry(spot, index, initial_cash=1000.0, capital_allocation_pct=0.95, spot_fee_rate=0.001,
+                        futures_fee_rate=0.0005, min_trade_size_btc=0.0001, entry_carry=0.10,
+                        exit_carry=0.02, roll_threshold=0.05, min_dte=7.0):
+    """Long spot hedged with the perp or a quarterly, rolled to whichever pays more.
+
+    Carries are annualized. From cash, open when the best hedge pays more than
+    entry_carry. While hedged, switch when another hedge pays roll_threshold
+    more, roll when the held quarterly gets within min_dte days of expiry (or
+    close if nothing pays exit_carry), and close when the held hedge pays less
+    than exit_carry and nothing pays entry_carry. A NaN carry on the held
+    hedge (missing funding rate or quote) holds the position. A quarterly
+    reaching expiry (only possible with min_dte=0) settles at spot without a
+    futures fee.
+    Funding on the perp accrues from the row after the open, as in
+    simulate_gemini.
+    """
+    spot = np.asarray(spot, dtype=np.float64)
+    n = len(spot)
+    carry = index["carry"]
+    hedge_dte = index["hedge_dte"]
+    w = carry.shape[1]
+
+    # Best eligible hedge per row, in one pass over the matrix
+    eligible = ~np.isnan(carry) & (hedge_dte >= min_dte) & ~np.isnan(index["hedge_price"])
+    masked = np.where(eligible, carry, -np.inf)
+    best = np.argmax(masked, axis=1)
+    best_carry = masked[np.arange(n), best]
+
+    carry_l = carry.ravel().tolist()
+    price_l = index["hedge_price"].ravel().tolist()
+    dte_l = hedge_dte.ravel().tolist()
+    rate_l = (carry[:, HEDGE_PERP] / PERIODS_PER_YEAR).tolist()
+    best_l = best.tolist()
+    best_carry_l = best_carry.tolist()
+    spot_l = spot.tolist()
+
+    action_out = np.zeros(n, dtype=np.int8)
+    hedge_out = np.full(n, HEDGE_NONE, dtype=np.int16)
+    carry_out = np.full(n, np.nan)
+    equity_out = np.empty(n)
+    cash_out = np.empty(n)
+    funding_out = np.zeros(n)
+    hedge_pnl_out = np.zeros(n)
+    costs_out = np.zeros(n)
+
+    cash = initial_cash
+    hedge = HEDGE_NONE
+    size = entry_hedge = last_hedge_px = 0.0
+
+    for i in range(n):
+        s = spot_l[i]
+        row = i * w
+        b = best_l[i]
+        bc = best_carry_l[i]
+
+        if hedge != HEDGE_NONE:
+            j = row + hedge
+            if hedge == HEDGE_PERP:
+                r = rate_l[i]
+                if r == r:
+                    f = size * price_l[j] * r
+                    cash += f
+                    funding_out[i] = f
+            expired = dte_l[j] <= 0
+            hp = s if expired else price_l[j]
+            if hp != hp:
+                hp = last_hedge_px  # no quote this row: hold, marked at the last one
+            last_hedge_px = hp
+            cur = carry_l[j]
+
+            target = hedge
+            if expired or dte_l[j] < min_dte:
+                target = b if bc >= exit_carry else HEDGE_NONE
+            elif cur < exit_carry:  # False for NaN: no carry reading, hold
+                target = b if bc > entry_carry else HEDGE_NONE
+            elif b != hedge and bc - cur > roll_threshold:
+                target = b
+
+            if target != hedge:
+                pnl = size * (entry_hedge - hp)
+                hedge_pnl_out[i] = pnl
+                if target == HEDGE_NONE:
+                    fee = size * s * spot_fee_rate + (0.0 if expired else size * hp * futures_fee_rate)
+                    cash += size * s + pnl - fee
+                    action_out[i] = ACTION_CLOSE
+                    size = 0.0
+                else:
+                    new_px = price_l[row + target]
+                    fee = size * ((0.0 if expired else hp) + new_px) * futures_fee_rate
+                    cash += pnl - fee
+                    entry_hedge = last_hedge_px = new_px
+                    action_out[i] = ACTION_ROLL
+                costs_out[i] = fee
+                hedge = target
+
+        elif bc > entry_carry:
+            potential_btc = cash * capital_allocation_pct / s
+            hp = price_l[row + b]
+            fee = potential_btc * s * spot_fee_rate + potential_btc * hp * futures_fee_rate
+            if potential_btc >= min_trade_size_btc and cash >= potential_btc * s + fee:
+                cash -= potential_btc * s + fee
+                size = potential_btc
+                hedge = b
+                entry_hedge = last_hedge_px = hp
+                costs_out[i] = fee
+                action_out[i] = ACTION_OPEN
+
+        hedge_out[i] = hedge
+        cash_out[i] = cash
+        if hedge != HEDGE_NONE:
+            carry_out[i] = carry_l[row + hedge]
+            equity_out[i] = cash + size * s + size * (entry_hedge - last_hedge_px)
+        else:
+            equity_out[i] = cash
+
+    return {
+        "action": action_out,
+        "hedge": hedge_out,
+        "carry": carry_out,
+        "equity": equity_out,
+        "cash": cash_out,
+        "funding_pnl": funding_out,
+        "hedge_pnl": hedge_pnl_out,
+        "costs": costs_out,
+    }
+
+
+def run(input_file=INPUT_FILE, index_file=INDEX_FILE, output_file=OUTPUT_FILE, initial_cash=INITIAL_CASH,
+        **params):
+    import pandas as pd
+
+    from dataset_io import FEATURE_COLUMNS, read_dataset
+    from backtest_engine import annualized_return, load_arrays, max_drawdown
+
+    df = read_dataset(input_file, columns=FEATURE_COLUMNS).sort_values("fundingTime").reset_index(drop=True)
+    arr = load_arrays(df)
+    grid_ms = arr["fundingTime"].astype("datetime64[ms]").astype(np.int64)
+    index = align_index(load_index(index_file), grid_ms, arr["fundingRate"], arr["markPrice"])
+    res = simulate_roll_carry(arr["spotPrice"], index, initial_cash, **params)
+
+    names = np.array([""] + hedge_names(index), dtype=object)
+    out = pd.DataFrame({
+        "timestamp": df["fundingTime"].to_numpy(),
+        "operacion": np.array(["nada", "apertura", "cierre", "roll"])[res["action"]],
+        "hedge": names[res["hedge"] + 1],
+        "carry_annualized": res["carry"],
+        "spotPrice": arr["spotPrice"],
+        "fundingRate": arr["fundingRate"],
+        "equity_usd": res["equity"],
+        "funding_pnl_usd": res["funding_pnl"],
+        "hedge_pnl_usd": res["hedge_pnl"],
+        "costs_usd": res["costs"],
+    })
+    out.to_csv(output_file, index=False)
+
+    equity = res["equity"]
+    end = float(equity[-1]) if len(equity) else initial_cash
+    days = (grid_ms[-1] - grid_ms[0]) / DAY_MS if len(grid_ms) else 0
+    print(f"Start cash: ${initial_cash:,.2f}")
+    print(f"End equity: ${end:,.2f}")
+    print(f"APY: {annualized_return(end, initial_cash, days) * 100:.2f}%")
+    print(f"Max drawdown: {max_drawdown(np.concatenate(([initial_cash], equity))) * 100:.2f}%")
+    print(f"Opens: {(res['action'] == ACTION_OPEN).sum()} | Rolls: {(res['action'] == ACTION_ROLL).sum()} | "
+          f"Closes: {(res['action'] == ACTION_CLOSE).sum()}")
+    print("Time hedged by contract:")
+    print(out["hedge"].replace("", "CASH").value_counts(normalize=True).to_string())
+    print(f"✅ Resultados guardados en: {output_file}")
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cash & carry rolled between the perp and the quarterlies.")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--index", default=INDEX_FILE, help="term-structure index written by get_data.py")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CASH)
+    parser.add_argument("--entry-carry", type=float, default=0.10, help="annualized carry to open")
+    parser.add_argument("--exit-carry", type=float, default=0.02, help="annualized carry to close")
+    parser.add_argument("--roll-threshold", type=float, default=0.05, help="annualized pickup to switch hedge")
+    parser.add_argument("--min-dte", type=float, default=7.0, help="days to expiry below which quarterlies roll")
+    args = parser.parse_args(argv)
+    run(args.input, args.index, args.output, args.initial_cash, entry_carry=args.entry_carry,
+        exit_carry=args.exit_carry, roll_threshold=args.roll_threshold, min_dte=args.min_dte)
+
+
+if __name__ == "__main__":
+    main()
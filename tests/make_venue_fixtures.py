@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from venues import BybitAdapter, FixtureGet, MultiVenueFetcher, OkxAdapter  # noqa: E402
+
+# Synthetic Bybit / OKX v5 responses for tests/test_venues.py.
+# The live APIs are not reachable from CI, so this script plays both venues
+# (same payload layout, paging and bound semantics as the v5 endpoints) and
+# stores every response the adapters request with FixtureGet(record=True):
+#
+#   python tests/make_venue_fixtures.py
+#
+# Prices are a seeded random walk. Funding is paid every 4h or 8h per symbol;
+# DECLARED is what the venue reports (Bybit instruments-info) or what the
+# adapter assumes (OKX, 8h), so some symbols disagree with their history.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "venues")
+H = 3_600_000
+T0 = int(pd.Timestamp("2024-03-01").timestamp() * 1000)
+T1 = T0 + 24 * H - 1
+PAGES = {"funding": 3, "spot": 10, "mark": 10}
+# (venue, perp symbol): (declared funding hours, observed funding hours)
+FUNDING_HOURS = {
+    ("BYBIT", "BTCUSDT"): (4, 4),
+    ("BYBIT", "ETHUSDT"): (8, 4),
+    ("OKX", "BTC-USD-SWAP"): (8, 8),
+    ("OKX", "ETH-USD-SWAP"): (8, 4),
+}
+JOBS = [
+    (BybitAdapter, "BTCUSDT", "BTCUSDT"),
+    (BybitAdapter, "ETHUSDT", "ETHUSDT"),
+    (OkxAdapter, "BTC-USD-SWAP", "BTC-USDT"),
+    (OkxAdapter, "ETH-USD-SWAP", "ETH-USDT"),
+]
+
+
+def _seed(*key):
+    return sum(ord(c) * (i + 1) for i, c in enumerate("/".join(key)))
+
+
+def closes(venue, symbol, kind):
+    """Hourly closes of one series over [T0, T1], keyed by open time."""
+    rng = np.random.default_rng(_seed(venue, symbol, kind))
+    base = 3400.0 if symbol.startswith("ETH") else 61000.0
+    px = base * np.exp(np.cumsum(rng.normal(0, 0.002, 24)))
+    return {T0 + h * H: round(float(p), 2) for h, p in enumerate(px)}
+
+
+def funding(venue, symbol):
+    """Funding rates keyed by funding time, on the observed interval."""
+    hours = FUNDING_HOURS[(venue, symbol)][1]
+    rng = np.random.default_rng(_seed(venue, symbol, "funding"))
+    times = range(T0, T1 + 1, hours * H)
+    return {t: round(float(r), 8) for t, r in zip(times, rng.normal(1e-4, 5e-5, len(times)))}
+
+
+def _newest_first(series, keep, limit):
+    return [(t, series[t]) for t in sorted(series, reverse=True) if keep(t)][:limit]
+
+
+def _candle(t, c, extra):
+    return [str(t), str(round(c * 0.999, 2)), str(round(c * 1.002, 2)), str(round(c * 0.997, 2)), str(c)] + extra
+
+
+async def bybit(url, params):
+    if url.endswith("instruments-info"):
+        declared = FUNDING_HOURS[("BYBIT", params["symbol"])][0]
+        return {"retCode": 0, "retMsg": "OK", "result": {"category": params["category"], "list": [
+            {"symbol": params["symbol"], "contractType": "LinearPerpetual", "status": "Trading",
+             "fundingInterval": declared * 60}]}, "time": T1}
+    lo = params.get("startTime", params.get("start"))
+    hi = params.get("endTime", params.get("end"))
+    keep = lambda t: lo <= t <= hi  # noqa: E731
+    if url.endswith("funding/history"):
+        rows = [{"symbol": params["symbol"], "fundingRate": str(r), "fundingRateTimestamp": str(t)}
+                for t, r in _newest_first(funding("BYBIT", params["symbol"]), keep, params["limit"])]
+    else:
+        kind = "spot" if url.endswith("/kline") else "mark"
+        extra = ["125.3", "7650000.1"] if kind == "spot" else []
+        rows = [_candle(t, c, extra)
+                for t, c in _newest_first(closes("BYBIT", params["symbol"], kind), keep, params["limit"])]
+    return {"retCode": 0, "retMsg": "OK", "result": {"category": params["category"], "symbol": params["symbol"],
+                                                     "list": rows}, "time": T1}
+
+
+async def okx(url, params):
+    keep = lambda t: params["before"] < t < params["after"]  # noqa: E731
+    inst = params["instId"]
+    if url.endswith("funding-rate-history"):
+        data = [{"instId": inst, "instType": "SWAP", "fundingRate": str(r), "realizedRate": str(r),
+                 "fundingTime": str(t), "method": "current_period"}
+                for t, r in _newest_first(funding("OKX", inst), keep, params["limit"])]
+    else:
+        kind = "mark" if "mark-price" in url else "spot"
+        extra = ["1"] if kind == "mark" else ["125.3", "7650000.1", "7650000.1", "1"]
+        data = [_candle(t, c, extra) for t, c in _newest_first(closes("OKX", inst, kind), keep, params["limit"])]
+    return {"code": "0", "msg": "", "data": data}
+
+
+async def record():
+    live = {"BYBIT": bybit, "OKX": okx}
+    for adapter_cls, perp, spot in JOBS:
+        adapter = adapter_cls()
+        adapter.page_limit = PAGES
+        get = FixtureGet(FIXTURES, live=live[adapter.name], record=True)
+        await MultiVenueFetcher(get=get).fetch_venue(adapter, perp, spot, T0, T1, "1h")
+
+
+if __name__ == "__main__":
+    for name in os.listdir(FIXTURES) if os.path.isdir(FIXTURES) else []:
+        os.remove(os.path.join(FIXTURES, name))
+    asyncio.run(record())
+    print(f"✅ {len(os.listdir(FIXTURES))} fixtures guardados en: {FIXTURES}")
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+import async_fetch
+from async_fetch import USED_WEIGHT_HEADER, AsyncBinanceFetcher
+
+# fetch_all against a local aiohttp.web stub of the three Binance endpoints.
+# The first funding request is rate limited (429 + Retry-After) and every
+# response reports the host's used weight, like the live API does.
+
+H = 3_600_000
+T0 = 1_709_251_200_000  # 2024-03-01 00:00 UTC
+T1 = T0 + 48 * H - 1
+RETRY_AFTER = 1
+USED_WEIGHT = {"dapi": "2000", "api": "500"}
+
+
+def in_range(request, times):
+    start, end = int(request.query["startTime"]), int(request.query["endTime"])
+    return [t for t in times if start <= t <= end][:int(request.query["limit"])]
+
+
+def kline(t):
+    close = 60000.0 + (t - T0) / H
+    return [t, str(close - 1), str(close + 5), str(close - 5), str(close), "1.0", t + H - 1]
+
+
+async def start_stub(calls):
+    async def funding(request):
+        calls.append("funding")
+        headers = {USED_WEIGHT_HEADER: USED_WEIGHT["dapi"]}
+        if calls.count("funding") == 1:
+            return web.Response(status=429, headers={**headers, "Retry-After": str(RETRY_AFTER)})
+        rows = [{"symbol": request.query["symbol"], "fundingTime": t, "fundingRate": "0.0001"}
+                for t in in_range(request, range(T0, T1 + 1, 8 * H))]
+        return web.json_response(rows, headers=headers)
+
+    def klines(host):
+        async def handler(request):
+            calls.append(host)
+            rows = [kline(t) for t in in_range(request, range(T0, T1 + 1, H))]
+            return web.json_response(rows, headers={USED_WEIGHT_HEADER: USED_WEIGHT[host]})
+        return handler
+
+    app = web.Application()
+    app.router.add_get("/dapi/v1/fundingRate", funding)
+    app.router.add_get("/dapi/v1/markPriceKlines", klines("dapi"))
+    app.router.add_get("/api/v3/klines", klines("api"))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def test_fetch_all_retries_429_and_syncs_used_weight(monkeypatch):
+    monkeypatch.setattr(async_fetch, "BACKOFF_BASE", 0.01)
+    synced = []
+    sync = async_fetch.TokenBucket.sync_used_weight
+
+    def spy(bucket, used):
+        synced.append((bucket.capacity, used))
+        sync(bucket, used)
+
+    monkeypatch.setattr(async_fetch.TokenBucket, "sync_used_weight", spy)
+    calls = []
+
+    async def run():
+        runner, url = await start_stub(calls)
+        try:
+            urls = {"funding": url + "/dapi/v1/fundingRate", "spot": url + "/api/v3/klines",
+                    "mark": url + "/dapi/v1/markPriceKlines"}
+            async with AsyncBinanceFetcher(base_urls=urls, concurrency=4) as fetcher:
+                t0 = time.monotonic()
+                frames = await fetcher.fetch_all(T0, T1)
+                return frames, fetcher, time.monotonic() - t0
+        finally:
+            await runner.cleanup()
+
+    (fund, spot, mark), fetcher, elapsed = asyncio.run(run())
+
+    assert sorted(calls) == ["api", "dapi", "funding", "funding"]
+    assert fetcher.stats == {"requests": 4, "retries": 1, "rows": 6 + 48 + 48}
+    # The 429 drained the dapi bucket for Retry-After seconds before the retry
+    assert elapsed >= RETRY_AFTER * 0.9
+    # Every response re-synced its host's bucket from the used-weight header
+    assert sorted(synced) == [(2400.0, "2000"), (2400.0, "2000"), (2400.0, "2000"), (6000.0, "500")]
+    assert fetcher.buckets["spot"].tokens <= 6000 - 500 + fetcher.buckets["spot"].rate * elapsed
+
+    assert len(fund) == 6 and (fund["symbol"] == "BTCUSD_PERP").all()
+    assert fund["fundingTime"].iloc[0].value // 1_000_000 == T0
+    assert fund["fundingRate"].astype(float).eq(0.0001).all()
+    assert len(spot) == len(mark) == 48
+    assert spot["spotPrice"].iloc[-1] == mark["markPrice"].iloc[-1] == 60047.0
@@ -0,0 +1,110 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from make_venue_fixtures import FIXTURES, H, PAGES, T0, T1, closes, funding
+from venues import BybitAdapter, FixtureGet, MultiVenueFetcher, OkxAdapter, VenueAdapter
+
+# The fixtures are synthetic v5 responses written by make_venue_fixtures.py
+# (the live APIs are not reachable from the tests); the expected values below
+# come from the same generator. Page limits are shrunk so each series needs
+# several windows or pages.
+
+
+class Recorder:
+    """FixtureGet wrapper that keeps the (url, params) of every request."""
+
+    def __init__(self, get):
+        self.get = get
+        self.calls = []
+
+    async def __call__(self, url, params):
+        self.calls.append((url, dict(params)))
+        return await self.get(url, params)
+
+
+def fetch(adapter, perp, spot):
+    adapter.page_limit = PAGES
+    get = Recorder(FixtureGet(FIXTURES))
+    fetcher = MultiVenueFetcher(get=get)
+    df = asyncio.run(fetcher.fetch_venue(adapter, perp, spot, T0, T1, "1h"))
+    return df, get.calls, fetcher.stats
+
+
+def check_frame(df, venue, perp, spot, hours):
+    """Schema, funding grid and as-of prices of one venue's normalized frame."""
+    times = pd.date_range("2024-03-01", periods=24 // hours, freq=f"{hours}h")
+    ms = [int(t.timestamp() * 1000) for t in times]
+    assert list(df.columns) == ["fundingTime", "symbol", "fundingRate", "markPrice", "spotPrice"]
+    assert (df["symbol"] == f"{venue}:{perp}").all()
+    assert df["fundingTime"].tolist() == list(times)
+    rates = funding(venue, perp)
+    assert df["fundingRate"].tolist() == pytest.approx([rates[t] for t in ms])
+    # Funding falls on the hour, so the as-of join picks the candle opened at it
+    assert df["spotPrice"].tolist() == pytest.approx([closes(venue, spot, "spot")[t] for t in ms])
+    assert df["markPrice"].tolist() == pytest.approx([closes(venue, perp, "mark")[t] for t in ms])
+
+
+def windows(calls, suffix, lo_key, hi_key):
+    return [(p[lo_key], p[hi_key]) for url, p in calls if url.endswith(suffix)]
+
+
+def test_bybit_declared_interval_sizes_the_windows():
+    df, calls, stats = fetch(BybitAdapter("linear"), "BTCUSDT", "BTCUSDT")
+
+    # 4h declared and paid: 3-event windows of 12h, one page each
+    assert windows(calls, "funding/history", "startTime", "endTime") == [(T0, T0 + 12 * H - 1), (T0 + 12 * H, T1)]
+    klines = [p for url, p in calls if url.endswith("/kline")]
+    assert {p["category"] for p in klines} == {"spot"}
+    assert {p["interval"] for p in klines} == {"60"}
+    check_frame(df, "BYBIT", "BTCUSDT", "BTCUSDT", 4)
+    assert stats["rows"] == 6 + 24 + 24
+
+
+def test_bybit_pages_backwards_when_history_is_denser_than_declared():
+    df, calls, _ = fetch(BybitAdapter("linear"), "ETHUSDT", "ETHUSDT")
+
+    # 8h declared but 4h paid: the one 24h window overflows and is paged newest first
+    assert windows(calls, "funding/history", "startTime", "endTime") == [(T0, T1), (T0, T0 + 12 * H - 1)]
+    check_frame(df, "BYBIT", "ETHUSDT", "ETHUSDT", 4)
+
+
+def test_okx_assumed_8h_interval():
+    df, calls, _ = fetch(OkxAdapter(), "BTC-USD-SWAP", "BTC-USDT")
+
+    # after / before are exclusive bounds around the window
+    assert windows(calls, "funding-rate-history", "after", "before") == [(T1 + 1, T0 - 1)]
+    candles = [p for url, p in calls if url.endswith("market/history-candles")]
+    assert len(candles) == 3 and {p["bar"] for p in candles} == {"1H"}
+    check_frame(df, "OKX", "BTC-USD-SWAP", "BTC-USDT", 8)
+
+
+def test_okx_pages_backwards_when_history_is_denser_than_assumed():
+    df, calls, _ = fetch(OkxAdapter(), "ETH-USD-SWAP", "ETH-USDT")
+
+    # A full page moves `after` to its oldest record
+    assert windows(calls, "funding-rate-history", "after", "before") == [(T1 + 1, T0 - 1), (T0 + 12 * H, T0 - 1)]
+    check_frame(df, "OKX", "ETH-USD-SWAP", "ETH-USDT", 4)
+
+
+def test_error_payloads_raise():
+    with pytest.raises(ValueError, match="Bybit error 10001"):
+        BybitAdapter().parse("funding", {"retCode": 10001, "retMsg": "params error", "result": {}})
+    with pytest.raises(ValueError, match="OKX error 51001"):
+        OkxAdapter().parse("spot", {"code": "51001", "msg": "Instrument ID does not exist", "data": []})
+
+
+def test_missing_fixture_names_the_request():
+    get = FixtureGet(FIXTURES)
+    with pytest.raises(FileNotFoundError, match="BTCUSD"):
+        asyncio.run(get("https://api.bybit.com/v5/market/instruments-info", {"category": "inverse", "symbol": "BTCUSD"}))
+
+
+def test_adapter_must_implement_request_and_parse():
+    class Partial(VenueAdapter):
+        def request(self, kind, symbol, start_ms, end_ms, interval=None):
+            return "", {}
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,188 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from async_fetch import FUNDING_INTERVAL_MS
+from dataset_io import COLUMNS, read_dataset, write_dataset
+
+# Data-quality stage between fetch and simulation for the merged
+# fundingTime/symbol/fundingRate/markPrice/spotPrice frame.
+#
+# Every check is a whole-column pass (per symbol, rows sorted by time).
+# The funding grid is grid_ms when given, otherwise inferred per symbol from
+# the median fundingTime spacing rounded to whole hours (8h on Binance COIN-M,
+# 4h / 1h on some Bybit and OKX contracts):
+#   jitter     fundingTime off the funding grid (e.g. 00:00:00.005); snapped
+#              to the nearest grid point when within max_jitter_ms
+#   off_grid   further than max_jitter_ms from the grid; row dropped
+#   duplicate  several rows on the same grid point after snapping; last kept
+#   gap        missing grid points between consecutive rows (one issue per
+#              gap, value = number of missing events); rows inserted with
+#              NaN values when reindex=True
+#   missing    NaN markPrice / spotPrice
+#   outlier    markPrice more than max_basis away from spot (or from the
+#              nearest valid spot when spot is missing); set to NaN
+#   stale      a price repeated for stale_run or more consecutive events;
+#              repeats after the first set to NaN
+#
+# repair() returns the repaired frame and an issue table with one row per
+# finding (fundingTime, symbol, check, column, value), so nothing is fixed
+# silently. Downstream fillna(markPrice) fallbacks then only see the gaps
+# that are listed in the report.
+
+MAX_JITTER_MS = 60_000
+MAX_BASIS = 0.05
+STALE_RUN = 3
+PRICE_COLUMNS = ["markPrice", "spotPrice"]
+HOUR_MS = 3_600_000
+ISSUE_COLUMNS = ["fundingTime", "symbol", "check", "column", "value"]
+
+
+def _issues(check, column, times, symbols, values):
+    return pd.DataFrame({
+        "fundingTime": times,
+        "symbol": symbols,
+        "check": check,
+        "column": column,
+        "value": np.asarray(values, dtype=np.float64),
+    })
+
+
+def snap_to_grid(ms, grid_ms=FUNDING_INTERVAL_MS):
+    """Nearest grid point of every int64 ms timestamp and the signed offset from it."""
+    snapped = (ms + grid_ms // 2) // grid_ms * grid_ms
+    return snapped, ms - snapped
+
+
+def infer_grid(ms):
+    """Funding interval of sorted int64 ms timestamps: median spacing rounded to whole hours."""
+    step = np.diff(ms)
+    step = step[step > 0]
+    if not len(step):
+        return FUNDING_INTERVAL_MS
+    return int(max(1, round(float(np.median(step)) / HOUR_MS)) * HOUR_MS)
+
+
+def run_starts(values):
+    """True where a new run of equal consecutive values starts (NaN never continues a run)."""
+    same = np.zeros(len(values), dtype=bool)
+    same[1:] = values[1:] == values[:-1]
+    return ~same
+
+
+def stale_mask(values, min_run=STALE_RUN):
+    """Repeats after the first element of every run of at least min_run equal values."""
+    starts = np.flatnonzero(run_starts(values))
+    lengths = np.diff(np.append(starts, len(values)))
+    run_len = np.repeat(lengths, lengths)
+    return (run_len >= min_run) & ~run_starts(values)
+
+
+def _repair_symbol(df, symbol, grid_ms, max_jitter_ms, max_basis, stale_run, reindex):
+    found = []
+    ms = df["fundingTime"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    grid_ms = grid_ms or infer_grid(ms)
+    snapped, offset = snap_to_grid(ms, grid_ms)
+    times = df["fundingTime"].to_numpy()
+
+    jitter = (offset != 0) & (np.abs(offset) <= max_jitter_ms)
+    off_grid = np.abs(offset) > max_jitter_ms
+    found.append(_issues("jitter", "fundingTime", times[jitter], symbol, offset[jitter]))
+    found.append(_issues("off_grid", "fundingTime", times[off_grid], symbol, offset[off_grid]))
+    df = df.assign(fundingTime=pd.to_datetime(snapped, unit="ms"))[~off_grid]
+    snapped = snapped[~off_grid]
+
+    # Sorted, so duplicates are adjacent; keep the last row of every grid point
+    dup = np.zeros(len(snapped), dtype=bool)
+    dup[:-1] = snapped[1:] == snapped[:-1]
+    found.append(_issues("duplicate", "fundingTime", df["fundingTime"].to_numpy()[dup], symbol,
+                         np.zeros(dup.sum())))
+    df = df[~dup].reset_index(drop=True)
+    snapped = snapped[~dup]
+
+    missing_events = np.diff(snapped) // grid_ms - 1
+    gap = np.flatnonzero(missing_events > 0)
+    gap_start = pd.to_datetime(snapped[gap] + grid_ms, unit="ms")
+    found.append(_issues("gap", "fundingTime", gap_start, symbol, missing_events[gap]))
+
+    mark = df["markPrice"].to_numpy(dtype=np.float64).copy()
+    spot = df["spotPrice"].to_numpy(dtype=np.float64).copy()
+    t = df["fundingTime"].to_numpy()
+    for col, arr in (("markPrice", mark), ("spotPrice", spot)):
+        nan = np.isnan(arr)
+        found.append(_issues("missing", col, t[nan], symbol, arr[nan]))
+
+    ref = df["spotPrice"].ffill().bfill().to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        outlier = np.abs(mark / ref - 1) > max_basis
+    found.append(_issues("outlier", "markPrice", t[outlier], symbol, mark[outlier]))
+    mark[outlier] = np.nan
+
+    for col, arr in (("markPrice", mark), ("spotPrice", spot)):
+        stale = stale_mask(arr, stale_run)
+        found.append(_issues("stale", col, t[stale], symbol, arr[stale]))
+        arr[stale] = np.nan
+
+    df = df.assign(markPrice=mark, spotPrice=spot)
+    if reindex and len(df):
+        grid = pd.date_range(df["fundingTime"].iloc[0], df["fundingTime"].iloc[-1], freq=f"{grid_ms}ms")
+        df = df.set_index("fundingTime").reindex(grid).rename_axis("fundingTime").reset_index()
+        df["symbol"] = symbol
+    return df, found
+
+
+def repair(df, grid_ms=None, max_jitter_ms=MAX_JITTER_MS, max_basis=MAX_BASIS, stale_run=STALE_RUN,
+           reindex=False):
+    """Validates and repairs a merged frame; returns (repaired frame, issue table).
+
+    grid_ms: funding interval in ms; None infers it per symbol (infer_grid).
+    """
+    df = df.assign(fundingTime=pd.to_datetime(df["fundingTime"]))
+    if "symbol" not in df:
+        df["symbol"] = ""
+    df = df.sort_values(["symbol", "fundingTime"], kind="stable")
+    frames, found = [], []
+    for symbol, part in df.groupby("symbol", sort=False):
+        fixed, issues = _repair_symbol(part.reset_index(drop=True), symbol, grid_ms, max_jitter_ms,
+                                       max_basis, stale_run, reindex)
+        frames.append(fixed)
+        found.extend(issues)
+    out = pd.concat(frames, ignore_index=True) if frames else df
+    out = out[[c for c in COLUMNS if c in out]].sort_values(["fundingTime", "symbol"], kind="stable")
+    found = [f for f in found if len(f)]
+    report = pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=ISSUE_COLUMNS)
+    return out.reset_index(drop=True), report
+
+
+def summarize(report):
+    """Issue counts per check and column."""
+    if report.empty:
+        return pd.Series(dtype=np.int64)
+    return report.groupby(["check", "column"]).size()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and repair a merged funding/spot/mark dataset.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--report", default="repair_report.csv")
+    parser.add_argument("--grid-ms", type=int, default=None,
+                        help="funding interval in ms (default: inferred per symbol)")
+    parser.add_argument("--max-jitter-ms", type=int, default=MAX_JITTER_MS)
+    parser.add_argument("--max-basis", type=float, default=MAX_BASIS)
+    parser.add_argument("--stale-run", type=int, default=STALE_RUN)
+    parser.add_argument("--reindex", action="store_true", help="insert NaN rows for missing grid points")
+    args = parser.parse_args(argv)
+
+    df = read_dataset(args.input)
+    fixed, report = repair(df, grid_ms=args.grid_ms, max_jitter_ms=args.max_jitter_ms, max_basis=args.max_basis,
+                           stale_run=args.stale_run, reindex=args.reindex)
+    write_dataset(fixed, args.output)
+    report.to_csv(args.report, index=False)
+    print(summarize(report).to_string())
+    print(f"\n✅ {len(fixed)} filas guardadas en: {args.output} | {len(report)} problemas en: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import abc
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from async_fetch import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    FUNDING_INTERVAL_MS,
+    INTERVAL_MS,
+    MAX_RETRIES,
+    merge_frames,
+    split_windows,
+)
+import metrics
+from dataset_io import fallback_path, write_dataset
+
+# Multi-venue adapters for the fundingTime/symbol/fundingRate/markPrice/spotPrice
+# schema get_data.py produces for Binance COIN-M.
+#
+# A VenueAdapter only knows its venue's URLs, query parameters, payload
+# layout, page size, paging direction and funding interval. MultiVenueFetcher
+# does the rest for every venue the same way: the range is split into
+# windows of one page each (split_windows, as in async_fetch.py), all windows
+# of all series of all venues are requested concurrently over one pooled
+# aiohttp session, and each series is normalized into (time ms, value) rows
+# before the as-of merge. Symbols are stored as "<VENUE>:<symbol>" so several
+# venues can share one dataset (e.g. for portfolio.py).
+#
+# Funding intervals differ per venue and per contract (Binance COIN-M and
+# OKX: 8h, Bybit: per instrument, often 4h or 1h). Rows stay one per funding
+# event with the rate actually paid, which is what the simulations accrue;
+# the interval is used to size the request windows.
+#
+# The `get` coroutine can be replaced: FixtureGet replays JSON responses
+# recorded under a directory (and records them with record=True), so the
+# adapters can be exercised without touching the live APIs.
+
+KLINE_LIMIT = 1000
+
+
+class VenueAdapter(abc.ABC):
+    name = None
+    page_limit = {"funding": 1000, "spot": KLINE_LIMIT, "mark": KLINE_LIMIT}
+    descending = False  # pages are newest-first and are walked backwards
+
+    async def funding_interval_ms(self, get, symbol):
+        return FUNDING_INTERVAL_MS
+
+    @abc.abstractmethod
+    def request(self, kind, symbol, start_ms, end_ms, interval=None):
+        """(url, params) of one page of `kind` in [start_ms, end_ms]."""
+
+    @abc.abstractmethod
+    def parse(self, kind, payload):
+        """Decoded JSON of one page -> list of (time ms, float value)."""
+
+
+class BinanceAdapter(VenueAdapter):
+    """Binance COIN-M (inverse, dapi) or USD-M (linear, fapi) perpetuals."""
+
+    BASES = {"inverse": "https://dapi.binance.com/dapi/v1", "linear": "https://fapi.binance.com/fapi/v1"}
+    SPOT_URL = "https://api.binance.com/api/v3/klines"
+
+    def __init__(self, category="inverse"):
+        self.category = category
+        self.base = self.BASES[category]
+        self.name = "BINANCE" if category == "inverse" else "BINANCE_USDM"
+
+    def request(self, kind, symbol, start_ms, end_ms, interval=None):
+        params = {"symbol": symbol, "startTime": start_ms, "endTime": end_ms, "limit": self.page_limit[kind]}
+        if kind == "funding":
+            return f"{self.base}/fundingRate", params
+        params["interval"] = interval
+        return (self.SPOT_URL if kind == "spot" else f"{self.base}/markPriceKlines"), params
+
+    def parse(self, kind, payload):
+        if kind == "funding":
+            return [(int(r["fundingTime"]), float(r["fundingRate"])) for r in payload]
+        return [(int(r[0]), float(r[4])) for r in payload]
+
+
+class BybitAdapter(VenueAdapter):
+    """Bybit v5 linear (USDT) or inverse (USD) perpetuals."""
+
+    BASE = "https://api.bybit.com/v5/market"
+    INTERVALS = {"1m": "1", "3m": "3", "5m": "5", "15m": "15", "30m": "30", "1h": "60", "2h": "120",
+                 "4h": "240", "6h": "360", "12h": "720", "1d": "D"}
+    page_limit = {"funding": 200, "spot": KLINE_LIMIT, "mark": KLINE_LIMIT}
+    descending = True
+
+    def __init__(self, category="linear"):
+        self.category = category
+        self.name = "BYBIT"
+
+    async def funding_interval_ms(self, get, symbol):
+        payload = await get(f"{self.BASE}/instruments-info", {"category": self.category, "symbol": symbol})
+        items = payload["result"]["list"]
+        return int(items[0]["fundingInterval"]) * 60_000 if items else FUNDING_INTERVAL_MS
+
+    def request(self, kind, symbol, start_ms, end_ms, interval=None):
+        if kind == "funding":
+            return f"{self.BASE}/funding/history", {
+                "category": self.category, "symbol": symbol, "startTime": start_ms, "endTime": end_ms,
+                "limit": self.page_limit[kind]}
+        path = "kline" if kind == "spot" else "mark-price-kline"
+        return f"{self.BASE}/{path}", {
+            "category": "spot" if kind == "spot" else self.category, "symbol": symbol,
+            "interval": self.INTERVALS[interval], "start": start_ms, "end": end_ms, "limit": self.page_limit[kind]}
+
+    def parse(self, kind, payload):
+        if payload.get("retCode", 0) != 0:
+            raise ValueError(f"Bybit error {payload.get('retCode')}: {payload.get('retMsg')}")
+        rows = payload["result"]["list"]
+        if kind == "funding":
+            return [(int(r["fundingRateTimestamp"]), float(r["fundingRate"])) for r in rows]
+        return [(int(r[0]), float(r[4])) for r in rows]
+
+
+class OkxAdapter(VenueAdapter):
+    """OKX v5 perpetual swaps (BTC-USD-SWAP inverse, BTC-USDT-SWAP linear)."""
+
+    BASE = "https://www.okx.com/api/v5"
+    INTERVALS = {"1m": "1m", "3m": "3m", "5m": "5m", "15m": "15m", "30m": "30m", "1h": "1H", "2h": "2H",
+                 "4h": "4H", "6h": "6Hutc", "12h": "12Hutc", "1d": "1Dutc"}
+    page_limit = {"funding": 100, "spot": 100, "mark": 100}
+    descending = True
+
+    def __init__(self):
+        self.name = "OKX"
+
+    def request(self, kind, symbol, start_ms, end_ms, interval=None):
+        # after/before are exclusive bounds: records older than after, newer than before
+        params = {"instId": symbol, "after": end_ms + 1, "before": start_ms - 1, "limit": self.page_limit[kind]}
+        if kind == "funding":
+            return f"{self.BASE}/public/funding-rate-history", params
+        params["bar"] = self.INTERVALS[interval]
+        path = "market/history-candles" if kind == "spot" else "market/history-mark-price-candles"
+        return f"{self.BASE}/{path}", params
+
+    def parse(self, kind, payload):
+        if str(payload.get("code", "0")) != "0":
+            raise ValueError(f"OKX error {payload.get('code')}: {payload.get('msg')}")
+        rows = payload["data"]
+        if kind == "funding":
+            return [(int(r["fundingTime"]), float(r["fundingRate"])) for r in rows]
+        return [(int(r[0]), float(r[4])) for r in rows]
+
+
+ADAPTERS = {
+    "binance": lambda: BinanceAdapter("inverse"),
+    "binance-usdm": lambda: BinanceAdapter("linear"),
+    "bybit": lambda: BybitAdapter("linear"),
+    "bybit-inverse": lambda: BybitAdapter("inverse"),
+    "okx": OkxAdapter,
+}
+
+
+class FixtureGet:
+    """`get` coroutine backed by JSON files, one per (url, params).
+
+    With record=True, missing responses are fetched through `live` and saved;
+    otherwise a missing fixture raises FileNotFoundError naming the request.
+    """
+
+    def __init__(self, root, live=None, record=False):
+        self.root = root
+        self.live = live
+        self.record = record
+
+    def path(self, url, params):
+        key = json.dumps([url, sorted((k, str(v)) for k, v in params.items())])
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest()[:16] + ".json")
+
+    async def __call__(self, url, params):
+        path = self.path(url, params)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)["response"]
+        if not self.record or self.live is None:
+            raise FileNotFoundError(f"No fixture for {url} {params} ({path})")
+        payload = await self.live(url, params)
+        os.makedirs(self.root, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"url": url, "params": params, "response": payload}, f)
+        return payload
+
+
+class MultiVenueFetcher:
+    def __init__(self, concurrency=32, per_host=8, max_retries=MAX_RETRIES, get=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_retries = max_retries
+        self.get = get or self._get
+        self.stats = {"requests": 0, "retries": 0, "rows": 0}
+        self._session = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        # One pool for every venue; limit_per_host keeps one venue from starving the others
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _get(self, url, params):
+        """GET with exponential backoff on 418/429/5xx and network errors."""
+        import aiohttp
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats["requests"] += 1
+                metrics.count("http.requests")
+                async with metrics.stage("http.venue"), self._session.get(url, params=params) as resp:
+                    resp.raise_for_status()
+                    body = await resp.read()
+                    metrics.count("http.bytes", len(body))
+                    return json.loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", None)
+                if status is not None and 400 <= status < 500 and status not in (418, 429):
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                metrics.count("http.retries")
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+                print(f"HTTP Request failed ({e}); retrying {url} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _fetch_window(self, adapter, kind, symbol, start_ms, end_ms, interval):
+        """All rows of one window, paging forward or backward as the venue requires."""
+        rows = []
+        lo, hi = start_ms, end_ms
+        limit = adapter.page_limit[kind]
+        while lo <= hi:
+            url, params = adapter.request(kind, symbol, lo, hi, interval)
+            page = adapter.parse(kind, await self.get(url, params))
+            page = [r for r in page if lo <= r[0] <= hi]
+            rows.extend(page)
+            if len(page) < limit:
+                break
+            times = [t for t, _ in page]
+            if adapter.descending:
+                hi = min(times) - 1
+            else:
+                lo = max(times) + 1
+        return rows
+
+    async def fetch_series(self, adapter, kind, symbol, start_ms, end_ms, step_ms, interval=None):
+        """Normalized (time, value) arrays of one series, sorted and de-duplicated."""
+        windows = split_windows(start_ms, end_ms, step_ms, adapter.page_limit[kind])
+        parts = await asyncio.gather(
+            *(self._fetch_window(adapter, kind, symbol, s, e, interval) for s, e in windows))
+        rows = dict(r for part in parts for r in part)
+        self.stats["rows"] += len(rows)
+        times = np.array(sorted(rows), dtype=np.int64)
+        return times, np.array([rows[t] for t in times.tolist()], dtype=np.float64)
+
+    async def fetch_venue(self, adapter, symbol_perp, symbol_spot, start_ms, end_ms, interval="1h"):
+        """Merged frame of one venue in the common schema."""
+        funding_step = await adapter.funding_interval_ms(self.get, symbol_perp)
+        step = INTERVAL_MS[interval]
+        (ft, fr), (st, sp), (mt, mp) = await asyncio.gather(
+            self.fetch_series(adapter, "funding", symbol_perp, start_ms, end_ms, funding_step),
+            self.fetch_series(adapter, "spot", symbol_spot, start_ms, end_ms, step, interval),
+            self.fetch_series(adapter, "mark", symbol_perp, start_ms, end_ms, step, interval),
+        )
+        df_fund = pd.DataFrame({
+            "fundingTime": pd.to_datetime(ft, unit="ms"),
+            "symbol": f"{adapter.name}:{symbol_perp}",
+            "fundingRate": fr,
+        })
+        df_spot = pd.DataFrame({"spotPrice": sp}, index=pd.to_datetime(st, unit="ms"))
+        mark_df = pd.DataFrame({"markPrice": mp}, index=pd.to_datetime(mt, unit="ms"))
+        return merge_frames(df_fund, df_spot, mark_df)
+
+    async def fetch_all(self, jobs, start_ms, end_ms, interval="1h"):
+        """jobs: (adapter, symbol_perp, symbol_spot) tuples, all fetched concurrently."""
+        frames = await asyncio.gather(
+            *(self.fetch_venue(a, perp, spot, start_ms, end_ms, interval) for a, perp, spot in jobs))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return merge_frames(pd.DataFrame(), None, None)
+        merged = pd.concat(frames, ignore_index=True)
+        return merged.sort_values(["fundingTime", "symbol"], kind="stable").reset_index(drop=True)
+
+
+def parse_job(text):
+    """"venue:perp:spot", e.g. "bybit:BTCUSDT:BTCUSDT" or "okx:BTC-USD-SWAP:BTC-USDT"."""
+    venue, perp, spot = text.split(":")
+    return ADAPTERS[venue](), perp, spot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-venue funding/spot/mark downloader.")
+    parser.add_argument("jobs", nargs="+", help="venue:perp_symbol:spot_symbol, venues: " + ", ".join(ADAPTERS))
+    parser.add_argument("--start", default="2024-01-01 00:00:00")
+    parser.add_argument("--end", default="2024-12-31 23:59:59")
+    parser.add_argument("--interval", default="1h", choices=sorted(BybitAdapter.INTERVALS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--fixtures", default=None, help="replay responses recorded in this directory")
+    parser.add_argument("--record", action="store_true", help="record missing responses into --fixtures")
+    parser.add_argument("--output", default="multi_venue_data.parquet")
+    args = parser.parse_args(argv)
+
+    start_ms = int(pd.Timestamp(args.start).timestamp() * 1000)
+    end_ms = int(pd.Timestamp(args.end).timestamp() * 1000)
+    jobs = [parse_job(j) for j in args.jobs]
+    output = fallback_path(args.output)
+    if output != args.output:
+        print(f"⚠️ pyarrow is not installed (pip install pyarrow): writing {output} instead of {args.output}")
+
+    async def run():
+        async with MultiVenueFetcher(concurrency=args.concurrency) as fetcher:
+            if args.fixtures:
+                fetcher.get = FixtureGet(args.fixtures, live=fetcher._get, record=args.record)
+            merged = await fetcher.fetch_all(jobs, start_ms, end_ms, args.interval)
+        return merged, fetcher.stats
+
+    t0 = time.monotonic()
+    merged, stats = asyncio.run(run())
+    print(f"Fetched {stats['rows']} records in {stats['requests']} requests "
+          f"({stats['retries']} retries) in {time.monotonic() - t0:.1f}s")
+    print(merged.groupby("symbol").size().to_string())
+    write_dataset(merged, output)
+    print(f"\n✅ Saved {len(merged)} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import load_arrays
+from dataset_io import FEATURE_COLUMNS, read_dataset
+from result_cache import result_key
+from sweep import GEMINI_PARAMS, INITIAL_CAPITAL_USD, build_grid, run_one, run_sweep
+
+# Walk-forward study for the simulation_gemini.py thresholds.
+# The funding history is cut into rolling windows of train_events followed by
+# test_events funding events, stepping by test_events. Each train window is
+# swept with sweep.run_sweep and the best parameter set is applied to the
+# next test window. The out-of-sample windows are chained: each one starts
+# flat with the previous window's end equity.
+#
+# Both steps are memoized as JSON files under CACHE_DIR:
+#   walk_forward_cache/train/<key>.json   best params of a train window
+#   walk_forward_cache/test/<key>.json    out-of-sample result of a test window
+# Keys are result_cache.result_key hashes of the window's rows, the grid
+# (train) or the params and starting equity (test), and the code version of
+# this file with every local module it imports (sweep, backtest_engine,
+# kernels, ...). Appending one window of history only sweeps and simulates
+# the new window; editing the strategy or engine code invalidates them all.
+#
+# Example:
+#   python walk_forward.py --train-events 270 --test-events 90 --basis-entry 0.0005:0.003:0.0005
+
+INPUT_FILE = "coinm_full_data_2024_filled.csv"
+OUTPUT_FILE = "walk_forward_results.csv"
+CACHE_DIR = "walk_forward_cache"
+TRAIN_EVENTS = 270  # 90 days of 8h funding events
+TEST_EVENTS = 90  # 30 days
+
+
+def window_bounds(n, train_events=TRAIN_EVENTS, test_events=TEST_EVENTS):
+    """(train_start, test_start, test_end) row offsets of every complete window."""
+    if train_events <= 0 or test_events <= 0:
+        raise ValueError("train_events and test_events must be positive")
+    return [(s, s + train_events, s + train_events + test_events)
+            for s in range(0, n - train_events - test_events + 1, test_events)]
+
+
+def window_key(func, arr, lo, hi, extra):
+    """result_key of func on rows [lo, hi) of the loaded arrays, with a JSON-serializable extra."""
+    arrays = [arr["fundingTime"][lo:hi].astype("datetime64[ms]")]
+    arrays += [arr[col][lo:hi] for col in FEATURE_COLUMNS]
+    return result_key(func, arrays, extra)
+
+
+class WindowCache:
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        self.hits = self.misses = 0
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, f"{key}.json")
+
+    def get(self, kind, key):
+        path = self._path(kind, key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, kind, key, value):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(value, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def _days(times):
+    return (times[-1] - times[0]) / np.timedelta64(1, "D") if len(times) else 0.0
+
+
+def optimize_window(df, arr, lo, hi, grid, cache, workers=None):
+    """Best parameter set on rows [lo, hi), from the cache when possible."""
+    key = window_key(optimize_window, arr, lo, hi, {"grid": grid})
+    best = cache.get("train", key)
+    if best is None:
+        ranked = run_sweep(df.iloc[lo:hi], "gemini", grid, workers=workers)
+        row = ranked.iloc[0]
+        best = {
+            "params": {k: float(row[k]) for k in grid[0]},
+            "train_apy": float(row["apy"]),
+            "train_max_drawdown": float(row["max_drawdown"]),
+        }
+        cache.put("train", key, best)
+    return best
+
+
+def evaluate_window(arr, lo, hi, params, start_cash, cache):
+    """Out-of-sample run of params on rows [lo, hi) starting flat with start_cash."""
+    key = window_key(evaluate_window, arr, lo, hi, {"params": params, "start_cash": start_cash})
+    result = cache.get("test", key)
+    if result is None:
+        rate = arr["fundingRate"][lo:hi]
+        spot = arr["spotPrice"][lo:hi]
+        mark = arr["markPrice"][lo:hi]
+        data = np.vstack([rate, spot, np.where(np.isnan(spot), mark, spot), mark])
+        row = run_one("gemini", params, data, _days(arr["fundingTime"][lo:hi]), start_cash)
+        result = {k: row[k] for k in ("end_cash", "apy", "trades", "max_drawdown")}
+        cache.put("test", key, result)
+    return result
+
+
+def run_walk_forward(df, grid, train_events=TRAIN_EVENTS, test_events=TEST_EVENTS,
+                     initial_cash=INITIAL_CAPITAL_USD, cache=None, workers=None):
+    """Optimizes on every train window and chains the out-of-sample test windows."""
+    df = df.sort_values("fundingTime").reset_index(drop=True)
+    arr = load_arrays(df, fill_spot=False)
+    cache = cache or WindowCache()
+
+    rows = []
+    cash = float(initial_cash)
+    for train_lo, test_lo, test_hi in window_bounds(len(df), train_events, test_events):
+        best = optimize_window(df, arr, train_lo, test_lo, grid, cache, workers)
+        oos = evaluate_window(arr, test_lo, test_hi, best["params"], cash, cache)
+        rows.append({
+            "train_start": arr["fundingTime"][train_lo],
+            "test_start": arr["fundingTime"][test_lo],
+            "test_end": arr["fundingTime"][test_hi - 1],
+            **best["params"],
+            "train_apy": best["train_apy"],
+            "train_max_drawdown": best["train_max_drawdown"],
+            "start_cash": cash,
+            "end_cash": oos["end_cash"],
+            "test_apy": oos["apy"],
+            "test_trades": oos["trades"],
+            "test_max_drawdown": oos["max_drawdown"],
+        })
+        cash = oos["end_cash"]
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the gemini thresholds.")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--train-events", type=int, default=TRAIN_EVENTS)
+    parser.add_argument("--test-events", type=int, default=TEST_EVENTS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--initial-cash", type=float, default=INITIAL_CAPITAL_USD)
+    for name, default in GEMINI_PARAMS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", default=default,
+                            help=f"values as a,b,c or start:stop:step (default {default})")
+    args = parser.parse_args(argv)
+
+    grid = build_grid({k: getattr(args, k) for k in GEMINI_PARAMS})
+    df = read_dataset(args.input, columns=FEATURE_COLUMNS)
+    cache = WindowCache(args.cache_dir)
+    out = run_walk_forward(df, grid, args.train_events, args.test_events,
+                           args.initial_cash, cache, args.workers)
+    out.to_csv(args.output, index=False)
+
+    if out.empty:
+        print("Not enough history for one train + test window.")
+        return
+    print(out.to_string(index=False))
+    days = _days(out[["test_start", "test_end"]].to_numpy().ravel())
+    end_cash = out["end_cash"].iloc[-1]
+    print(f"\nOut-of-sample: ${args.initial_cash:.2f} -> ${end_cash:.2f} over {days:.0f} days "
+          f"| cache hits: {cache.hits}, misses: {cache.misses}")
+    print(f"✅ Walk-forward guardado en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()